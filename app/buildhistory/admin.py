@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from buildhistory.models import Builder, BuildHistory, InstalledFile
+from buildhistory.models import Builder, BuildHistory
 
 
 @admin.register(Builder)
@@ -11,8 +11,3 @@ class Builder(admin.ModelAdmin):
 @admin.register(BuildHistory)
 class BuildHistory(admin.ModelAdmin):
     list_display = ("build_id", "port_name", "builder_name")
-
-
-@admin.register(InstalledFile)
-class BuildHistory(admin.ModelAdmin):
-    list_display = ("build", "file")
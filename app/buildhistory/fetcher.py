@@ -0,0 +1,284 @@
+import datetime
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, zip_longest
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from django.db import transaction, connection
+
+from buildhistory.models import Builder, BuildHistory, LatestBuild, FilePath
+from buildhistory.file_index import refresh_port_files
+from buildhistory.partitions import create_partitions
+from port.ingestion import copy_rows
+import config
+
+
+class RateLimiter:
+    """
+    Spaces the requests of all the threads sharing it at least 1 / rate seconds apart.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            scheduled = max(self.next_time, now)
+            self.next_time = scheduled + self.interval
+        time.sleep(scheduled - now)
+
+
+class BuildbotFetcher:
+    """
+    Fetches the builds of the builders from the Buildbot with a pool of threads sharing a pool of
+    keep-alive connections, and writes them to the database.
+
+    Requests of all the threads are rate limited together. Builds are written in the order of their
+    numbers, each in a transaction with the checkpoint of its builder (Builder.last_fetched_build),
+    so an interrupted run resumes after the last build written. A build which cannot be fetched stops
+    its builder at the build before it, the next run tries it again.
+    """
+
+    def __init__(self, url_prefix=None, workers=None, rate=None, timeout=None, retries=None):
+        self.url_prefix = url_prefix or config.BUILDBOT_URL_PREFIX
+        self.workers = workers or config.BUILDBOT_FETCH_WORKERS
+        self.timeout = timeout or config.BUILDBOT_FETCH_TIMEOUT
+        self.rate_limiter = RateLimiter(config.BUILDBOT_REQUESTS_PER_SECOND if rate is None else rate)
+
+        retries = config.BUILDBOT_FETCH_RETRIES if retries is None else retries
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.workers,
+            max_retries=Retry(total=retries, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_url_json(self, builder_name, build_number):
+        return '{}/json/builders/ports-{}-builder/builds/{}'.format(self.url_prefix, builder_name, build_number)
+
+    def get_url_build(self, builder_name, build_number):
+        return '{}/builders/ports-{}-builder/builds/{}'.format(self.url_prefix, builder_name, build_number)
+
+    def get_files_url(self, builder_name, build_number):
+        return '{}/builders/ports-{}-builder/builds/{}/steps/install-port/logs/files/text'.format(self.url_prefix, builder_name, build_number)
+
+    def get(self, url):
+        # returns the response, or None if the request has failed
+        self.rate_limiter.wait()
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        return response
+
+    def get_data_from_url(self, url):
+        response = self.get(url)
+        if response is None:
+            return {}
+        try:
+            return response.json()
+        except ValueError:
+            return {}
+
+    def get_file_from_url(self, url):
+        # The body is streamed into a temporary file, kept in memory only while it is small, so that
+        # the file lists of large ports waiting to be written do not have to be held in memory.
+        # Returns None if the request has failed.
+        self.rate_limiter.wait()
+        try:
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                if response.status_code != 200:
+                    return None
+                file = tempfile.SpooledTemporaryFile(max_size=config.BUILDBOT_FILES_SPOOL_SIZE)
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    file.write(chunk)
+        except requests.RequestException:
+            return None
+        file.seek(0)
+        return file
+
+    def fetch_build(self, builder_name, build_number):
+        build_data = self.get_data_from_url(self.get_url_json(builder_name, build_number))
+        if not build_data:
+            return None
+        installed_files = self.get_file_from_url(self.get_files_url(builder_name, build_number))
+        return return_summary(builder_name, build_number, build_data, self.get_url_build(builder_name, build_number)), installed_files
+
+    def get_last_build_number(self, builder_name):
+        last_build_data = self.get_data_from_url(self.get_url_json(builder_name, -1))
+        return last_build_data.get('number')
+
+    def get_first_build_number(self, builder, last_build_number):
+        if builder.last_fetched_build is not None:
+            return builder.last_fetched_build + 1
+        # builders fetched before checkpoints were kept continue after their latest build
+        last_build_in_db = BuildHistory.objects.filter(builder_name_id=builder.id).order_by('-build_id').first()
+        if last_build_in_db:
+            return last_build_in_db.build_id + 1
+        return last_build_number - config.BUILDS_FETCHED_COUNT
+
+    def populate(self, builders=None):
+        """
+        Fetches and writes the builds finished since the checkpoint of each builder, returns the number of builds written.
+
+        The builds of the builders are fetched in turns, at most BUILDBOT_FETCH_WINDOW builds ahead of
+        the last one written, which bounds the memory held by fetched builds waiting for their turn.
+        The file index of the ports with a new successful build is refreshed at the end.
+        """
+        builders = list(Builder.objects.all() if builders is None else builders)
+        create_partitions()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # fetch the last build of every builder first in order to figure out its number
+            last_build_numbers = executor.map(self.get_last_build_number, [builder.name for builder in builders])
+
+            build_numbers = []
+            for builder, last_build_number in zip(builders, last_build_numbers):
+                if last_build_number is not None:
+                    # the last build may still be running, it is fetched by the next run
+                    first_build_number = self.get_first_build_number(builder, last_build_number)
+                    build_numbers.append([(builder, number) for number in range(first_build_number, last_build_number)])
+            builds = iter([build for turn in zip_longest(*build_numbers) for build in turn if build is not None])
+
+            stopped = set()
+            window = deque()
+
+            def fill_window():
+                while len(window) < config.BUILDBOT_FETCH_WINDOW:
+                    builder, build_number = next(builds, (None, None))
+                    if builder is None:
+                        return
+                    if builder.id not in stopped:
+                        window.append((builder, build_number, executor.submit(self.fetch_build, builder.name, build_number)))
+
+            written = 0
+            built_ports = set()
+            fill_window()
+            while window:
+                builder, build_number, future = window.popleft()
+                fill_window()
+                if builder.id in stopped:
+                    continue
+                build = future.result()
+                if build is None:
+                    # the builds after it are not written before it has been fetched
+                    stopped.add(builder.id)
+                    continue
+                build = load_build_to_db(builder, build_number, *build)
+                if build.status == 'build successful':
+                    built_ports.add(build.port_name)
+                written += 1
+
+        refresh_port_files(built_ports)
+        return written
+
+
+def get_build_properties(array):
+    properties = {}
+    for prop in array['properties']:
+        properties[prop[0]] = prop[1]
+    return properties
+
+
+def return_summary(builder_name, build_number, build_data, url):
+    data = {}
+
+    properties = get_build_properties(build_data)
+    port_name = properties['portname']
+    status = ' '.join(build_data['text'])
+    time_start = build_data['times'][0]
+    time_build = float(build_data['times'][1]) - float(build_data['times'][0])
+
+    data['name'] = port_name
+    data['url'] = url
+    data['watcher_id'] = properties['triggered_by'].split('/')[6]
+    data['watcher_url'] = properties['triggered_by']
+    data['status'] = status
+    data['builder'] = builder_name
+    data['buildnr'] = build_number
+    data['time_start'] = str(datetime.datetime.fromtimestamp(int(float(time_start)), tz=datetime.timezone.utc))
+    data['buildtime'] = str(
+        datetime.timedelta(seconds=int(float(time_build)))) if time_build != -1 else None
+
+    return data
+
+
+@transaction.atomic
+def load_build_to_db(builder, build_number, data, installed_files):
+    # installed_files is the file list of the build as a binary file, or None if it could not be fetched
+    build = BuildHistory()
+    build.port_name = data['name']
+    build.status = data['status']
+    build.build_id = data['buildnr']
+    build.time_start = data['time_start']
+    build.time_elapsed = data['buildtime']
+    build.builder_name = builder
+    build.watcher_id = data['watcher_id']
+    build.save()
+    LatestBuild.record([build])
+
+    if installed_files is not None:
+        with installed_files:
+            load_files_to_db(build, (line.decode('utf-8') for line in installed_files))
+
+    builder.last_fetched_build = build_number
+    builder.save(update_fields=['last_fetched_build'])
+    return build
+
+
+@transaction.atomic
+def load_files_to_db(build, lines, batch_size=None):
+    """
+    Appends the paths of the lines to the installed files of the build, reading batch_size lines at a time.
+
+    Every batch is copied into a temporary table and its new paths are added to FilePath. Once all the lines
+    are read, the ids of the paths are appended to BuildHistory.file_ids in a single update, inside the database.
+    Line endings and empty lines are dropped. Returns the number of files added.
+    """
+    batch_size = batch_size or config.INSTALLED_FILES_BATCH_SIZE
+    lines = iter(lines)
+    count = 0
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TEMPORARY TABLE IF NOT EXISTS build_files (position integer, path text) ON COMMIT DROP")
+        cursor.execute("TRUNCATE build_files")
+        while True:
+            batch = list(islice(lines, batch_size))
+            if not batch:
+                break
+            paths = [path for path in (line.rstrip('\r\n') for line in batch) if path]
+            if not paths:
+                continue
+
+            copy_rows(cursor, 'build_files', ((str(count + position), path) for position, path in enumerate(paths)))
+            cursor.execute(
+                "INSERT INTO {file_path} (path, basename) SELECT DISTINCT path, regexp_replace(path, '^.*/', '') FROM build_files "
+                "WHERE position >= %s ON CONFLICT (path) DO NOTHING".format(file_path=FilePath._meta.db_table),
+                [count]
+            )
+            count += len(paths)
+
+        if count:
+            # time_start restricts the update to the partition of the build
+            cursor.execute(
+                "UPDATE {builds} SET file_ids = file_ids || ARRAY("
+                "SELECT {file_path}.id FROM build_files JOIN {file_path} ON {file_path}.path = build_files.path "
+                "ORDER BY build_files.position"
+                ") WHERE id = %s AND time_start = %s".format(builds=BuildHistory._meta.db_table, file_path=FilePath._meta.db_table),
+                [build.id, build.time_start]
+            )
+    return count
@@ -0,0 +1,96 @@
+from django.db import connection, transaction
+
+from buildhistory.models import BuildHistory, FilePath, PortFile
+from port.models import Port
+import config
+
+
+EXACT = 'exact'
+PREFIX = 'prefix'
+BASENAME = 'basename'
+MATCH_TYPES = [EXACT, PREFIX, BASENAME]
+
+
+@transaction.atomic
+def refresh_port_files(port_names=None):
+    """
+    Rebuilds the index of the paths installed by the given ports, or by all the ports when port_names is None.
+
+    Every port is indexed with the files of its latest successful build on any builder. Ports without
+    a successful build are left out of the index. Returns the number of rows written.
+    """
+    tables = {
+        'port_file': PortFile._meta.db_table,
+        'port': Port._meta.db_table,
+        'builds': BuildHistory._meta.db_table,
+    }
+    with connection.cursor() as cursor:
+        if port_names is None:
+            cursor.execute("TRUNCATE {port_file}".format(**tables))
+            condition, params = "", []
+        else:
+            names = list({name.upper() for name in port_names})
+            if not names:
+                return 0
+            cursor.execute(
+                "DELETE FROM {port_file} USING {port} "
+                "WHERE {port_file}.port_id = {port}.id AND upper({port}.name) = ANY(%s)".format(**tables),
+                [names]
+            )
+            condition, params = "AND upper(port_name) = ANY(%s)", [names]
+
+        cursor.execute(
+            "INSERT INTO {port_file} (port_id, file_path_id) "
+            "SELECT DISTINCT {port}.id, file_id FROM ("
+            "SELECT DISTINCT ON (upper(port_name)) port_name, file_ids FROM {builds} "
+            "WHERE status = 'build successful' {condition} "
+            "ORDER BY upper(port_name), time_start DESC"
+            ") AS latest "
+            "JOIN {port} ON lower({port}.name) = lower(latest.port_name) "
+            "CROSS JOIN unnest(latest.file_ids) AS file_id".format(condition=condition, **tables),
+            params
+        )
+        return cursor.rowcount
+
+
+def _filter_paths(queryset, query, match):
+    # the paths of a queryset of FilePath matching the query, `match` is one of MATCH_TYPES
+    if match == EXACT:
+        return queryset.filter(path=query)
+    if match == PREFIX:
+        return queryset.filter(path__startswith=query)
+    if match == BASENAME:
+        return queryset.filter(basename=query)
+    raise ValueError("Unknown match type: {}".format(match))
+
+
+def lookup(query, match=EXACT, limit=None):
+    """
+    Returns the indexed paths matching the query with the names of the ports installing them, sorted by path.
+
+    `match` is one of:
+    - exact: the path is the query
+    - prefix: the path starts with the query, e.g. /opt/local/bin/
+    - basename: the last component of the path is the query, e.g. python3
+    """
+    limit = limit or config.FILE_LOOKUP_LIMIT
+
+    paths = _filter_paths(FilePath.objects.all(), query, match)
+    # only the paths installed by a port at present
+    paths = paths.filter(id__in=PortFile.objects.values('file_path_id')).order_by('path')[:limit]
+    paths = dict(paths.values_list('id', 'path'))
+
+    ports = {}
+    for file_path_id, name in PortFile.objects.filter(file_path_id__in=paths.keys()).values_list('file_path_id', 'port__name'):
+        ports.setdefault(file_path_id, []).append(name)
+
+    return [
+        {'path': path, 'ports': sorted(ports[file_path_id], key=str.lower)}
+        for file_path_id, path in sorted(paths.items(), key=lambda item: item[1])
+    ]
+
+
+def get_port_ids(query, match=EXACT):
+    # ids of the ports installing a path matching the query, `match` is one of MATCH_TYPES as for lookup
+    file_paths = _filter_paths(FilePath.objects.all(), query, match)
+    return PortFile.objects.filter(file_path_id__in=file_paths.values('id')).values_list('port_id', flat=True).distinct()
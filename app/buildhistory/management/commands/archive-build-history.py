@@ -0,0 +1,36 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from buildhistory import partitions
+import config
+
+
+class Command(BaseCommand):
+
+    help = "Moves the monthly partitions of the build history older than the retention period into compressed archive files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months',
+                            type=int,
+                            default=config.BUILDS_RETENTION_MONTHS,
+                            help="Number of months of builds kept in the database, the current month included.")
+        parser.add_argument('--before',
+                            type=datetime.date.fromisoformat,
+                            help="Archive the months ending on or before this date (YYYY-MM-DD) instead.")
+        parser.add_argument('--directory',
+                            default=config.BUILDS_ARCHIVE_DIR,
+                            help="Directory the archive files are written to.")
+
+    def handle(self, *args, **options):
+        # the partitions of the coming months are created along the way
+        for name in partitions.create_partitions():
+            self.stdout.write("Created partition {}".format(name))
+
+        before = options['before']
+        if before is None:
+            this_month = partitions.get_month(datetime.datetime.now(tz=datetime.timezone.utc))
+            before = partitions.add_months(this_month, 1 - options['months'])
+
+        for path in partitions.archive_partitions(before, options['directory']):
+            self.stdout.write("Archived {}".format(path))
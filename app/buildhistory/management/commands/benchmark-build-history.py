@@ -0,0 +1,62 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from parsing_scripts.benchmark_build_history import run_benchmark, compare_configurations
+
+
+class Command(BaseCommand):
+
+    help = "Benchmarks build submissions and the read paths of the build history with the previous and the current index sets, in a separate test database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--builds',
+                            type=int,
+                            default=100000,
+                            help="Number of synthetic builds submitted.")
+        parser.add_argument('--ports',
+                            type=int,
+                            default=5000,
+                            help="Number of synthetic ports the builds are spread over.")
+        parser.add_argument('--batch-size',
+                            type=int,
+                            default=500,
+                            help="Number of builds per submission.")
+        parser.add_argument('--repeat',
+                            type=int,
+                            default=5,
+                            help="Number of times every read path is requested.")
+        parser.add_argument('--seed',
+                            type=int,
+                            default=0,
+                            help="Seed of the generator of the synthetic builds.")
+        parser.add_argument('--output',
+                            type=str,
+                            help="Path of the JSON report, printed if not given.")
+        parser.add_argument('--noinput', '--no-input',
+                            action='store_false',
+                            dest='interactive',
+                            help="Do not prompt before destroying an existing test database.")
+
+    def handle(self, *args, **options):
+        # the benchmark empties the builds table, it never runs against the configured database
+        old_database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=not options['interactive'])
+        try:
+            report = run_benchmark(options['builds'], options['ports'], options['seed'], options['batch_size'], options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        for name, key, old_value, value, change in compare_configurations(report):
+            self.stdout.write("{}, {}: {} -> {} ({:+.1%})".format(name, key, old_value, value, change))
+        for name, configuration in report['configurations'].items():
+            for path, queries in configuration['unindexed_queries'].items():
+                if queries:
+                    self.stdout.write("{} indexes do not serve {} queries of {}".format(name, len(queries), path))
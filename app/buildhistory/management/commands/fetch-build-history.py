@@ -1,11 +1,23 @@
 from django.core.management.base import BaseCommand
 
 from buildhistory.models import BuildHistory
+import config
 
 
 class Command(BaseCommand):
 
     help = "Fetches the build history from the Buildbot for each builder"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers',
+                            type=int,
+                            default=config.BUILDBOT_FETCH_WORKERS,
+                            help="Number of builds fetched at the same time.")
+        parser.add_argument('--rate',
+                            type=float,
+                            default=config.BUILDBOT_REQUESTS_PER_SECOND,
+                            help="Maximum number of requests per second sent to the Buildbot.")
+
     def handle(self, *args, **options):
-        BuildHistory.populate()
+        count = BuildHistory.populate(workers=options['workers'], rate=options['rate'])
+        self.stdout.write("Fetched {} builds".format(count))
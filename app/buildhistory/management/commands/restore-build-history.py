@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from buildhistory import partitions
+
+
+class Command(BaseCommand):
+
+    help = "Imports archive files written by archive-build-history back into the build history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('files',
+                            nargs='+',
+                            help="Archive files to import, e.g. builds_y2019m03.csv.gz")
+
+    def handle(self, *args, **options):
+        for path in options['files']:
+            count = partitions.restore_archive(path)
+            self.stdout.write("Imported {} builds from {}".format(count, path))
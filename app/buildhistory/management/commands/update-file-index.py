@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from buildhistory.file_index import refresh_port_files
+
+
+class Command(BaseCommand):
+
+    help = "Rebuilds the index of the files installed by the latest successful build of each port"
+
+    def add_arguments(self, parser):
+        parser.add_argument('ports',
+                            nargs='*',
+                            help="Names of the ports to index again, all the ports if none is given.")
+
+    def handle(self, *args, **options):
+        count = refresh_port_files(options['ports'] or None)
+        self.stdout.write("Indexed {} files".format(count))
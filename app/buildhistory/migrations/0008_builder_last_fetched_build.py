@@ -0,0 +1,18 @@
+# Generated by Django 3.0.9 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildhistory', '0007_auto_20200806_1757'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='builder',
+            name='last_fetched_build',
+            field=models.IntegerField(null=True, verbose_name='Number of the build up to which the builds have been fetched'),
+        ),
+    ]
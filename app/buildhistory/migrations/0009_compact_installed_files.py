@@ -0,0 +1,53 @@
+# Generated by Django 3.0.9 on 2026-10-18 10:43
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildhistory', '0008_builder_last_fetched_build'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilePath',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.TextField(unique=True)),
+            ],
+            options={
+                'verbose_name': 'File path',
+                'verbose_name_plural': 'File paths',
+                'db_table': 'file_path',
+            },
+        ),
+        migrations.AddField(
+            model_name='buildhistory',
+            name='file_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None, verbose_name='Ids of the FilePath of the installed files, in their order'),
+        ),
+        # the paths of the existing rows are interned and every build gets the ids of its files, in the order
+        # of the rows, before the table of rows is dropped
+        migrations.RunSQL(
+            sql=[
+                "INSERT INTO file_path (path) "
+                "SELECT DISTINCT rtrim(file, E'\\r\\n') FROM installed_files WHERE rtrim(file, E'\\r\\n') <> '' "
+                "ON CONFLICT (path) DO NOTHING",
+                "UPDATE builds SET file_ids = files.ids FROM ("
+                "SELECT installed_files.build_id, array_agg(file_path.id ORDER BY installed_files.id) AS ids "
+                "FROM installed_files JOIN file_path ON file_path.path = rtrim(installed_files.file, E'\\r\\n') "
+                "GROUP BY installed_files.build_id"
+                ") AS files WHERE builds.id = files.build_id",
+            ],
+            reverse_sql=[
+                "INSERT INTO installed_files (build_id, file) "
+                "SELECT builds.id, file_path.path FROM builds, unnest(builds.file_ids) WITH ORDINALITY AS files(id, position) "
+                "JOIN file_path ON file_path.id = files.id ORDER BY builds.id, files.position",
+            ],
+        ),
+        migrations.DeleteModel(
+            name='InstalledFile',
+        ),
+    ]
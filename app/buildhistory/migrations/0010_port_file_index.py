@@ -0,0 +1,57 @@
+# Generated by Django 3.0.9 on 2026-10-18 11:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('port', '0013_dependencygraphchange'),
+        ('buildhistory', '0009_compact_installed_files'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'Port file',
+                'verbose_name_plural': 'Port files',
+                'db_table': 'port_file',
+            },
+        ),
+        migrations.AddField(
+            model_name='filepath',
+            name='basename',
+            field=models.TextField(db_index=True, default='', verbose_name='Last component of the path'),
+        ),
+        migrations.RunSQL(
+            sql="UPDATE file_path SET basename = regexp_replace(path, '^.*/', '')",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='filepath',
+            index=models.Index(fields=['path'], name='file_path_prefix', opclasses=['text_pattern_ops']),
+        ),
+        migrations.AddField(
+            model_name='portfile',
+            name='file_path',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='buildhistory.FilePath'),
+        ),
+        migrations.AddField(
+            model_name='portfile',
+            name='port',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='port.Port'),
+        ),
+        migrations.AddIndex(
+            model_name='portfile',
+            index=models.Index(fields=['port'], name='port_file_port_id_d4ee2b_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='portfile',
+            unique_together={('file_path', 'port')},
+        ),
+    ]
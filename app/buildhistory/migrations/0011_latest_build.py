@@ -0,0 +1,41 @@
+# Generated by Django 3.0.9 on 2026-10-18 11:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildhistory', '0010_port_file_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestBuild',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('port_name', models.CharField(max_length=100)),
+                ('build_number', models.IntegerField(verbose_name='Number of the build on its builder')),
+                ('status', models.CharField(max_length=50)),
+                ('time_start', models.DateTimeField()),
+                ('build', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='buildhistory.BuildHistory')),
+                ('builder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='buildhistory.Builder')),
+            ],
+            options={
+                'verbose_name': 'Latest build',
+                'verbose_name_plural': 'Latest builds',
+                'db_table': 'latest_build',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='latestbuild',
+            unique_together={('port_name', 'builder')},
+        ),
+        migrations.RunSQL(
+            sql="INSERT INTO latest_build (port_name, builder_id, build_id, build_number, status, time_start) "
+                "SELECT DISTINCT ON (port_name, builder_name_id) port_name, builder_name_id, id, build_id, status, time_start "
+                "FROM builds ORDER BY port_name, builder_name_id, build_id DESC",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
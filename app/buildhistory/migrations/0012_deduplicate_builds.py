@@ -0,0 +1,36 @@
+# Generated by Django 3.0.9 on 2026-10-18 11:16
+
+from django.db import migrations
+
+
+# Builds written more than once share their builder, number and start time, the one written last is
+# kept and latest_build is pointed at it. The rows deleted are copies of a row which is kept under the
+# unique key added next, hence the migration is reversed without restoring them.
+DUPLICATE = (
+    "newer.builder_name_id = old.builder_name_id AND newer.build_id = old.build_id "
+    "AND newer.time_start = old.time_start AND newer.id > old.id"
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildhistory', '0011_latest_build'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                "CREATE TEMPORARY TABLE duplicate_builds ON COMMIT DROP AS "
+                "SELECT old.id, old.builder_name_id, old.build_id, old.time_start FROM builds AS old "
+                "WHERE EXISTS (SELECT 1 FROM builds AS newer WHERE {})".format(DUPLICATE),
+                "UPDATE latest_build SET build_id = newest.id FROM duplicate_builds AS old, builds AS newest "
+                "WHERE latest_build.build_id = old.id "
+                "AND newest.builder_name_id = old.builder_name_id AND newest.build_id = old.build_id "
+                "AND newest.time_start = old.time_start "
+                "AND newest.id NOT IN (SELECT id FROM duplicate_builds)",
+                "DELETE FROM builds WHERE id IN (SELECT id FROM duplicate_builds)",
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.0.9 on 2026-10-18 11:16
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildhistory', '0012_deduplicate_builds'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='buildhistory',
+            unique_together={('builder_name', 'build_id', 'time_start')},
+        ),
+    ]
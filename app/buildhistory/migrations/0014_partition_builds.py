@@ -0,0 +1,91 @@
+# Generated by Django 3.0.9 on 2026-10-18 11:20
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# monthly partitions are created for the months of the existing builds and up to two months ahead,
+# later ones are created by buildhistory.partitions.create_partitions
+PARTITIONS_AHEAD = 2
+
+
+def add_months(month, count):
+    months = month.year * 12 + month.month - 1 + count
+    return datetime.date(months // 12, months % 12 + 1, 1)
+
+
+def rebuild_builds_table(cursor, partitioned):
+    # The table is created again, as an existing table cannot be turned into a partitioned table or back.
+    # Its constraints and indexes are dropped from the old table and created again on the new one.
+    cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+    cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = 'builds'::regclass AND contype <> 'p'")
+    constraints = cursor.fetchall()
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'builds' "
+        "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = 'builds'::regclass)"
+    )
+    indexes = cursor.fetchall()
+    cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = 'builds'::regclass AND contype = 'p'")
+    primary_key, = cursor.fetchone()
+    cursor.execute("SELECT pg_get_serial_sequence('builds', 'id')")
+    sequence, = cursor.fetchone()
+
+    cursor.execute("ALTER TABLE builds RENAME TO builds_old")
+    for name, definition in constraints + [(primary_key, None)]:
+        cursor.execute('ALTER TABLE builds_old DROP CONSTRAINT "{}"'.format(name))
+    for name, definition in indexes:
+        cursor.execute('DROP INDEX "{}"'.format(name))
+
+    if partitioned:
+        cursor.execute("CREATE TABLE builds (LIKE builds_old INCLUDING DEFAULTS) PARTITION BY RANGE (time_start)")
+        cursor.execute("CREATE TABLE builds_default PARTITION OF builds DEFAULT")
+        cursor.execute("SELECT DISTINCT date_trunc('month', time_start AT TIME ZONE 'UTC')::date FROM builds_old")
+        months = {month for month, in cursor.fetchall()}
+        this_month = datetime.datetime.now(tz=datetime.timezone.utc).date().replace(day=1)
+        months.update(add_months(this_month, count) for count in range(PARTITIONS_AHEAD + 1))
+        for month in sorted(months):
+            cursor.execute("CREATE TABLE builds_y{:04d}m{:02d} PARTITION OF builds FOR VALUES FROM (%s) TO (%s)".format(month.year, month.month), [
+                '{:%Y-%m-%d} 00:00:00+00'.format(month), '{:%Y-%m-%d} 00:00:00+00'.format(add_months(month, 1))
+            ])
+        primary_key_columns = "id, time_start"
+    else:
+        cursor.execute("CREATE TABLE builds (LIKE builds_old INCLUDING DEFAULTS)")
+        primary_key_columns = "id"
+
+    cursor.execute("ALTER SEQUENCE {} OWNED BY builds.id".format(sequence))
+    cursor.execute("INSERT INTO builds SELECT * FROM builds_old")
+    cursor.execute("DROP TABLE builds_old")
+
+    cursor.execute('ALTER TABLE builds ADD CONSTRAINT "{}" PRIMARY KEY ({})'.format(primary_key, primary_key_columns))
+    for name, definition in constraints:
+        cursor.execute('ALTER TABLE builds ADD CONSTRAINT "{}" {}'.format(name, definition))
+    for name, definition in indexes:
+        cursor.execute(definition)
+
+
+def partition_builds(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        rebuild_builds_table(cursor, partitioned=True)
+
+
+def unpartition_builds(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        rebuild_builds_table(cursor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildhistory', '0013_unique_build_number'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='latestbuild',
+            name='build',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='buildhistory.BuildHistory'),
+        ),
+        migrations.RunPython(partition_builds, unpartition_builds),
+    ]
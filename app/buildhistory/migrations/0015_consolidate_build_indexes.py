@@ -0,0 +1,64 @@
+# Generated by Django 3.0.9 on 2026-10-18 11:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildhistory', '0014_partition_builds'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='buildhistory',
+            name='builds_port_na_690929_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='buildhistory',
+            name='builds_port_na_a30f18_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='buildhistory',
+            name='builds_port_na_a1a05a_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='buildhistory',
+            name='builds_port_na_9b04f4_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='buildhistory',
+            name='builds_port_na_f9cad8_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='buildhistory',
+            name='builds_status_e27daf_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='buildhistory',
+            name='builds_builder_5931b0_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='buildhistory',
+            name='builds_port_na_8769b9_idx',
+        ),
+        migrations.AlterField(
+            model_name='buildhistory',
+            name='builder_name',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='builds', to='buildhistory.Builder'),
+        ),
+        migrations.AddIndex(
+            model_name='buildhistory',
+            index=models.Index(fields=['port_name', '-time_start'], name='builds_port_na_5d55ec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='buildhistory',
+            index=models.Index(fields=['status', '-time_start'], name='builds_status_90ce3f_idx'),
+        ),
+        # serves the case-insensitive lookups of the builds of a port (port_name__iexact), newest first
+        migrations.RunSQL(
+            sql="CREATE INDEX builds_port_name_upper_idx ON builds (UPPER(port_name::text), time_start DESC)",
+            reverse_sql="DROP INDEX builds_port_name_upper_idx",
+        ),
+    ]
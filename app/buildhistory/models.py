@@ -1,24 +1,44 @@
-import urllib.request
-import ssl
-import json
 import datetime
 
-from django.db import models, transaction
-from django.contrib.postgres.fields import JSONField
+from django.db import models, transaction, connection, IntegrityError
+from django.contrib.postgres.fields import ArrayField, JSONField
 
-from config import BUILDERS_JSON_URL, BUILDBOT_URL_PREFIX, BUILDS_FETCHED_COUNT
 from port.database import StringToArray
 
 
+# buildhistory.fetcher imports this module, the methods using it import it in turn
+
+
 class BuilderModelManager(models.Manager):
+    # ids of the builders by their names, builders are not renamed once created
+    ids_cache = {}
+
     def get_queryset(self):
         return super(BuilderModelManager, self).get_queryset().annotate(version_array=StringToArray('name'),).order_by('-version_array')
 
+    def get_ids(self, names):
+        """
+        Returns a dict of the ids of the builders with the given names, creating the missing builders.
+
+        The ids are cached by the process, the database is only queried for names not seen before.
+        """
+        missing = set(names) - self.ids_cache.keys()
+        if missing:
+            found = dict(self.get_queryset().filter(name__in=missing).values_list('name', 'id'))
+            for name in missing - found.keys():
+                found[name] = self.get_or_create(name=name)[0].id
+            self.ids_cache.update(found)
+        return {name: self.ids_cache[name] for name in names}
+
+    def clear_ids_cache(self):
+        self.ids_cache.clear()
+
 
 class Builder(models.Model):
     name = models.CharField(max_length=100, db_index=True, verbose_name="Name of the builder as per Buildbot")
     display_name = models.CharField(max_length=20, db_index=True, default='', verbose_name="Simplified builder name: 10.XX")
     natural_name = models.CharField(max_length=50, default='', verbose_name="Name of the MacOS version, e.g. Catalina")
+    last_fetched_build = models.IntegerField(null=True, verbose_name="Number of the build up to which the builds have been fetched")
 
     def __str__(self):
         return "%s" % self.name
@@ -32,7 +52,8 @@ class Builder(models.Model):
 
 
 class BuildHistory(models.Model):
-    builder_name = models.ForeignKey(Builder, on_delete=models.CASCADE, related_name='builds')
+    # the unique (builder_name, build_id, time_start) index serves the lookups by builder
+    builder_name = models.ForeignKey(Builder, on_delete=models.CASCADE, related_name='builds', db_index=False)
     build_id = models.IntegerField()
     status = models.CharField(max_length=50)
     port_name = models.CharField(max_length=100)
@@ -41,193 +62,222 @@ class BuildHistory(models.Model):
     time_start = models.DateTimeField()
     time_elapsed = models.DurationField(null=True)
     watcher_id = models.IntegerField()
+    file_ids = ArrayField(models.IntegerField(), default=list, verbose_name="Ids of the FilePath of the installed files, in their order")
 
     class Meta:
         db_table = "builds"
         verbose_name = "Build"
         verbose_name_plural = "Builds"
+        # builds pushed again by buildbot2 are updated in place, the table is partitioned by the month of
+        # time_start (see buildhistory/partitions.py) and its unique constraints have to include it
+        unique_together = [['builder_name', 'build_id', 'time_start']]
+        # The builds of a port are looked up case-insensitively through an index on
+        # (UPPER(port_name), time_start DESC), created by migration 0015 as Django cannot declare it here.
+        # See parsing_scripts/benchmark_build_history.py for the read paths served by each index.
         indexes = [
-            models.Index(fields=['port_name', 'builder_name', '-build_id']),
-            models.Index(fields=['port_name', 'builder_name', '-time_start']),
-            models.Index(fields=['port_name', 'status', 'builder_name']),
-            models.Index(fields=['port_name', 'builder_name']),
-            models.Index(fields=['port_name', 'status']),
-            models.Index(fields=['-time_start']),
-            models.Index(fields=['port_name']),
-            models.Index(fields=['status']),
-            models.Index(fields=['builder_name'])
+            models.Index(fields=['port_name', '-time_start']),
+            models.Index(fields=['status', '-time_start']),
+            models.Index(fields=['-time_start'])
         ]
 
     @classmethod
-    def populate(cls):
-        url_prefix = BUILDBOT_URL_PREFIX
-
-        def get_url_json(builder_name, build_number):
-            return '{}/json/builders/ports-{}-builder/builds/{}'.format(url_prefix, builder_name, build_number)
-
-        def get_url_build(builder_name, build_number):
-            return '{}/builders/ports-{}-builder/builds/{}'.format(url_prefix, builder_name, build_number)
-
-        def get_files_url(builder_name, build_number):
-            return '{}/builders/ports-{}-builder/builds/{}/steps/install-port/logs/files/text'.format(url_prefix, builder_name, build_number)
-
-        def get_data_from_url(url):
-            gcontext = ssl.SSLContext()
-            try:
-                with urllib.request.urlopen(url, context=gcontext) as u:
-                    data = json.loads(u.read().decode())
-                return data
-            except urllib.error.URLError:
-                return {}
-
-        def get_text_from_url(url):
-            gcontext = ssl.SSLContext()
-            try:
-                lines = urllib.request.urlopen(url, context=gcontext)
-                return lines
-            except urllib.error.URLError:
-                return []
-
-        def get_build_properties(array):
-            properties = {}
-            for prop in array['properties']:
-                properties[prop[0]] = prop[1]
-            return properties
-
-        def return_summary(builder_name, build_number, build_data):
-            data = {}
-
-            properties = get_build_properties(build_data)
-            port_name = properties['portname']
-            status = ' '.join(build_data['text'])
-            time_start = build_data['times'][0]
-            time_build = float(build_data['times'][1]) - float(build_data['times'][0])
-
-            data['name'] = port_name
-            data['url'] = get_url_build(builder_name, build_number)
-            data['watcher_id'] = properties['triggered_by'].split('/')[6]
-            data['watcher_url'] = properties['triggered_by']
-            data['status'] = status
-            data['builder'] = builder_name
-            data['buildnr'] = build_number
-            data['time_start'] = str(datetime.datetime.fromtimestamp(int(float(time_start)), tz=datetime.timezone.utc))
-            data['buildtime'] = str(
-                datetime.timedelta(seconds=int(float(time_build)))) if time_build != -1 else None
-
-            return data
-
-        def load_build_to_db(builder_obj, data):
-            build = BuildHistory()
-            build.port_name = data['name']
-            build.status = data['status']
-            build.build_id = data['buildnr']
-            build.time_start = data['time_start']
-            build.time_elapsed = data['buildtime']
-            build.builder_name = builder_obj
-            build.build_url = data['url']
-            build.watcher_url = data['watcher_url']
-            build.watcher_id = data['watcher_id']
-            build.save()
-            return build
-
-        @transaction.atomic()
-        def load_files_to_db(build_obj, lines):
-            for line in lines:
-                decoded_line = line.decode("utf-8")
-                file_obj = InstalledFile()
-                file_obj.build = build_obj
-                file_obj.file = decoded_line
-                file_obj.save()
-
-        for builder in Builder.objects.all():
-            buildername = builder.name
-            # fetch the last build first in order to figure out its number
-            last_build_data = get_data_from_url(get_url_json(builder.name, -1))
-            if not last_build_data:
-                continue
-            last_build_number = last_build_data['number']
-            last_build_in_db = BuildHistory.objects.filter(builder_name_id=builder.id).order_by('-build_id').first()
-            if last_build_in_db:
-                build_in_database = last_build_in_db.build_id + 1
-            else:
-                build_in_database = last_build_number - BUILDS_FETCHED_COUNT
-
-            for build_number in range(build_in_database, last_build_number):
-                build_data = get_data_from_url(get_url_json(buildername, build_number))
-                installed_files = get_text_from_url(get_files_url(buildername, build_number))
-                if not build_data:
-                    break
-                build_data_summary = return_summary(buildername, build_number, build_data)
-                build_obj = load_build_to_db(builder, build_data_summary)
-                load_files_to_db(build_obj, installed_files)
+    def populate(cls, workers=None, rate=None):
+        from buildhistory.fetcher import BuildbotFetcher
+        return BuildbotFetcher(workers=workers, rate=rate).populate()
+
+    def get_files(self):
+        # paths of the installed files in the order they have been received, read with a single query
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT file_path.path FROM unnest(%s::int[]) WITH ORDINALITY AS files(id, position) "
+                "JOIN file_path ON file_path.id = files.id ORDER BY files.position",
+                [self.file_ids]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def set_files(self, paths):
+        from buildhistory.fetcher import load_files_to_db
+        # load_files_to_db appends to the ids stored, the partition of the build is selected by its start time
+        type(self).objects.filter(pk=self.pk, time_start=self.time_start).update(file_ids=[])
+        load_files_to_db(self, paths)
+        self.refresh_from_db(fields=['file_ids'])
 
     @classmethod
     def buildbot2_parse(cls, build_object):
-        properties_key = 'properties'
-
-        def get_state():
-            key = 'state_string'
-            if build_object.get(key):
-                return build_object[key]
-
-            return "unknown"
-
-        def get_port_info(obj):
-            port_version = obj.get('portversion', [None])[0]
-            port_revision = obj.get('portrevision', [None])[0]
-
-            return port_version, port_revision
-
-        def get_build_times():
-            time_start = str(datetime.datetime.fromtimestamp(int(float(build_object['started_at'])), tz=datetime.timezone.utc))
-            time_build_seconds = None
-            if build_object.get('complete') is True:
-                time_build_seconds = float(build_object['complete_at']) - float(build_object['started_at'])
-
-            time_build = None
-            if time_build_seconds:
-                time_build = str(datetime.timedelta(seconds=int(float(time_build_seconds))))
-
-            return [time_start, time_build]
+        # returns the build written, or None if the build object is invalid
+        result = cls.buildbot2_upsert([build_object])[0]
+        return result[0] if result else None
 
-        # First try to get those fields which are essential for any build
-        # If the process of getting these fields fails, abort
+    @classmethod
+    def buildbot2_upsert(cls, build_objects):
+        """
+        Writes the builds pushed by buildbot2, updating those written before, and records them as the latest builds.
+
+        All the builds are written with a single INSERT ... ON CONFLICT, the builders are resolved from the cache
+        of Builder.objects.get_ids. Returns a list with an item for every build object: None if it is invalid,
+        otherwise a tuple of the BuildHistory written and whether it has been created.
+        """
+        parsed = [parse_buildbot2_build(build_object) for build_object in build_objects]
+        valid = [fields for fields in parsed if fields is not None]
+        if not valid:
+            return [None] * len(parsed)
+
+        builder_names = {fields['builder_name'] for fields in valid}
         try:
-            build_id = build_object['buildid']
-            builder_name = build_object[properties_key]['workername'][0]
-            builder_name = builder_name.replace("ports-", "")
-            port_name = build_object[properties_key]['portname'][0]
-
-        except (KeyError, TypeError, IndexError, ValueError):
-            # invalid build object, cannot proceed
-            return None
+            return cls.buildbot2_write(parsed, Builder.objects.get_ids(builder_names))
+        except IntegrityError:
+            # a cached builder has been deleted since, the builders are looked up again
+            Builder.objects.clear_ids_cache()
+            return cls.buildbot2_write(parsed, Builder.objects.get_ids(builder_names))
 
-        builder, builder_created = Builder.objects.get_or_create(name=builder_name)
-        build, builder_created = BuildHistory.objects.get_or_create(
-            builder_name_id=builder.id,
-            build_id=build_id,
-            port_name=port_name,
-            time_start=get_build_times()[0],
-            watcher_id=build_object.get('builderid', 0)
-        )
+    @classmethod
+    def buildbot2_write(cls, parsed, builder_ids):
+        # a build pushed more than once in a batch is written once, as pushed last, builds are told
+        # apart by the key of the conflict: their builder, number and start time
+        builds = {}
+        keys = []
+        for fields in parsed:
+            if fields is None:
+                keys.append(None)
+                continue
+            fields = dict(fields)
+            build = cls(builder_name_id=builder_ids[fields.pop('builder_name')], file_ids=[], **fields)
+            key = (build.builder_name_id, build.build_id, build.time_start)
+            builds[key] = build
+            keys.append(key)
+
+        columns = ['builder_name_id', 'build_id', 'port_name', 'status', 'port_version', 'port_revision', 'time_start', 'time_elapsed', 'watcher_id']
+        params = []
+        for build in builds.values():
+            params.extend(getattr(build, column) for column in columns)
+        with transaction.atomic(), connection.cursor() as cursor:
+            # the outer query sees the table as it was before the insert, which tells the created builds apart
+            cursor.execute(
+                "WITH written AS ("
+                "INSERT INTO {table} ({columns}, file_ids) VALUES {values} "
+                "ON CONFLICT (builder_name_id, build_id, time_start) DO UPDATE SET {updates} "
+                "RETURNING id, builder_name_id, build_id, time_start"
+                ") SELECT id, builder_name_id, build_id, time_start, NOT EXISTS (SELECT 1 FROM {table} WHERE {table}.id = written.id) "
+                "FROM written".format(
+                    table=cls._meta.db_table,
+                    columns=", ".join(columns),
+                    values=", ".join(["({}, '{{}}')".format(", ".join(["%s"] * len(columns)))] * len(builds)),
+                    updates=", ".join("{0} = EXCLUDED.{0}".format(column) for column in columns[2:] if column != 'time_start')
+                ),
+                params
+            )
+            created = {}
+            for build_id, builder_id, number, time_start, inserted in cursor.fetchall():
+                builds[builder_id, number, time_start].id = build_id
+                created[builder_id, number, time_start] = inserted
+            LatestBuild.record(builds.values())
+
+        return [None if key is None else (builds[key], created[key]) for key in keys]
+
+
+def parse_buildbot2_build(build_object):
+    """
+    Returns the fields of the BuildHistory of a build object pushed by buildbot2, with the name of its builder
+    as builder_name, or None if the build object is invalid.
+    """
+    try:
+        properties = build_object['properties']
+        started_at = float(build_object['started_at'])
+        fields = {
+            'build_id': int(build_object['buildid']),
+            'builder_name': properties['workername'][0].replace("ports-", ""),
+            'port_name': properties['portname'][0],
+            'status': build_object.get('state_string') or "unknown",
+            'port_version': properties.get('portversion', [None])[0],
+            'port_revision': properties.get('portrevision', [None])[0],
+            'time_start': datetime.datetime.fromtimestamp(int(started_at), tz=datetime.timezone.utc),
+            'time_elapsed': None,
+            'watcher_id': build_object.get('builderid', 0),
+        }
+        if build_object.get('complete') is True:
+            seconds = int(float(build_object['complete_at']) - started_at)
+            if seconds:
+                fields['time_elapsed'] = datetime.timedelta(seconds=seconds)
+    except (KeyError, TypeError, IndexError, ValueError, AttributeError, OverflowError, OSError):
+        # invalid build object, cannot proceed
+        return None
+    return fields
+
+
+class LatestBuild(models.Model):
+    # the latest build of every port on every builder, kept up to date as the builds are written
+    port_name = models.CharField(max_length=100)
+    builder = models.ForeignKey(Builder, on_delete=models.CASCADE, related_name='+')
+    # partitions of the builds are archived, hence no constraint: the fields of the build are kept here
+    build = models.ForeignKey(BuildHistory, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    build_number = models.IntegerField(verbose_name="Number of the build on its builder")
+    status = models.CharField(max_length=50)
+    time_start = models.DateTimeField()
 
-        build.status = get_state()
-        build.port_version, build.port_revision = get_port_info(build_object[properties_key])
-        build.time_elapsed = get_build_times()[1]
+    class Meta:
+        db_table = "latest_build"
+        verbose_name = "Latest build"
+        verbose_name_plural = "Latest builds"
+        unique_together = [['port_name', 'builder']]
 
-        build.save()
+    @classmethod
+    def record(cls, builds):
+        """
+        Records each of the builds as the latest of its port on its builder, unless a build with a
+        greater number has been recorded already. All the builds are written with a single query.
+        """
+        latest = {}
+        for build in builds:
+            key = (build.port_name, build.builder_name_id)
+            if key not in latest or latest[key].build_id <= build.build_id:
+                latest[key] = build
+        if not latest:
+            return
+
+        params = []
+        for build in latest.values():
+            params.extend([build.port_name, build.builder_name_id, build.id, build.build_id, build.status, build.time_start])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO {table} (port_name, builder_id, build_id, build_number, status, time_start) VALUES {values} "
+                "ON CONFLICT (port_name, builder_id) DO UPDATE SET build_id = EXCLUDED.build_id, "
+                "build_number = EXCLUDED.build_number, status = EXCLUDED.status, time_start = EXCLUDED.time_start "
+                "WHERE {table}.build_number <= EXCLUDED.build_number".format(
+                    table=cls._meta.db_table,
+                    values=", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(latest))
+                ),
+                params
+            )
+
+
+class FilePath(models.Model):
+    # every path installed by any build is stored once, builds refer to them by their ids
+    path = models.TextField(unique=True)
+    basename = models.TextField(default='', db_index=True, verbose_name="Last component of the path")
 
-        return build
+    class Meta:
+        db_table = "file_path"
+        verbose_name = "File path"
+        verbose_name_plural = "File paths"
+        indexes = [
+            # the unique index cannot serve LIKE 'prefix%' unless the collation is C
+            models.Index(fields=['path'], name='file_path_prefix', opclasses=['text_pattern_ops'])
+        ]
 
 
-class InstalledFile(models.Model):
-    build = models.ForeignKey('buildhistory.BuildHistory', on_delete=models.CASCADE, related_name='files')
-    file = models.TextField()
+class PortFile(models.Model):
+    # the paths installed by the latest successful build of every port, for finding the ports installing a path
+    port = models.ForeignKey('port.Port', on_delete=models.CASCADE, related_name='+')
+    file_path = models.ForeignKey(FilePath, on_delete=models.CASCADE, related_name='+')
 
     class Meta:
-        db_table = "installed_files"
-        verbose_name = "File"
-        verbose_name_plural = "Files"
+        db_table = "port_file"
+        verbose_name = "Port file"
+        verbose_name_plural = "Port files"
+        unique_together = [['file_path', 'port']]
+        indexes = [
+            models.Index(fields=['port'])
+        ]
 
 
 class TempBuildJSON(models.Model):
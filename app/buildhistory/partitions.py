@@ -0,0 +1,131 @@
+import datetime
+import gzip
+import os
+import re
+
+from django.db import connection, transaction
+
+from buildhistory.models import BuildHistory
+import config
+
+
+# the builds table is partitioned by the month of time_start, a build outside of the monthly
+# partitions goes to the default partition until the partition of its month is created
+TABLE = BuildHistory._meta.db_table
+DEFAULT_PARTITION = TABLE + '_default'
+PARTITION_NAME = re.compile(r'^' + TABLE + r'_y(\d{4})m(\d{2})$')
+ARCHIVE_SUFFIX = '.csv.gz'
+
+
+def get_partition_name(month):
+    return '{}_y{:04d}m{:02d}'.format(TABLE, month.year, month.month)
+
+
+def get_month(date):
+    return datetime.date(date.year, date.month, 1)
+
+
+def add_months(month, count):
+    months = month.year * 12 + month.month - 1 + count
+    return datetime.date(months // 12, months % 12 + 1, 1)
+
+
+def get_bound(month):
+    return '{:04d}-{:02d}-01 00:00:00+00'.format(month.year, month.month)
+
+
+def get_partitions():
+    # months of the monthly partitions of the builds table, oldest first
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s",
+            [TABLE]
+        )
+        months = []
+        for name, in cursor.fetchall():
+            match = PARTITION_NAME.match(name)
+            if match:
+                months.append(datetime.date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+@transaction.atomic
+def create_partition(month):
+    # the builds of the month which have gone to the default partition are moved into the new partition,
+    # which is filled before it is attached, as the default partition cannot hold rows of an attached range
+    name = get_partition_name(month)
+    bounds = [get_bound(month), get_bound(add_months(month, 1))]
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS)".format(name, TABLE))
+        cursor.execute(
+            "WITH moved AS (DELETE FROM {default} WHERE time_start >= %s AND time_start < %s RETURNING *) "
+            "INSERT INTO {name} SELECT * FROM moved".format(default=DEFAULT_PARTITION, name=name),
+            bounds
+        )
+        cursor.execute("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)".format(TABLE, name), bounds)
+    return name
+
+
+def create_partitions(now=None):
+    """
+    Creates the missing partitions of the current month and the BUILDS_PARTITIONS_AHEAD months after it.
+    Returns the names of the partitions created.
+    """
+    month = get_month(now or datetime.datetime.now(tz=datetime.timezone.utc))
+    existing = set(get_partitions())
+    months = [add_months(month, count) for count in range(config.BUILDS_PARTITIONS_AHEAD + 1)]
+    return [create_partition(month) for month in months if month not in existing]
+
+
+def archive_partitions(before, directory=None):
+    """
+    Moves the partitions of the months ending on or before `before` (a date) into compressed
+    archive files in `directory`. Returns the paths of the archive files written, oldest first.
+    """
+    directory = directory or config.BUILDS_ARCHIVE_DIR
+    os.makedirs(directory, exist_ok=True)
+    return [archive_partition(month, directory) for month in get_partitions() if add_months(month, 1) <= before]
+
+
+def archive_partition(month, directory):
+    """
+    Writes the builds of the partition of a month as gzipped CSV with a header, then drops the partition.
+    The partition is only dropped once its archive file is complete.
+    """
+    name = get_partition_name(month)
+    path = os.path.join(directory, name + ARCHIVE_SUFFIX)
+    partial_path = path + '.partial'
+    with connection.cursor() as cursor:
+        with gzip.open(partial_path, 'wb') as file:
+            cursor.copy_expert("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)".format(name), file)
+        os.replace(partial_path, path)
+
+        with transaction.atomic():
+            cursor.execute("ALTER TABLE {} DETACH PARTITION {}".format(TABLE, name))
+            cursor.execute("DROP TABLE {}".format(name))
+    return path
+
+
+@transaction.atomic
+def restore_archive(path):
+    """
+    Imports an archive file written by archive_partition back into its partition, which is created if needed.
+    Returns the number of builds imported.
+    """
+    match = PARTITION_NAME.match(os.path.basename(path)[:-len(ARCHIVE_SUFFIX)])
+    if not path.endswith(ARCHIVE_SUFFIX) or not match:
+        raise ValueError("Not an archive of a partition of {}: {}".format(TABLE, path))
+    month = datetime.date(int(match.group(1)), int(match.group(2)), 1)
+    if month not in get_partitions():
+        create_partition(month)
+
+    with gzip.open(path, 'rb') as file, connection.cursor() as cursor:
+        # the columns are named by the header, in case they have been reordered since
+        columns = file.readline().decode('utf-8').strip()
+        if not re.match(r'^[a-z_]+(,[a-z_]+)*$', columns):
+            raise ValueError("Invalid header in {}".format(path))
+        cursor.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(TABLE, columns), file)
+        return cursor.rowcount
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from buildhistory.models import BuildHistory, Builder, InstalledFile
+from buildhistory.models import BuildHistory, Builder
 
 
 class BuilderSerializer(serializers.ModelSerializer):
@@ -17,15 +17,12 @@ class BuildHistorySerializer(serializers.ModelSerializer):
         fields = ('port_name', 'builder_name', 'build_id', 'status', 'time_start', 'time_elapsed', 'watcher_id')
 
 
-class FilesSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = InstalledFile
-        fields = ('file', )
-
-
 class BuildFilesSerializer(serializers.ModelSerializer):
-    files = FilesSerializer(many=True, read_only=True)
+    files = serializers.SerializerMethodField()
 
     class Meta:
         model = BuildHistory
         fields = ('build_id', 'files')
+
+    def get_files(self, obj):
+        return [{'file': path} for path in obj.get_files()]
@@ -1,10 +1,29 @@
+import datetime as dt
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+import time
 from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-from django.test import TransactionTestCase, Client
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase, Client, RequestFactory
 from django.urls import reverse
 from rest_framework.test import APIClient
 
-from buildhistory.models import Builder, BuildHistory, InstalledFile
+from buildhistory.models import Builder, BuildHistory, LatestBuild, FilePath, PortFile
+from buildhistory import fetcher, partitions
+from buildhistory.file_index import refresh_port_files, lookup, get_port_ids
+from port.models import Port
+from port.forms import AdvancedSearchForm
+from user.utilities import get_ports_context
+from buildhistory.fetcher import BuildbotFetcher, RateLimiter, load_files_to_db
+import config
 
 
 def set_initial_builds_data():
@@ -46,6 +65,8 @@ def set_initial_builds_data():
         watcher_id=1
     )
 
+    LatestBuild.record(BuildHistory.objects.all())
+
 
 class TestURLsBuilds(TransactionTestCase):
     reset_sequences = True
@@ -84,7 +105,199 @@ class TestBuildbotFetch(TransactionTestCase):
         for build in BuildHistory.objects.all():
             status = build.status
             if status == "build successful":
-                self.assertGreater(build.files.all().count(), 0)
+                self.assertGreater(len(build.get_files()), 0)
+
+
+class RecordedBuildbotHandler(BaseHTTPRequestHandler):
+    # serves the builds recorded in TEST_BUILDBOT_JSON the way the Buildbot does, with keep-alive connections
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.requests.append(self.path)
+
+        body = None
+        match = re.match(r'^/json/builders/ports-(.+)-builder/builds/(-?\d+)$', self.path)
+        files_match = re.match(r'^/builders/ports-(.+)-builder/builds/(\d+)/steps/install-port/logs/files/text$', self.path)
+        if match:
+            builder, number = match.group(1), int(match.group(2))
+            builds = server.recorded['builders'].get(builder, {}).get('builds', {})
+            if number == -1 and builds:
+                # the last build is still running
+                body = json.dumps({'number': max(int(n) for n in builds) + 1})
+            elif str(number) in builds and (builder, number) not in server.missing:
+                body = json.dumps(builds[str(number)])
+        elif files_match:
+            builder, number = files_match.group(1), files_match.group(2)
+            body = server.recorded['builders'].get(builder, {}).get('files', {}).get(number, '')
+
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestBuildbotFetcher(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RecordedBuildbotHandler)
+        with open(config.TEST_BUILDBOT_JSON, 'r', encoding='utf-8') as file:
+            self.server.recorded = json.load(file)
+        self.server.lock = threading.Lock()
+        self.server.connections = set()
+        self.server.requests = []
+        self.server.missing = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.url_prefix = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        Builder.objects.create(name="10.15_x86_64", display_name="10.15", natural_name="Catalina")
+        # the builds up to 39 have been fetched by an earlier run
+        Builder.objects.create(name="11_arm64", display_name="11", natural_name="Big Sur", last_fetched_build=39)
+
+    def populate(self):
+        return BuildbotFetcher(url_prefix=self.url_prefix, workers=4, rate=0, retries=0).populate()
+
+    def test_populate(self):
+        count = self.populate()
+
+        self.assertEquals(count, 8)
+        self.assertEquals(BuildHistory.objects.filter(builder_name__name='10.15_x86_64').count(), 5)
+        self.assertEquals(
+            list(BuildHistory.objects.filter(builder_name__name='11_arm64').order_by('build_id').values_list('build_id', 'port_name', 'status')),
+            [(40, 'ffmpeg', 'failed install-port'), (41, 'openssl', 'build successful'), (42, 'ruby', 'build successful')]
+        )
+        build = BuildHistory.objects.get(builder_name__name='11_arm64', build_id=41)
+        self.assertEquals(build.watcher_id, 941)
+        self.assertEquals(len(build.get_files()), 3)
+        self.assertEquals(FilePath.objects.count(), 3 * 5)
+        self.assertEquals(dict(Builder.objects.values_list('name', 'last_fetched_build')), {'10.15_x86_64': 14, '11_arm64': 42})
+        self.assertEquals(
+            LatestBuild.objects.get(builder__name='11_arm64', port_name='openssl').build_id,
+            BuildHistory.objects.get(builder_name__name='11_arm64', build_id=41).id
+        )
+
+        # the requests have gone over a few kept-alive connections
+        self.assertEquals(len(self.server.requests), 2 + 8 * 2)
+        self.assertLessEqual(len(self.server.connections), 4)
+
+        # nothing new to fetch
+        self.assertEquals(self.populate(), 0)
+
+    def test_resumed_after_missing_build(self):
+        self.server.missing.add(('10.15_x86_64', 12))
+
+        self.assertEquals(self.populate(), 5)
+        self.assertEquals(Builder.objects.get(name='10.15_x86_64').last_fetched_build, 11)
+        self.assertEquals(Builder.objects.get(name='11_arm64').last_fetched_build, 42)
+
+        self.server.missing.clear()
+        self.assertEquals(self.populate(), 3)
+        self.assertEquals(
+            list(BuildHistory.objects.filter(builder_name__name='10.15_x86_64').order_by('build_id').values_list('build_id', flat=True)),
+            [10, 11, 12, 13, 14]
+        )
+
+    def test_populate_command_settings(self):
+        with mock.patch.object(config, 'BUILDBOT_URL_PREFIX', self.url_prefix):
+            self.assertEquals(BuildHistory.populate(workers=2, rate=1000), 8)
+
+    def test_large_file_lists_streamed(self):
+        with mock.patch.multiple(config, BUILDBOT_FILES_SPOOL_SIZE=16, INSTALLED_FILES_BATCH_SIZE=2):
+            self.assertEquals(self.populate(), 8)
+
+        build = BuildHistory.objects.get(builder_name__name='10.15_x86_64', build_id=11)
+        self.assertEquals(
+            build.get_files(),
+            ['/opt/local/share/git/file0', '/opt/local/share/git/file1', '/opt/local/share/git/file2']
+        )
+
+    def test_load_files_in_batches(self):
+        build = BuildHistory.objects.create(
+            builder_name=Builder.objects.get(name='11_arm64'),
+            build_id=1,
+            status="build successful",
+            port_name="texlive",
+            time_start=datetime.now(tz=timezone.utc),
+            watcher_id=1
+        )
+        consumed = []
+
+        def lines():
+            for i in range(25):
+                consumed.append(i)
+                yield '/opt/local/share/texmf/file\t{}\n'.format(i)
+
+        consumed_at_copy = []
+        copy_rows = fetcher.copy_rows
+
+        def record_copy(*args, **kwargs):
+            consumed_at_copy.append(len(consumed))
+            return copy_rows(*args, **kwargs)
+
+        updates = []
+
+        def record_update(execute, sql, params, many, context):
+            if sql.startswith('UPDATE builds'):
+                updates.append(sql)
+            return execute(sql, params, many, context)
+
+        with mock.patch.object(fetcher, 'copy_rows', record_copy), connection.execute_wrapper(record_update):
+            count = load_files_to_db(build, lines(), batch_size=10)
+
+        # never more than a batch is read ahead of the rows copied
+        self.assertEquals(count, 25)
+        self.assertEquals(consumed_at_copy, [10, 20, 25])
+        # the ids are written once, to the partition of the build only
+        self.assertEquals(len(updates), 1)
+        self.assertIn('time_start = %s', updates[0])
+        build.refresh_from_db()
+        self.assertEquals(len(build.get_files()), 25)
+        self.assertEquals(build.get_files()[-1], '/opt/local/share/texmf/file\t24')
+
+    def test_paths_shared_between_builds(self):
+        builder = Builder.objects.get(name='11_arm64')
+        builds = [BuildHistory.objects.create(
+            builder_name=builder,
+            build_id=build_id,
+            status="build successful",
+            port_name="qt5",
+            time_start=datetime.now(tz=timezone.utc),
+            watcher_id=1
+        ) for build_id in (1, 2)]
+
+        builds[0].set_files(['/opt/local/bin/qmake\n', '/opt/local/lib/libQt5Core.dylib\n', '\n'])
+        builds[1].set_files(['/opt/local/lib/libQt5Core.dylib', '/opt/local/lib/libQt5Gui.dylib', '/opt/local/bin/qmake'])
+
+        self.assertEquals(FilePath.objects.count(), 3)
+        self.assertEquals(builds[0].get_files(), ['/opt/local/bin/qmake', '/opt/local/lib/libQt5Core.dylib'])
+        self.assertEquals(builds[1].get_files(), ['/opt/local/lib/libQt5Core.dylib', '/opt/local/lib/libQt5Gui.dylib', '/opt/local/bin/qmake'])
+        self.assertEquals(builds[1].file_ids[0], builds[0].file_ids[1])
+
+        # the files of a build are replaced, not appended to
+        builds[0].set_files(['/opt/local/lib/libQt5Gui.dylib'])
+        self.assertEquals(BuildHistory.objects.get(id=builds[0].id).get_files(), ['/opt/local/lib/libQt5Gui.dylib'])
+
+    def test_rate_limiter(self):
+        rate_limiter = RateLimiter(50)
+        start = time.monotonic()
+        for i in range(6):
+            rate_limiter.wait()
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
 
 
 class TestBuildHistoryViews(TransactionTestCase):
@@ -123,7 +336,7 @@ class TestBuildHistoryViews(TransactionTestCase):
         # let us resolve build 2 for port-A1
         builder = Builder.objects.get(natural_name="Catalina")
 
-        BuildHistory.objects.create(
+        LatestBuild.record([BuildHistory.objects.create(
             builder_name=builder,
             build_id=4,
             status="build successful",
@@ -131,22 +344,22 @@ class TestBuildHistoryViews(TransactionTestCase):
             time_start=datetime.now(timezone.utc),
             time_elapsed=None,
             watcher_id=1
-        )
+        )])
 
         response = self.client.get(reverse('all_builds'), {'unresolved': 'on'})
         self.assertEquals(len(response.context['builds']), 1)
         self.assertEquals(response.context['builds'][0].build_id, 3)
 
         # let us resolve the build for port-A2 also now
-        BuildHistory.objects.create(
+        LatestBuild.record([BuildHistory.objects.create(
             builder_name=builder,
-            build_id=4,
+            build_id=5,
             status="build successful",
             port_name="port-A2",
             time_start=datetime.now(timezone.utc),
             time_elapsed=None,
             watcher_id=1
-        )
+        )])
 
         response = self.client.get(reverse('all_builds'), {'unresolved': 'on'})
         self.assertEquals(len(response.context['builds']), 0)
@@ -181,10 +394,7 @@ class TestBuildHistoryAPIViews(TransactionTestCase):
     def test_files_view(self):
         build = BuildHistory.objects.get(id=1)
 
-        InstalledFile.objects.create(build=build, file='some-file-a.txt')
-        InstalledFile.objects.create(build=build, file='some-file-b.txt')
-        InstalledFile.objects.create(build=build, file='some-file-c.txt')
-        InstalledFile.objects.create(build=build, file='some-file-d.txt')
+        build.set_files(['some-file-a.txt', 'some-file-b.txt', 'some-file-c.txt', 'some-file-d.txt'])
 
         response = self.client.get(reverse('files-list'), format='json')
         data = response.data['results']
@@ -202,6 +412,221 @@ class TestBuildHistoryAPIViews(TransactionTestCase):
                 self.assertEquals(len(files), 0)
 
 
+class TestLatestBuilds(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        Builder.objects.clear_ids_cache()
+        set_initial_builds_data()
+        self.catalina = Builder.objects.get(name="10.15_x86_64")
+        self.big_sur = Builder.objects.create(name="11_arm64", display_name="11", natural_name="Big Sur")
+
+    def create_build(self, builder, build_id, port_name, status):
+        return BuildHistory.objects.create(
+            builder_name=builder,
+            build_id=build_id,
+            status=status,
+            port_name=port_name,
+            time_start=datetime.now(timezone.utc),
+            watcher_id=1
+        )
+
+    def test_record(self):
+        self.assertEquals(
+            sorted(LatestBuild.objects.values_list('port_name', 'builder__name', 'build_number', 'status')),
+            [('port-A1', '10.15_x86_64', 2, 'failed install-port'), ('port-A2', '10.15_x86_64', 3, 'failed install-dependencies')]
+        )
+
+        # an earlier build recorded late does not replace the latest one
+        LatestBuild.record([BuildHistory.objects.get(build_id=1)])
+        self.assertEquals(LatestBuild.objects.get(port_name='port-A1').build_number, 2)
+
+        # a build updated in place, as pushed by buildbot2 when it completes, replaces itself
+        build = BuildHistory.objects.get(build_id=3)
+        build.status = "build successful"
+        build.save()
+        LatestBuild.record([build])
+        self.assertEquals(LatestBuild.objects.get(port_name='port-A2').status, "build successful")
+
+        LatestBuild.record([
+            self.create_build(self.big_sur, 8, 'port-A1', "build successful"),
+            self.create_build(self.big_sur, 7, 'port-A1', "failed install-port"),
+            self.create_build(self.catalina, 5, 'port-A1', "build successful"),
+        ])
+        self.assertEquals(
+            sorted(LatestBuild.objects.filter(port_name='port-A1').values_list('builder__name', 'build_number')),
+            [('10.15_x86_64', 5), ('11_arm64', 8)]
+        )
+
+    def test_recorded_by_buildbot2_push(self):
+        BuildHistory.buildbot2_parse({
+            'buildid': 9,
+            'builderid': 1,
+            'started_at': 1600000000,
+            'state_string': "build successful",
+            'properties': {'workername': ['ports-11_arm64'], 'portname': ['port-A2']}
+        })
+        self.assertEquals(LatestBuild.objects.get(port_name='port-A2', builder=self.big_sur).status, "build successful")
+
+    def test_matrix_api(self):
+        self.create_build(self.big_sur, 1, 'port-A2', "build successful")
+        LatestBuild.record(BuildHistory.objects.filter(builder_name=self.big_sur))
+        client = APIClient()
+
+        response = client.get(reverse('builds-matrix'), format='json')
+        self.assertEquals(response.data['count'], 2)
+        self.assertEquals([row['port_name'] for row in response.data['results']], ['port-A1', 'port-A2'])
+        self.assertEquals(sorted(response.data['results'][1]['builds']), ['10.15_x86_64', '11_arm64'])
+        self.assertEquals(response.data['results'][1]['builds']['11_arm64']['status'], "build successful")
+        self.assertEquals(response.data['results'][1]['builds']['10.15_x86_64']['build_id'], 3)
+
+        response = client.get(reverse('builds-matrix'), {'port_name': 'port-A2', 'builder_name__name': '11_arm64'}, format='json')
+        self.assertEquals(response.data['results'], [
+            {'port_name': 'port-A2', 'builds': {'11_arm64': mock.ANY}}
+        ])
+
+    def test_ports_context(self):
+        for name in ['port-A1', 'port-A2', 'port-A3']:
+            Port.objects.create(name=name)
+
+        request = RequestFactory().get('/', {'build_broken': 'on'})
+        ports = get_ports_context(request, Port.objects.all(), '10.15_x86_64')
+        self.assertEquals([(port.name, port.build) for port in ports], [
+            ('port-A1', 'failed install-port'), ('port-A2', 'failed install-dependencies')
+        ])
+
+        request = RequestFactory().get('/', {'no_build': 'on'})
+        self.assertEquals([port.name for port in get_ports_context(request, Port.objects.all(), '10.15_x86_64')], ['port-A3'])
+
+
+class TestFileIndex(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        self.builder = Builder.objects.create(name="10.15_x86_64", display_name="10.15", natural_name="Catalina")
+        Port.objects.create(name="python38")
+        Port.objects.create(name="python39")
+        Port.objects.create(name="py38-pip")
+
+        self.create_build(1, "python38", "build successful", 1, [
+            '/opt/local/bin/python3.8', '/opt/local/lib/libpython3.8.dylib', '/opt/local/share/doc/README'
+        ])
+        # the latest successful build is indexed, the older one and the failed one are not
+        self.create_build(2, "python39", "build successful", 2, ['/opt/local/bin/python3.9-old'])
+        self.create_build(3, "python39", "build successful", 3, ['/opt/local/bin/python3.9', '/opt/local/share/doc/README'])
+        self.create_build(4, "python39", "failed install-port", 4, ['/opt/local/bin/python3.9-broken'])
+        self.create_build(5, "PY38-pip", "build successful", 5, ['/opt/local/bin/pip-3.8'])
+
+    def create_build(self, build_id, port_name, status, minute, files):
+        build = BuildHistory.objects.create(
+            builder_name=self.builder,
+            build_id=build_id,
+            status=status,
+            port_name=port_name,
+            time_start=datetime(2020, 1, 1, 0, minute, tzinfo=timezone.utc),
+            watcher_id=1
+        )
+        build.set_files(files)
+
+    def test_refresh_all(self):
+        self.assertEquals(refresh_port_files(), 6)
+        self.assertEquals(
+            sorted(PortFile.objects.values_list('port__name', 'file_path__path')),
+            [
+                ('py38-pip', '/opt/local/bin/pip-3.8'),
+                ('python38', '/opt/local/bin/python3.8'),
+                ('python38', '/opt/local/lib/libpython3.8.dylib'),
+                ('python38', '/opt/local/share/doc/README'),
+                ('python39', '/opt/local/bin/python3.9'),
+                ('python39', '/opt/local/share/doc/README'),
+            ]
+        )
+
+    def test_refresh_ports(self):
+        refresh_port_files()
+        self.create_build(6, "python38", "build successful", 6, ['/opt/local/bin/python3.8'])
+
+        self.assertEquals(refresh_port_files(['PYTHON38']), 1)
+        self.assertEquals(
+            sorted(PortFile.objects.values_list('port__name', 'file_path__path')),
+            [
+                ('py38-pip', '/opt/local/bin/pip-3.8'),
+                ('python38', '/opt/local/bin/python3.8'),
+                ('python39', '/opt/local/bin/python3.9'),
+                ('python39', '/opt/local/share/doc/README'),
+            ]
+        )
+
+    def test_lookup(self):
+        refresh_port_files()
+
+        self.assertEquals(lookup('/opt/local/share/doc/README'), [
+            {'path': '/opt/local/share/doc/README', 'ports': ['python38', 'python39']}
+        ])
+        self.assertEquals(lookup('/opt/local/bin/python3.9-old'), [])
+        self.assertEquals(lookup('/opt/local/bin/py', 'prefix'), [
+            {'path': '/opt/local/bin/python3.8', 'ports': ['python38']},
+            {'path': '/opt/local/bin/python3.9', 'ports': ['python39']},
+        ])
+        self.assertEquals(lookup('/opt/local/bin/', 'prefix', limit=1), [
+            {'path': '/opt/local/bin/pip-3.8', 'ports': ['py38-pip']},
+        ])
+        # the wildcards of LIKE are matched literally
+        self.assertEquals(lookup('/opt/local/bin/%', 'prefix'), [])
+        self.assertEquals(lookup('libpython3.8.dylib', 'basename'), [
+            {'path': '/opt/local/lib/libpython3.8.dylib', 'ports': ['python38']},
+        ])
+        with self.assertRaises(ValueError):
+            lookup('python3.8', 'contains')
+
+    def test_port_ids(self):
+        refresh_port_files()
+
+        self.assertEquals(list(get_port_ids('/opt/local/bin/python3.8')), [1])
+        self.assertEquals(list(get_port_ids('/opt/local/bin/')), [])
+        self.assertEquals(sorted(get_port_ids('README', 'basename')), [1, 2])
+        self.assertEquals(sorted(get_port_ids('/opt/local/bin/', 'prefix')), [1, 2, 3])
+        self.assertEquals(list(get_port_ids('/opt/local/bin/python3.9-broken')), [])
+
+    def test_search_form(self):
+        refresh_port_files()
+
+        # the path is matched exactly unless another match is chosen
+        form = AdvancedSearchForm({'installed_file': '/opt/local/bin/'})
+        self.assertTrue(form.is_valid())
+        self.assertEquals(form.cleaned_data['installed_file_port_ids'], [])
+        form = AdvancedSearchForm({'installed_file': '/opt/local/bin/', 'installed_file_match': 'prefix'})
+        self.assertTrue(form.is_valid())
+        self.assertEquals(sorted(form.cleaned_data['installed_file_port_ids']), [1, 2, 3])
+
+        # a prefix matched by too many ports is rejected rather than sent to Solr
+        with mock.patch.object(config, 'FILE_SEARCH_MAX_PORTS', 2):
+            form = AdvancedSearchForm({'installed_file': '/opt/local/', 'installed_file_match': 'prefix'})
+            self.assertFalse(form.is_valid())
+            self.assertIn('installed_file', form.errors)
+            self.assertTrue(AdvancedSearchForm({'installed_file': 'README', 'installed_file_match': 'basename'}).is_valid())
+
+    def test_lookup_api(self):
+        refresh_port_files()
+        client = APIClient()
+
+        response = client.get(reverse('files-lookup'), {'path': 'python3.9', 'match': 'basename'}, format='json')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.data['count'], 1)
+        self.assertEquals(response.data['results'][0], {'path': '/opt/local/bin/python3.9', 'ports': ['python39']})
+
+        response = client.get(reverse('files-lookup'), {'path': '/opt/local/bin/python3.9'}, format='json')
+        self.assertEquals(response.data['count'], 1)
+
+        self.assertEquals(client.get(reverse('files-lookup'), {'path': 'python3.9', 'match': 'regex'}, format='json').status_code, 400)
+        self.assertEquals(client.get(reverse('files-lookup'), format='json').status_code, 400)
+
+    def test_refreshed_by_fetcher(self):
+        with mock.patch.object(fetcher, 'refresh_port_files') as refresh:
+            BuildbotFetcher(url_prefix='http://127.0.0.1:1', workers=1, rate=0, retries=0).populate(builders=[])
+        refresh.assert_called_once_with(set())
+
+
 class TestBuildbot2HTTPStatusPush(TransactionTestCase):
     reset_sequences = True
     build_data = """
@@ -246,6 +671,7 @@ class TestBuildbot2HTTPStatusPush(TransactionTestCase):
 
     def setUp(self):
         self.client = Client()
+        Builder.objects.clear_ids_cache()
 
     def test_new_builder_added(self):
         Builder.objects.create(name="builder-1")
@@ -277,3 +703,180 @@ class TestBuildbot2HTTPStatusPush(TransactionTestCase):
         self.assertEquals(build_object.port_name, "portA")
         self.assertEquals(build_object.port_version, "1.2")
         self.assertEquals(build_object.port_revision, "0")
+
+
+class TestBuildbot2BatchSubmission(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        self.client = Client()
+        Builder.objects.clear_ids_cache()
+        Builder.objects.create(name="darwin19-x86_64")
+
+    def build_object(self, build_id, port_name, state, builder="ports-darwin20-x86_64", complete=True, started_at=1596624615):
+        return {
+            "buildid": build_id,
+            "builderid": 3420,
+            "started_at": started_at,
+            "complete_at": started_at + 139,
+            "complete": complete,
+            "state_string": state,
+            "properties": {
+                "portname": [port_name, "Trigger"],
+                "workername": [builder, "Worker"],
+                "portversion": ["1.2", "SetPropertyFromCommand Step"],
+                "portrevision": ["0", "SetPropertyFromCommand Step"]
+            }
+        }
+
+    def submit(self, data, content_type='application/json'):
+        return self.client.post(reverse('buildbot2_submit_batch'), data=data, content_type=content_type)
+
+    def test_json_array(self):
+        response = self.submit(json.dumps([
+            self.build_object(1, "portA", "building", complete=False),
+            self.build_object(2, "portB", "failed install-port", builder="ports-darwin19-x86_64"),
+            {"buildid": 3},
+            self.build_object(1, "portA", "build successful"),
+        ]))
+        self.assertEquals(response.status_code, 200)
+        data = response.json()
+        self.assertEquals((data['created'], data['updated'], data['invalid']), (3, 0, 1))
+        self.assertEquals([result['result'] for result in data['results']], ['created', 'created', 'invalid', 'created'])
+
+        # the build pushed twice is written once, as pushed last
+        self.assertEquals(Builder.objects.count(), 2)
+        self.assertEquals(BuildHistory.objects.count(), 2)
+        build = BuildHistory.objects.get(port_name="portA")
+        self.assertEquals(build.status, "build successful")
+        self.assertEquals(build.builder_name.name, "darwin20-x86_64")
+        self.assertEquals(build.time_elapsed.total_seconds(), 139)
+        self.assertEquals(build.port_version, "1.2")
+        self.assertEquals(build.get_files(), [])
+        self.assertEquals(
+            sorted(LatestBuild.objects.values_list('port_name', 'status')),
+            [('portA', 'build successful'), ('portB', 'failed install-port')]
+        )
+
+    def test_build_number_reused(self):
+        # builds are told apart by their start time as well, like the unique key of the table
+        response = self.submit(json.dumps([
+            self.build_object(1, "portA", "build successful", started_at=1596624615),
+            self.build_object(1, "portB", "failed install-port", started_at=1596634615),
+        ]))
+        self.assertEquals([result['result'] for result in response.json()['results']], ['created', 'created'])
+        self.assertEquals(sorted(BuildHistory.objects.values_list('port_name', flat=True)), ['portA', 'portB'])
+
+    def test_ndjson_updates(self):
+        self.submit(json.dumps([self.build_object(1, "portA", "building", complete=False)]))
+
+        response = self.submit("\n".join([
+            json.dumps(self.build_object(1, "portA", "build successful")),
+            "{not json",
+            "",
+            json.dumps(self.build_object(2, "portA", "failed install-port")),
+        ]), content_type='application/x-ndjson')
+        data = response.json()
+        self.assertEquals([result['result'] for result in data['results']], ['updated', 'invalid', 'created'])
+        self.assertEquals(data['results'][0], {'result': 'updated', 'build_id': 1, 'port_name': 'portA'})
+        self.assertEquals(BuildHistory.objects.get(build_id=1).status, "build successful")
+        self.assertEquals(LatestBuild.objects.get(port_name="portA").build_number, 2)
+
+    def test_single_query_per_batch(self):
+        self.submit(json.dumps([self.build_object(1, "portA", "building")]))
+
+        queries = []
+
+        def record_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record_query):
+            self.submit(json.dumps([self.build_object(number, "port{}".format(number), "build successful") for number in range(1, 51)]))
+        self.assertEquals(len([sql for sql in queries if 'INSERT INTO builds' in sql]), 1)
+        # the builder has been cached
+        self.assertFalse([sql for sql in queries if 'FROM "builder"' in sql])
+        self.assertEquals(BuildHistory.objects.count(), 50)
+
+    def test_invalid_requests(self):
+        self.assertEquals(self.submit("[{").status_code, 400)
+        self.assertEquals(self.client.get(reverse('buildbot2_submit_batch')).status_code, 405)
+        with mock.patch.object(config, 'BUILDBOT2_SUBMIT_MAX_BUILDS', 1):
+            self.assertEquals(self.submit(json.dumps([{}, {}])).status_code, 400)
+        self.assertEquals(BuildHistory.objects.count(), 0)
+
+
+class TestBuildPartitions(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        self.builder = Builder.objects.create(name="10.15_x86_64", display_name="10.15", natural_name="Catalina")
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def create_build(self, build_id, time_start, files=()):
+        build = BuildHistory.objects.create(
+            builder_name=self.builder,
+            build_id=build_id,
+            status="build successful",
+            port_name="port-A1",
+            time_start=time_start,
+            watcher_id=1
+        )
+        build.set_files(files)
+        return build
+
+    def get_partition(self, build):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tableoid::regclass::text FROM builds WHERE id = %s", [build.id])
+            return cursor.fetchone()[0]
+
+    def test_builds_in_monthly_partitions(self):
+        this_month = partitions.get_month(datetime.now(timezone.utc))
+        self.assertEquals(partitions.create_partitions(), [])
+        self.assertTrue({this_month, partitions.add_months(this_month, 2)}.issubset(partitions.get_partitions()))
+
+        build = self.create_build(1, datetime.now(timezone.utc))
+        self.assertEquals(self.get_partition(build), partitions.get_partition_name(this_month))
+
+        # a month without a partition goes to the default one until its partition is created
+        early = self.create_build(2, datetime(2017, 5, 31, 23, 59, tzinfo=timezone.utc))
+        self.assertEquals(self.get_partition(early), 'builds_default')
+        self.assertEquals(partitions.create_partition(dt.date(2017, 5, 1)), 'builds_y2017m05')
+        self.assertEquals(self.get_partition(early), 'builds_y2017m05')
+        self.assertEquals(BuildHistory.objects.count(), 2)
+
+    def test_archive_and_restore(self):
+        for month in [1, 2, 3]:
+            partitions.create_partition(dt.date(2018, month, 1))
+        old = self.create_build(1, datetime(2018, 1, 10, tzinfo=timezone.utc), ['/opt/local/bin/a', '/opt/local/bin/b'])
+        self.create_build(2, datetime(2018, 2, 10, tzinfo=timezone.utc))
+        kept = self.create_build(3, datetime(2018, 3, 10, tzinfo=timezone.utc))
+
+        paths = partitions.archive_partitions(dt.date(2018, 3, 1), self.directory.name)
+        self.assertEquals([os.path.basename(path) for path in paths], ['builds_y2018m01.csv.gz', 'builds_y2018m02.csv.gz'])
+        self.assertEquals(list(BuildHistory.objects.values_list('id', flat=True)), [kept.id])
+        self.assertNotIn(dt.date(2018, 1, 1), partitions.get_partitions())
+        with gzip.open(paths[0], 'rt') as file:
+            self.assertTrue(file.readline().startswith('id,'))
+
+        self.assertEquals(partitions.restore_archive(paths[0]), 1)
+        restored = BuildHistory.objects.get(id=old.id)
+        self.assertEquals(restored.time_start, old.time_start)
+        self.assertEquals(restored.get_files(), ['/opt/local/bin/a', '/opt/local/bin/b'])
+        self.assertIn(dt.date(2018, 1, 1), partitions.get_partitions())
+
+        with self.assertRaises(ValueError):
+            partitions.restore_archive(os.path.join(self.directory.name, 'builds.csv.gz'))
+
+    def test_commands(self):
+        partitions.create_partition(dt.date(2016, 4, 1))
+        build = self.create_build(1, datetime(2016, 4, 10, tzinfo=timezone.utc))
+        self.create_build(2, datetime.now(timezone.utc))
+
+        call_command('archive-build-history', directory=self.directory.name, stdout=open(os.devnull, 'w'))
+        self.assertEquals(BuildHistory.objects.count(), 1)
+
+        path = os.path.join(self.directory.name, 'builds_y2016m04.csv.gz')
+        call_command('restore-build-history', path, stdout=open(os.devnull, 'w'))
+        self.assertEquals(BuildHistory.objects.get(build_id=1).id, build.id)
@@ -10,5 +10,6 @@ router.register('files', views.InstalledFilesAPIView, basename='files')
 
 urlpatterns = [
     path('', views.all_builds, name='all_builds'),
-    path('buildbot2/submit', views.buildbot2_submit, name='buildbot2_submit')
+    path('buildbot2/submit', views.buildbot2_submit, name='buildbot2_submit'),
+    path('buildbot2/submit_batch', views.buildbot2_submit_batch, name='buildbot2_submit_batch')
 ]
@@ -1,16 +1,23 @@
 import json
 
 from django.shortcuts import render, HttpResponse
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
 from django.db.models import Subquery
 from rest_framework import viewsets, filters
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 import django_filters
 
 from utilities import paginate
-from buildhistory.models import BuildHistory, Builder
+from buildhistory.models import BuildHistory, Builder, LatestBuild
 from django.views.decorators.csrf import csrf_exempt
 from buildhistory.forms import BuildHistoryForm
 from buildhistory.filters import BuildHistoryFilter
 from buildhistory.serializers import BuilderSerializer, BuildHistorySerializer, BuildFilesSerializer
+from buildhistory.file_index import MATCH_TYPES, EXACT, lookup
+import config
 
 
 def all_builds(request):
@@ -21,13 +28,13 @@ def all_builds(request):
 
     # generate querysets
     if unresolved:
-        all_latest_builds = BuildHistory.objects.all().order_by('port_name', 'builder_name__display_name', '-build_id').distinct('port_name', 'builder_name__display_name')
+        latest_failed_builds = LatestBuild.objects.filter(status__icontains='failed')
         builds = BuildHistoryFilter(
             {
                 'builder_name__name': builder_list,
                 'port_name': port_name,
             },
-            queryset=BuildHistory.objects.filter(id__in=Subquery(all_latest_builds.values('id')), status__icontains='failed').select_related('builder_name').order_by('-time_start')
+            queryset=BuildHistory.objects.filter(id__in=Subquery(latest_failed_builds.values('build_id'))).select_related('builder_name').order_by('-time_start')
         ).qs
     else:
         builds = BuildHistoryFilter(
@@ -61,6 +68,51 @@ def buildbot2_submit(request):
         return error_message
 
 
+@csrf_exempt
+@require_POST
+def buildbot2_submit_batch(request):
+    """
+    Accepts many builds pushed by buildbot2 at once, as a JSON array or as NDJSON (one build object per line),
+    and responds with the result of every build object in the order received.
+    """
+    try:
+        body = request.body.decode()
+    except UnicodeDecodeError:
+        return JsonResponse({'error': "Expected a UTF-8 encoded body"}, status=400)
+
+    if body.lstrip().startswith('['):
+        try:
+            build_objects = json.loads(body)
+        except json.JSONDecodeError:
+            return JsonResponse({'error': "Failed to parse the JSON array"}, status=400)
+    else:
+        build_objects = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                build_objects.append(json.loads(line))
+            except json.JSONDecodeError:
+                # reported as an invalid build
+                build_objects.append(None)
+
+    if len(build_objects) > config.BUILDBOT2_SUBMIT_MAX_BUILDS:
+        return JsonResponse({'error': "At most {} builds are accepted at once".format(config.BUILDBOT2_SUBMIT_MAX_BUILDS)}, status=400)
+
+    results = []
+    for result in BuildHistory.buildbot2_upsert(build_objects):
+        if result is None:
+            results.append({'result': 'invalid'})
+        else:
+            build, created = result
+            results.append({'result': 'created' if created else 'updated', 'build_id': build.build_id, 'port_name': build.port_name})
+
+    counts = {key: 0 for key in ['created', 'updated', 'invalid']}
+    for result in results:
+        counts[result['result']] += 1
+    return JsonResponse(dict(counts, results=results))
+
+
 class BuilderAPIView(viewsets.ReadOnlyModelViewSet):
     queryset = Builder.objects.all()
     serializer_class = BuilderSerializer
@@ -77,7 +129,47 @@ class BuildHistoryAPIView(viewsets.ReadOnlyModelViewSet):
     ordering = ['-time_start']
     filterset_fields = ['builder_name__name', 'builder_name__display_name', 'status', 'port_name']
 
+    @action(detail=False)
+    def matrix(self, request):
+        # the status of the latest build of each port on each builder, paginated by port,
+        # ?port_name=... and ?builder_name__name=... (both repeatable) narrow it down
+        latest_builds = LatestBuild.objects.all()
+        port_names = self.request.query_params.getlist('port_name')
+        builder_names = self.request.query_params.getlist('builder_name__name')
+        if port_names:
+            latest_builds = latest_builds.filter(port_name__in=port_names)
+        if builder_names:
+            latest_builds = latest_builds.filter(builder__name__in=builder_names)
+
+        page = self.paginate_queryset(latest_builds.order_by('port_name').values_list('port_name', flat=True).distinct())
+        builds = {}
+        for port_name, builder_name, build_number, status, time_start in latest_builds.filter(port_name__in=page)\
+                .values_list('port_name', 'builder__name', 'build_number', 'status', 'time_start'):
+            builds.setdefault(port_name, {})[builder_name] = {
+                'build_id': build_number,
+                'status': status,
+                'time_start': time_start
+            }
+
+        return self.get_paginated_response([{'port_name': port_name, 'builds': builds[port_name]} for port_name in page])
+
 
 class InstalledFilesAPIView(viewsets.ReadOnlyModelViewSet):
     queryset = BuildHistory.objects.all()
     serializer_class = BuildFilesSerializer
+
+    @action(detail=False)
+    def lookup(self, request):
+        # ?path=/opt/local/bin/python3&match=exact|prefix|basename, answered from the file index
+        query = self.request.query_params.get('path')
+        match = self.request.query_params.get('match', EXACT)
+        if not query:
+            raise ValidationError({'path': "This parameter is required."})
+        if match not in MATCH_TYPES:
+            raise ValidationError({'match': "Expected one of: {}".format(", ".join(MATCH_TYPES))})
+
+        paths = lookup(query, match)
+        return Response({
+            'count': len(paths),
+            'results': paths
+        })
@@ -8,6 +8,7 @@ DATA_DIR = os.path.join(BASE_DIR, "data")
 # commands
 GIT = "/usr/bin/git"
 TCLSH = "/usr/bin/tclsh"
+PORTINDEX = "/opt/local/bin/portindex"
 
 # configuration for rsync
 RSYNC = "/usr/bin/rsync"
@@ -26,6 +27,9 @@ MACPORTS_CONTRIB_URL = "https://github.com/macports/macports-contrib"
 LOCAL_PORTINDEX = os.path.join(MACPORTS_PORTS_DIR, 'PortIndex')
 LOCAL_PORTINDEX_JSON = os.path.join(MACPORTS_PORTS_DIR, 'portindex.json')
 PORTINDEX2JSON = os.path.join(MACPORTS_CONTRIB_DIR, 'portindex2json', 'portindex2json.tcl')
+PORTINDEX_PLATFORM = "macosx_19_i386"
+# JSON of the ports regenerated by the last incremental update
+LOCAL_PORTINDEX_CHANGES_JSON = os.path.join(MACPORTS_PORTS_DIR, 'portindex-changes.json')
 
 # configuration for fetching builders
 BUILDERS_JSON_URL = "https://build.macports.org/json/builders/"
@@ -33,11 +37,60 @@ BUILDERS_JSON_URL = "https://build.macports.org/json/builders/"
 # configuration for fetching builds
 BUILDBOT_URL_PREFIX = "https://build.macports.org"
 BUILDS_FETCHED_COUNT = 5
+# number of builds fetched at the same time, and the number of builds fetched ahead of the last one written
+BUILDBOT_FETCH_WORKERS = 8
+BUILDBOT_FETCH_WINDOW = 64
+# requests per second sent to the Buildbot by all the workers together
+BUILDBOT_REQUESTS_PER_SECOND = 20
+# seconds after which a request times out, and the number of times a failed request is tried again
+BUILDBOT_FETCH_TIMEOUT = 60
+BUILDBOT_FETCH_RETRIES = 3
+# bytes of a fetched file list kept in memory before it is spooled to disk
+BUILDBOT_FILES_SPOOL_SIZE = 1024 * 1024
+# number of installed files of a build copied into the database at once
+INSTALLED_FILES_BATCH_SIZE = 10000
+# monthly partitions of the builds table created ahead of the current month
+BUILDS_PARTITIONS_AHEAD = 2
+# months of builds kept in the database, older partitions are moved to compressed files in the archive directory
+BUILDS_RETENTION_MONTHS = 24
+BUILDS_ARCHIVE_DIR = os.path.join(DATA_DIR, "build_archives")
+# maximum number of builds accepted by a single batch submission from buildbot2
+BUILDBOT2_SUBMIT_MAX_BUILDS = 1000
+# maximum number of paths returned by a lookup of the file index
+FILE_LOOKUP_LIMIT = 100
+# maximum number of ports the installed file filter of the search may match, as they are sent to Solr as one query
+FILE_SEARCH_MAX_PORTS = 500
 
 # configuration for tests
 TEST_SAMPLE_DATA = os.path.join(BASE_DIR, 'tests', 'sample_data')
 TEST_PORTINDEX_JSON = os.path.join(TEST_SAMPLE_DATA, 'portindex.json')
 TEST_SUBMISSION_JSON = os.path.join(TEST_SAMPLE_DATA, 'submissions.json')
+TEST_BUILDBOT_JSON = os.path.join(TEST_SAMPLE_DATA, 'buildbot_builds.json')
 
 # port command
 PORT_COMMAND = "/opt/local/bin/port"
+
+# number of ports written to the database in a single batch during ingestion
+PORT_INGESTION_BATCH_SIZE = 500
+
+# number of the latest changes to the dependencies kept for refreshing the in-memory dependency graph
+DEPENDENCY_GRAPH_CHANGES_KEPT = 100000
+
+# configuration for running livecheck
+# number of livechecks run at the same time
+LIVECHECK_WORKERS = 8
+# seconds after which a livecheck is killed, and the number of times it is tried again
+LIVECHECK_TIMEOUT = 300
+LIVECHECK_RETRIES = 1
+# number of LiveCheck rows written to the database in a single batch
+LIVECHECK_BATCH_SIZE = 100
+# days after which the livecheck of a port installed by nobody is due again, shorter for popular ports
+LIVECHECK_INTERVAL_DAYS = 7
+# the interval is multiplied by these for ports known to be outdated and for ports whose livecheck failed
+LIVECHECK_OUTDATED_BACKOFF = 4
+LIVECHECK_ERROR_BACKOFF = 4
+# popularity of the ports is counted over the submissions of the last days
+LIVECHECK_POPULARITY_DAYS = 30
+
+# number of ports passed to a single invocation of the port command by get-notes and populate-variant-descriptions
+PORT_COMMAND_BATCH_SIZE = 200
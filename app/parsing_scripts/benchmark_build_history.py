@@ -0,0 +1,251 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from port.models import Port
+from buildhistory.models import Builder, BuildHistory, LatestBuild
+from buildhistory import partitions
+from parsing_scripts.benchmark_ingestion import measure
+
+
+# the indexes of the builds table before they were consolidated, besides those of its constraints
+PREVIOUS_INDEXES = [
+    "CREATE INDEX builds_port_na_690929_idx ON builds (port_name, builder_name_id, build_id DESC)",
+    "CREATE INDEX builds_port_na_a30f18_idx ON builds (port_name, builder_name_id, time_start DESC)",
+    "CREATE INDEX builds_port_na_a1a05a_idx ON builds (port_name, status, builder_name_id)",
+    "CREATE INDEX builds_port_na_9b04f4_idx ON builds (port_name, builder_name_id)",
+    "CREATE INDEX builds_port_na_f9cad8_idx ON builds (port_name, status)",
+    "CREATE INDEX builds_time_st_741e8b_idx ON builds (time_start DESC)",
+    "CREATE INDEX builds_port_na_8769b9_idx ON builds (port_name)",
+    "CREATE INDEX builds_status_e27daf_idx ON builds (status)",
+    "CREATE INDEX builds_builder_5931b0_idx ON builds (builder_name_id)",
+    "CREATE INDEX builds_builder_name_id_26d416c5 ON builds (builder_name_id)",
+]
+
+BUILDERS = ['10.6_x86_64', '10.14_x86_64', '10.15_x86_64', '11_x86_64', '11_arm64']
+STATUSES = [("build successful", 80), ("failed install-port", 10), ("failed install-dependencies", 6), ("failed archive-exists", 4)]
+
+
+def generate_build_objects(count, ports, seed=0, months=12, now=None):
+    """
+    Returns `count` synthetic build objects in the format pushed by buildbot2, spread over the last `months`
+    months in the order they started. Popular ports are built more often, as on the real builders.
+    """
+    generator = random.Random(seed)
+    now = now or datetime.datetime.now(tz=datetime.timezone.utc)
+    start = now - datetime.timedelta(days=30 * months)
+    step = (now - start).total_seconds() / count
+    port_weights = [1.0 / (rank + 1) for rank in range(ports)]
+
+    build_objects = []
+    for number in range(count):
+        started_at = start.timestamp() + number * step
+        build_objects.append({
+            'buildid': number + 1,
+            'builderid': 1,
+            'started_at': started_at,
+            'complete_at': started_at + generator.randint(10, 3600),
+            'complete': True,
+            'state_string': generator.choices([status for status, weight in STATUSES], [weight for status, weight in STATUSES])[0],
+            'properties': {
+                'portname': ['port{}'.format(generator.choices(range(ports), port_weights)[0]), 'Trigger'],
+                'workername': ['ports-' + generator.choice(BUILDERS), 'Worker'],
+                'portversion': ['1.0', 'SetPropertyFromCommand Step'],
+                'portrevision': ['0', 'SetPropertyFromCommand Step'],
+            }
+        })
+    return build_objects
+
+
+def get_index_definitions():
+    # definitions of the indexes of the builds table which do not belong to a constraint
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = 'builds' "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = 'builds'::regclass) "
+            "ORDER BY indexname"
+        )
+        # the definitions of the indexes of a partitioned table only apply to the table itself
+        return [definition.replace(" ON ONLY ", " ON ") for definition, in cursor.fetchall()]
+
+
+def apply_indexes(definitions):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'builds' "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = 'builds'::regclass)"
+        )
+        for name, in cursor.fetchall():
+            cursor.execute('DROP INDEX "{}"'.format(name))
+        for definition in definitions:
+            cursor.execute(definition)
+
+
+def get_read_paths(port_names):
+    # the pages and API requests reading the build history, with (name, url, query parameters)
+    popular, rare = port_names[0], port_names[-1]
+    return [
+        ('all_builds', reverse('all_builds'), {}),
+        ('all_builds_unresolved', reverse('all_builds'), {'unresolved': 'on'}),
+        ('all_builds_port', reverse('all_builds'), {'port_name': popular}),
+        ('all_builds_builder_status', reverse('all_builds'), {'builder_name__name': BUILDERS[0], 'status': 'failed install-port'}),
+        ('port_details_popular', reverse('port_details', kwargs={'name': popular}), {}),
+        ('port_details_rare', reverse('port_details', kwargs={'name': rare}), {}),
+        ('port_builds', reverse('port_builds', kwargs={'name': popular}), {}),
+        ('port_builds_builder', reverse('port_builds', kwargs={'name': popular}), {'builder_name__name': BUILDERS[-1]}),
+        ('api_builds', reverse('builds-list'), {}),
+        ('api_builds_port', reverse('builds-list'), {'port_name': popular}),
+        ('api_builds_builder', reverse('builds-list'), {'builder_name__name': BUILDERS[1]}),
+        ('api_builds_status', reverse('builds-list'), {'status': 'failed archive-exists'}),
+        ('api_builds_ordering', reverse('builds-list'), {'port_name': rare, 'ordering': 'build_id'}),
+    ]
+
+
+def record_query(queries):
+    # returns an execute wrapper appending the SQL of every query, with its parameters, and its time to queries
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        queries.append((connection.ops.last_executed_query(context['cursor'], sql, params), time.perf_counter() - start))
+        return result
+    return wrapper
+
+
+def get_unindexed_queries(queries):
+    """
+    Returns the queries which narrow the builds down without any index serving them.
+
+    Every query is planned with sequential scans, hash joins and merge joins made as costly as possible, so
+    that the planner uses an index wherever one applies. A query is unindexed when its plan still reads a
+    partition of the builds table in full while filtering or joining its rows, unless a LIMIT stops the scan
+    early. Empty partitions, such as those of the months ahead, are read in full whatever the indexes.
+    """
+    unindexed = []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass AND child.reltuples <= 0",
+            [BuildHistory._meta.db_table]
+        )
+        empty_partitions = {name for name, in cursor.fetchall()}
+        cursor.execute("SET enable_seqscan = off; SET enable_hashjoin = off; SET enable_mergejoin = off")
+        try:
+            for sql in queries:
+                if not sql.startswith('SELECT') or '"builds"' not in sql:
+                    continue
+                cursor.execute("EXPLAIN (FORMAT JSON) " + sql)
+                plan = cursor.fetchone()[0]
+                if is_unindexed(plan[0]['Plan'], empty_partitions):
+                    unindexed.append(sql)
+        finally:
+            cursor.execute("RESET enable_seqscan; RESET enable_hashjoin; RESET enable_mergejoin")
+    return unindexed
+
+
+def is_unindexed(node, empty_partitions, limited=False, joined=False):
+    relation = node.get('Relation Name', '')
+    if relation.startswith(BuildHistory._meta.db_table) and relation not in empty_partitions:
+        # an index scan without a condition reads the whole index, a bitmap scan without one the whole table
+        full_scan = node['Node Type'] == 'Seq Scan' or (
+            node['Node Type'] in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in node
+        ) or (node['Node Type'] == 'Bitmap Heap Scan' and 'Recheck Cond' not in node)
+        if full_scan and not limited and ('Filter' in node or joined):
+            return True
+    limited = limited or node['Node Type'] == 'Limit'
+    joined = joined or node['Node Type'] in ('Nested Loop', 'Hash Join', 'Merge Join')
+    return any(is_unindexed(child, empty_partitions, limited, joined) for child in node.get('Plans', []))
+
+
+def benchmark_indexes(indexes, build_objects, port_names, batch_size, repeat):
+    """
+    Replays the build submissions into an empty build history with the given indexes, then requests
+    every read path `repeat` times. Returns the measurements of the writes and of every read path,
+    and the queries of every read path which no index serves.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("TRUNCATE {}, {}".format(BuildHistory._meta.db_table, LatestBuild._meta.db_table))
+    apply_indexes(indexes)
+
+    phases = {}
+    with measure(phases, 'write'):
+        for start in range(0, len(build_objects), batch_size):
+            BuildHistory.buildbot2_upsert(build_objects[start:start + batch_size])
+    phases['write']['builds_per_second'] = round(len(build_objects) / phases['write']['wall_time'], 1)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE {}".format(BuildHistory._meta.db_table))
+
+    client = Client()
+    reads = {}
+    unindexed_queries = {}
+    for name, url, params in get_read_paths(port_names):
+        latencies = []
+        for attempt in range(repeat):
+            queries = []
+            # the query log of the connection is reset by every request, the queries are recorded as they run
+            with connection.execute_wrapper(record_query(queries)):
+                start = time.perf_counter()
+                response = client.get(url, params)
+                latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError("{} responded with {}".format(name, response.status_code))
+        reads[name] = {
+            'median_latency': round(statistics.median(latencies), 4),
+            'queries': len(queries),
+            'query_time': round(sum(query_time for sql, query_time in queries), 4),
+        }
+        unindexed_queries[name] = get_unindexed_queries([sql for sql, query_time in queries])
+
+    return {
+        'indexes': indexes,
+        'write': phases['write'],
+        'reads': reads,
+        'unindexed_queries': unindexed_queries,
+    }
+
+
+def run_benchmark(builds, ports, seed=0, batch_size=500, repeat=5):
+    """
+    Benchmarks the index set declared by the migrations ("current") against the index set it has replaced
+    ("previous") on the same synthetic build history, in the current database, whose builds are deleted.
+    """
+    current_indexes = get_index_definitions()
+    build_objects = generate_build_objects(builds, ports, seed)
+    port_names = ['port{}'.format(rank) for rank in range(ports)]
+
+    for build_object in build_objects[::max(1, builds // 100)] + build_objects[-1:]:
+        month = partitions.get_month(datetime.datetime.fromtimestamp(build_object['started_at'], tz=datetime.timezone.utc))
+        if month not in partitions.get_partitions():
+            partitions.create_partition(month)
+    Port.objects.bulk_create([Port(name=name) for name in [port_names[0], port_names[-1]] if not Port.objects.filter(name=name).exists()])
+    Builder.objects.clear_ids_cache()
+
+    try:
+        configurations = {
+            'previous': benchmark_indexes(PREVIOUS_INDEXES, build_objects, port_names, batch_size, repeat),
+            'current': benchmark_indexes(current_indexes, build_objects, port_names, batch_size, repeat),
+        }
+    finally:
+        apply_indexes(current_indexes)
+
+    return {
+        'seed': seed,
+        'builds': builds,
+        'ports': ports,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'configurations': configurations,
+    }
+
+
+def compare_configurations(report, old='previous', new='current'):
+    # yields the relative change of the write throughput and of the latency of every read path
+    old_configuration, new_configuration = report['configurations'][old], report['configurations'][new]
+    old_value, value = old_configuration['write']['builds_per_second'], new_configuration['write']['builds_per_second']
+    yield 'write', 'builds_per_second', old_value, value, (value - old_value) / old_value
+    for name, measurements in new_configuration['reads'].items():
+        old_value, value = old_configuration['reads'][name]['median_latency'], measurements['median_latency']
+        yield name, 'median_latency', old_value, value, (value - old_value) / old_value
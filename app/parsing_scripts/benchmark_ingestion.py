@@ -0,0 +1,107 @@
+import os
+import time
+from contextlib import contextmanager
+
+from port.models import Port
+from port.instrumentation import count_queries, get_peak_memory
+from category.models import Category
+from maintainer.models import Maintainer
+from parsing_scripts.portindex_json import PortIndexReader
+from parsing_scripts.synthetic_portindex import generate_ports, write_portindex_json
+
+
+@contextmanager
+def measure(phases, name):
+    """
+    Records the wall time and the number and time of SQL queries of the block into phases[name],
+    with the peak memory of the process at its end, as the reports of update-portinfo do.
+    Memory allocations are not traced, which would slow down the block being timed.
+    """
+    measurements = {'queries': 0, 'query_time': 0.0}
+    start = time.perf_counter()
+    with count_queries(measurements):
+        yield
+    wall_time = time.perf_counter() - start
+
+    phases[name] = {
+        'wall_time': round(wall_time, 3),
+        'queries': measurements['queries'],
+        'query_time': round(measurements['query_time'], 3),
+        'peak_memory': get_peak_memory(),
+    }
+
+
+def get_updated_portdirs(old_ports, new_ports):
+    # portdirs containing a port which has changed, been added or been removed, mapped to
+    # the names of their ports in the new revision, as expected by Port.mark_deleted
+    old_ports = {port['name']: port for port in old_ports}
+    new_names = set(port['name'] for port in new_ports)
+    updated_portdirs = set(port['portdir'].lower() for name, port in old_ports.items() if name not in new_names)
+    for port in new_ports:
+        if old_ports.get(port['name']) != port:
+            updated_portdirs.add(port['portdir'].lower())
+
+    dict_of_portdirs_with_ports = {portdir: set() for portdir in updated_portdirs}
+    for port in new_ports:
+        if port['portdir'].lower() in updated_portdirs:
+            dict_of_portdirs_with_ports[port['portdir'].lower()].add(port['name'].lower())
+    return dict_of_portdirs_with_ports
+
+
+def benchmark_size(count, seed, directory):
+    """
+    Runs a full and an incremental ingestion of `count` synthetic ports against the
+    current database, which is emptied first. Returns the measurements of every phase.
+    """
+    Port.objects.all().delete()
+    Category.objects.all().delete()
+    Maintainer.objects.all().delete()
+
+    ports = generate_ports(count, seed=seed)
+    updated_ports = generate_ports(count, seed=seed, revision=1)
+    path = os.path.join(directory, 'portindex-{}.json'.format(count))
+    write_portindex_json(path, ports, 'synthetic-0')
+
+    phases = {}
+    with measure(phases, 'full_ingestion'):
+        Port.add_or_update(PortIndexReader(path))
+    with measure(phases, 'full_mark_deleted'):
+        Port.mark_deleted_full_run(PortIndexReader(path))
+    with measure(phases, 'full_ingestion_unchanged'):
+        Port.add_or_update(PortIndexReader(path), skip_unchanged=True)
+
+    dict_of_portdirs_with_ports = get_updated_portdirs(ports, updated_ports)
+    ports_to_be_updated_json = [port for port in updated_ports if port['portdir'].lower() in dict_of_portdirs_with_ports]
+    with measure(phases, 'incremental_mark_deleted'):
+        Port.mark_deleted(dict_of_portdirs_with_ports)
+    with measure(phases, 'incremental_ingestion'):
+        Port.add_or_update(ports_to_be_updated_json, skip_unchanged=True)
+
+    return {
+        'ports': count,
+        'updated_portdirs': len(dict_of_portdirs_with_ports),
+        'phases': phases,
+    }
+
+
+def run_benchmark(sizes, seed, directory):
+    return {
+        'seed': seed,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'runs': [benchmark_size(count, seed, directory) for count in sizes],
+    }
+
+
+def compare_reports(old_report, new_report):
+    # yields the relative change of every measurement present in both reports
+    old_runs = {run['ports']: run for run in old_report.get('runs', [])}
+    for run in new_report['runs']:
+        old_run = old_runs.get(run['ports'])
+        if old_run is None:
+            continue
+        for phase, measurements in run['phases'].items():
+            for key, value in measurements.items():
+                old_value = old_run['phases'].get(phase, {}).get(key)
+                if not old_value:
+                    continue
+                yield run['ports'], phase, key, old_value, value, (value - old_value) / old_value
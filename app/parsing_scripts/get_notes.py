@@ -1,27 +1,28 @@
-import io
-import subprocess
-
 from port.models import Port
+from parsing_scripts.port_command import get_active_ports, get_batches, run_port_command_batched
+import config
 
 
 def get_notes_all_ports():
-    # Limiting the fields that are selected
-    # This ensures that the updated_at field does not get updated
-    # Because changes to a port's notes are not considered as an update
-    for port in Port.objects.all().only('name', 'notes'):
-        get_notes(port)
-    return
-
-
-def get_notes(port):
-    try:
-        output = subprocess.run(["port", "notes", port.name], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        result = output.stdout.decode('utf-8')
-    except OSError:
-        return
+    return get_notes_ports(Port.objects.all())
 
-    result_lines = io.StringIO(result)
 
-    # maintain linebreaks in the field that is saved to database using
-    port.notes = "<br>".join(result_lines)
-    port.save()
+def get_notes_ports(ports, batch_size=None):
+    # Only the notes are written with bulk_update, which does not touch the updated_at field,
+    # because changes to a port's notes are not considered as an update.
+    # Returns the number of ports whose notes have changed.
+    batch_size = batch_size or config.PORT_COMMAND_BATCH_SIZE
+    updated = 0
+    for batch in get_batches(get_active_ports(ports, 'id', 'name', 'notes'), batch_size):
+        ports_by_name = {port.name.lower(): port for port in batch}
+        changed = []
+        for name, lines in run_port_command_batched('notes', ports_by_name):
+            port = ports_by_name[name]
+            # maintain linebreaks in the field that is saved to database using
+            notes = "<br>".join(lines)
+            if port.notes != notes:
+                port.notes = notes
+                changed.append(port)
+        Port.objects.bulk_update(changed, ['notes'])
+        updated += len(changed)
+    return updated
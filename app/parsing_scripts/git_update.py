@@ -4,10 +4,13 @@ import sys
 import io
 import shutil
 import json
+import tempfile
 
 import django
 
 from port.models import LastPortIndexUpdate
+from port.instrumentation import RunReport
+from parsing_scripts.portindex_json import PortIndexReader
 import config
 from settings import BASE_DIR
 
@@ -30,7 +33,7 @@ def rebuild_repo(directory, url, name):
     subprocess.run([config.GIT, 'clone', '--quiet', url, name])
 
 
-def refresh_portindex_json():
+def update_repos():
     # check if the contrib repo is available
     if not os.path.isdir(config.MACPORTS_CONTRIB_DIR):
         rebuild_repo(config.MACPORTS_CONTRIB_DIR, config.MACPORTS_CONTRIB_URL, config.MACPORTS_CONTRIB)
@@ -53,25 +56,111 @@ def refresh_portindex_json():
 
     # update the ports repo
     subprocess.call([config.GIT, 'pull', '--quiet'])
-    latest_commit = subprocess.run([config.GIT, 'rev-parse', 'HEAD'], stdout=subprocess.PIPE).stdout.decode('utf-8')
+    latest_commit = subprocess.run([config.GIT, 'rev-parse', 'HEAD'], stdout=subprocess.PIPE).stdout.decode('utf-8').strip()
+
+    os.chdir(BASE_DIR)
+    return latest_commit
 
-    # update/generate the portindex
-    subprocess.run(['portindex', '-p', 'macosx_19_i386', '-x'])
 
-    # update/generate portindex.json
-    portindexjson = subprocess.run([config.TCLSH, config.PORTINDEX2JSON, config.LOCAL_PORTINDEX, '--info', 'commit={}'.format(latest_commit)], stdout=subprocess.PIPE).stdout.decode('utf-8')
-    portindexjson = json.loads(portindexjson)
-    with open(config.LOCAL_PORTINDEX_JSON, 'w') as file:
-        json.dump(portindexjson, file)
+def generate_portindex_json(directory, json_path, commit):
+    # update/generate the PortIndex of the ports tree in the directory
+    subprocess.run([config.PORTINDEX, '-p', config.PORTINDEX_PLATFORM, '-x'], cwd=directory)
+
+    # update/generate portindex.json, the output of portindex2json is written to the file
+    # as it is produced instead of being held in memory
+    with open(json_path, 'w', encoding='utf-8') as file:
+        subprocess.run([config.TCLSH, config.PORTINDEX2JSON, os.path.join(directory, 'PortIndex'), '--info', 'commit={}'.format(commit)], stdout=file)
 
     # match the latest commit from the repo and the portindex.json match
-    if latest_commit != portindexjson.get('info', {}).get('commit'):
+    try:
+        portindex_info = PortIndexReader(json_path).read_info()
+    except json.decoder.JSONDecodeError:
+        portindex_info = {}
+    if commit != portindex_info.get('commit'):
         # if they don't match, we should abort the operation
         raise KeyError
 
+
+def refresh_portindex_json(report=None):
+    report = report or RunReport()
+    with report.phase('git_pull'):
+        latest_commit = update_repos()
+
+    regenerate_portindex_json(latest_commit, report)
     return latest_commit
 
 
+def regenerate_portindex_json(latest_commit, report):
+    # the whole tree is indexed, there are no separately regenerated ports
+    if os.path.isfile(config.LOCAL_PORTINDEX_CHANGES_JSON):
+        os.remove(config.LOCAL_PORTINDEX_CHANGES_JSON)
+    with report.phase('portindex'):
+        generate_portindex_json(config.MACPORTS_PORTS_DIR, config.LOCAL_PORTINDEX_JSON, latest_commit)
+
+
+def refresh_portindex_json_incremental(old_commit, report=None):
+    """
+    Updates the repositories and regenerates portindex.json only for the portdirs changed since old_commit.
+
+    The changed portdirs are linked into a temporary ports tree, which is indexed on its own.
+    Their ports are written to LOCAL_PORTINDEX_CHANGES_JSON and merged into the cached
+    LOCAL_PORTINDEX_JSON, replacing all the ports previously found in those portdirs.
+    The whole tree is indexed instead if there is no cached portindex.json yet, or if
+    _resources (e.g. a PortGroup) has changed, which can affect any port.
+    Returns the latest commit and the set of changed portdirs.
+    """
+    report = report or RunReport()
+    with report.phase('git_pull'):
+        latest_commit = update_repos()
+    with report.phase('git_diff') as phase:
+        portdirs = get_changed_portdirs(old_commit, latest_commit)
+        phase['rows'] = len(portdirs)
+
+    if not os.path.isfile(config.LOCAL_PORTINDEX_JSON) or any(portdir.startswith('_resources/') for portdir in portdirs):
+        regenerate_portindex_json(latest_commit, report)
+        return latest_commit, portdirs
+
+    with tempfile.TemporaryDirectory(dir=config.DATA_DIR) as directory:
+        os.symlink(os.path.join(config.MACPORTS_PORTS_DIR, '_resources'), os.path.join(directory, '_resources'))
+        for portdir in portdirs:
+            source = os.path.join(config.MACPORTS_PORTS_DIR, portdir)
+            # deleted portdirs are not regenerated, their ports are just dropped from the index
+            if not os.path.isfile(os.path.join(source, 'Portfile')):
+                continue
+            os.makedirs(os.path.join(directory, os.path.dirname(portdir)), exist_ok=True)
+            os.symlink(source, os.path.join(directory, portdir))
+
+        with report.phase('portindex'):
+            generate_portindex_json(directory, config.LOCAL_PORTINDEX_CHANGES_JSON, latest_commit)
+
+    with report.phase('merge_portindex'):
+        merge_portindex_json(config.LOCAL_PORTINDEX_JSON, config.LOCAL_PORTINDEX_CHANGES_JSON, portdirs)
+    return latest_commit, portdirs
+
+
+def merge_portindex_json(path, changes_path, portdirs):
+    # The ports of the changed portdirs are replaced by the ports found in the JSON of the changes,
+    # the merged file is written next to the cached one and moved over it once it is complete.
+    portdirs = set(portdir.lower() for portdir in portdirs)
+    changes = PortIndexReader(changes_path)
+    merged_path = path + '.tmp'
+
+    with open(merged_path, 'w', encoding='utf-8') as file:
+        file.write('{"ports": [\n')
+        separator = ''
+        for port in PortIndexReader(path):
+            if port['portdir'].lower() in portdirs:
+                continue
+            file.write(separator + json.dumps(port))
+            separator = ',\n'
+        for port in changes:
+            file.write(separator + json.dumps(port))
+            separator = ',\n'
+        file.write('\n], "info": {}}}\n'.format(json.dumps(changes.info)))
+
+    os.replace(merged_path, path)
+
+
 def get_old_commit():
     # first search in database
     old_commit_obj = LastPortIndexUpdate.objects.all().first()
@@ -83,41 +172,46 @@ def get_old_commit():
     return old_commit
 
 
-def get_updated_portdirs():
-    # update portindex.json and get new commit
-    new_commit = refresh_portindex_json()
-    old_commit = get_old_commit()
-
-    # cd into the ports repository
-    os.chdir(config.MACPORTS_PORTS_DIR)
-
+def get_changed_portdirs(old_commit, new_commit):
     # generate the range of commits to find updated paths
     range_commits = str(old_commit).strip() + "^.." + str(new_commit).strip()
 
-    changed_paths = subprocess.run([config.GIT, 'diff', '--name-only', range_commits], stdout=subprocess.PIPE).stdout.decode('utf-8')
+    # without rename detection both the old and the new path of a moved port are listed
+    changed_paths = subprocess.run([config.GIT, 'diff', '--name-only', '--no-renames', range_commits], stdout=subprocess.PIPE, cwd=config.MACPORTS_PORTS_DIR).stdout.decode('utf-8')
     s = io.StringIO(changed_paths)
-    updated_ports_dir = set()
+    changed_portdirs = set()
 
     # loop over all the paths and find portdirs to update
     for line in s:
-        sections = line.split('/')
+        sections = line.strip().split('/')
         if len(sections) < 2:
             # ignore updates in the root directory
             continue
-        portdir = sections[0].lower() + '/' + sections[1].lower()
-        updated_ports_dir.add(portdir)
+        changed_portdirs.add(sections[0] + '/' + sections[1])
 
-    os.chdir(BASE_DIR)
-    return updated_ports_dir
+    return changed_portdirs
+
+
+def get_updated_portdirs(report=None):
+    # update portindex.json and get the portdirs changed since the last update
+    old_commit = get_old_commit()
+    new_commit, changed_portdirs = refresh_portindex_json_incremental(old_commit, report)
+
+    return set(portdir.lower() for portdir in changed_portdirs)
 
 
 def get_portindex_json():
+    # The returned reader yields the JSON objects of ports one by one, the file is parsed
+    # while iterating and a json.decoder.JSONDecodeError is raised then if it is invalid.
     if os.path.isfile(config.LOCAL_PORTINDEX_JSON):
-        with open(config.LOCAL_PORTINDEX_JSON, "r", encoding='utf-8') as file:
-            try:
-                data = json.load(file)
-            except json.decoder.JSONDecodeError:
-                data = None
-        return data
+        return PortIndexReader(config.LOCAL_PORTINDEX_JSON)
     else:
         return None
+
+
+def get_updated_portindex_json():
+    # The JSON of the ports regenerated by the last incremental update, if the whole
+    # tree has been indexed instead, the complete portindex.json is returned.
+    if os.path.isfile(config.LOCAL_PORTINDEX_CHANGES_JSON):
+        return PortIndexReader(config.LOCAL_PORTINDEX_CHANGES_JSON)
+    return get_portindex_json()
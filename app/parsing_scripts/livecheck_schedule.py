@@ -0,0 +1,66 @@
+import datetime
+import heapq
+import math
+
+from django.db.models import Count, Subquery
+from django.db.models.functions import Lower
+
+from port.models import Port
+from stats.models import Submission, PortInstallation
+import config
+
+
+def get_install_counts(days):
+    # number of users who have installed each port, from their latest submission of the last `days` days,
+    # the same way the statistics of a port are counted
+    last_x_days = datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=days)
+    submissions = Submission.objects.filter(timestamp__gte=last_x_days).order_by('user', '-timestamp').distinct('user')
+    installations = PortInstallation.objects.filter(submission_id__in=Subquery(submissions.values('id')))\
+        .values(name=Lower('port'))\
+        .annotate(count=Count('submission__user_id'))
+    return {installation['name']: installation['count'] for installation in installations}
+
+
+def get_interval(port, install_count):
+    """
+    Returns the number of seconds after which the livecheck of a port is due again.
+
+    Ports installed by many users are checked more often. A port already known to be outdated, or whose
+    livecheck failed, is checked less often, unless its version has changed since its last livecheck.
+    """
+    interval = config.LIVECHECK_INTERVAL_DAYS * 24 * 60 * 60 / (1 + math.log2(1 + install_count))
+    if port['livecheck__has_updates']:
+        interval *= config.LIVECHECK_OUTDATED_BACKOFF
+    if port['livecheck__error']:
+        interval *= config.LIVECHECK_ERROR_BACKOFF
+    return interval
+
+
+def get_priority(port, install_count, now):
+    # ports never checked come first, then the ports updated by an ingestion since their last livecheck,
+    # then the rest by how overdue they are, i.e. the time since their livecheck relative to their interval
+    checked_at = port['livecheck__updated_at']
+    if checked_at is None:
+        return 2, install_count
+    if port['version_updated_at'] is not None and port['version_updated_at'] > checked_at:
+        return 1, install_count
+    return 0, (now - checked_at).total_seconds() / get_interval(port, install_count)
+
+
+def get_scheduled_ports(budget, now=None):
+    """
+    Returns the `budget` active ports whose livecheck is the most due, the most urgent first.
+    """
+    now = now or datetime.datetime.now(tz=datetime.timezone.utc)
+    install_counts = get_install_counts(config.LIVECHECK_POPULARITY_DAYS)
+
+    ports = Port.objects.filter(active=True).values(
+        'id', 'name', 'version_updated_at', 'livecheck__updated_at', 'livecheck__has_updates', 'livecheck__error'
+    ).iterator()
+
+    scheduled = heapq.nlargest(
+        budget,
+        ports,
+        key=lambda port: get_priority(port, install_counts.get(port['name'].lower(), 0), now)
+    )
+    return [Port(id=port['id'], name=port['name']) for port in scheduled]
@@ -1,41 +1,45 @@
-import io
-import subprocess
-
 from port.models import Port
+from variant.models import Variant
+from parsing_scripts.port_command import get_active_ports, get_batches, run_port_command_batched
+import config
 
 
 def populate_variant_descriptions_all_ports():
-    for port in Port.objects.all().only('id', 'name'):
-        poulate_variant_descriptions(port)
-    return
-
-
-def populate_variant_descriptions_ports(ports):
-    for port in ports:
-        poulate_variant_descriptions(port)
-    return
-
-
-def poulate_variant_descriptions(port):
-    try:
-        output = subprocess.run(["port", "variants", port.name], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        result = output.stdout.decode('utf-8')
-    except OSError:
-        return
-
-    result_lines = io.StringIO(result)
-    cached_variants = port.variants.all()
-    for line in result_lines:
+    return populate_variant_descriptions_ports(Port.objects.all())
+
+
+def populate_variant_descriptions_ports(ports, batch_size=None):
+    # Returns the number of variants whose description has changed
+    batch_size = batch_size or config.PORT_COMMAND_BATCH_SIZE
+    updated = 0
+    for batch in get_batches(get_active_ports(ports, 'id', 'name'), batch_size):
+        port_ids = {port.name.lower(): port.id for port in batch}
+        variants = {}
+        for variant in Variant.objects.filter(port_id__in=port_ids.values()).only('id', 'port_id', 'variant', 'description'):
+            variants.setdefault(variant.port_id, {})[variant.variant] = variant
+
+        changed = {}
+        for name, lines in run_port_command_batched('variants', port_ids):
+            for variant, description in parse_variant_descriptions(lines, variants.get(port_ids[name], {})):
+                if variant.description != description:
+                    variant.description = description
+                    changed[variant.id] = variant
+        Variant.objects.bulk_update(changed.values(), ['description'])
+        updated += len(changed)
+    return updated
+
+
+def parse_variant_descriptions(lines, variants):
+    # yields the variants of a port found in the lines of `port variants` with their description,
+    # a line looks like "[+]universal: Build for multiple architectures", "[+]" marking a default variant
+    for line in lines:
         line = line.strip()
-        for variant in cached_variants:
-            search_string = "{}:".format(variant.variant)
-
-            if line.startswith("[+]{}".format(search_string)):
-                variant.description = "[default] {}".format(line[len(search_string) + 4:])
-                variant.save()
-                break
-
-            if line.startswith(search_string):
-                variant.description = line[len(search_string)+1:]
-                variant.save()
-                break
+        is_default = line.startswith("[+]")
+        if is_default:
+            line = line[3:]
+        name, separator, description = line.partition(':')
+        variant = variants.get(name) if separator else None
+        if variant is None:
+            continue
+        description = description[1:]
+        yield variant, "[default] {}".format(description) if is_default else description
@@ -0,0 +1,68 @@
+import io
+import subprocess
+
+from django.db.models import QuerySet
+
+from port.models import Port
+import config
+
+
+def get_active_ports(ports, *fields):
+    # ports can be a queryset or any iterable of ports, those deleted are unknown to the port command
+    if not isinstance(ports, QuerySet):
+        ports = Port.objects.filter(id__in=[port.id for port in ports])
+    return ports.filter(active=True).only(*fields).iterator()
+
+
+def get_batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_port_command_batched(command, names):
+    """
+    Runs `port <command> <name> <name> ...` and yields the lower-cased name of every port with the lines
+    of the output about it, as the output is read.
+
+    The output of notes and variants about a port starts with a line "<name> has ...", the lines up to the
+    next such line of another given port belong to it.
+
+    The command is run with -p to carry on past the ports it fails on, as a port it does not know stops an
+    action over several ports otherwise. The ports of a batch the command has printed nothing about are run
+    again one at a time, so that a failing port can only lose its own output. Ports the command has still
+    printed nothing about are left out.
+    """
+    names = {name.lower(): name for name in names}
+    try:
+        process = subprocess.Popen([config.PORT_COMMAND, '-p', command, *names.values()],
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return
+
+    found = set()
+    with process:
+        current = None
+        lines = []
+        for line in io.TextIOWrapper(process.stdout, encoding='utf-8'):
+            name, separator, rest = line.partition(' has ')
+            if separator and name.lower() in names:
+                if current is not None:
+                    yield current, lines
+                current = name.lower()
+                found.add(current)
+                lines = []
+            if current is not None:
+                lines.append(line)
+        if current is not None:
+            yield current, lines
+
+    if len(names) > 1:
+        for name in names:
+            if name not in found:
+                yield from run_port_command_batched(command, [names[name]])
@@ -0,0 +1,115 @@
+import json
+
+# number of characters read from the underlying file at a time
+CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = ' \t\n\r'
+
+
+class PortIndexReader:
+    """
+    Incrementally parses a PortIndex JSON document of the form {"info": {...}, "ports": [...]}.
+
+    Iterating over the reader yields one JSON object of a port at a time, so only a small
+    window of the document is held in memory. The source can be a path or any text stream,
+    e.g. the stdout of portindex2json. The "info" member is available in `info` once it has
+    been passed, it may appear either before or after the ports.
+    """
+
+    def __init__(self, source, chunk_size=CHUNK_SIZE):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.info = {}
+        self.decoder = json.JSONDecoder()
+        self.file = None
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def __iter__(self):
+        if isinstance(self.source, str):
+            with open(self.source, 'r', encoding='utf-8') as file:
+                yield from self.read_ports(file)
+        else:
+            yield from self.read_ports(self.source)
+
+    def read_info(self):
+        # the info member can follow the ports, the rest of the document is consumed to find it
+        for port in self:
+            pass
+        return self.info
+
+    def read_ports(self, file):
+        self.file = file
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+        self.expect('{')
+        if self.peek() == '}':
+            return
+
+        while True:
+            key = self.decode_value()
+            self.expect(':')
+            if key == 'ports':
+                yield from self.read_array()
+            elif key == 'info':
+                self.info = self.decode_value()
+            else:
+                self.decode_value()
+
+            if self.expect(',}') == '}':
+                return
+
+    def read_array(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+
+        while True:
+            yield self.decode_value()
+            if self.expect(',]') == ']':
+                return
+
+    def fill(self):
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+
+        # drop the part of the buffer which has already been parsed
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                raise json.JSONDecodeError("Unexpected end of PortIndex JSON", self.buffer, self.position)
+
+    def expect(self, characters):
+        character = self.peek()
+        if character not in characters:
+            raise json.JSONDecodeError("Expecting one of '{}'".format(characters), self.buffer, self.position)
+        self.position += 1
+        return character
+
+    def decode_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # a value touching the end of the buffer could be truncated (e.g. a number)
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
@@ -1,38 +1,156 @@
 import io
+import os
+import signal
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.db import transaction
+from django.utils import timezone
 
 from port.models import Port, LiveCheck
+import config
+
+
+LIVECHECK_FIELDS = ['result', 'error', 'has_updates', 'updated_at']
+
+
+def run_livecheck_all(workers=None, timeout=None, retries=None, batch_size=None):
+    ports = Port.objects.all().only('id', 'name').order_by('id')
+    return run_livecheck_ports(ports, workers, timeout, retries, batch_size)
+
+
+def run_livecheck_ports(ports, workers=None, timeout=None, retries=None, batch_size=None, window=None):
+    """
+    Runs `port livecheck` for the given ports with a pool of `workers` concurrent subprocesses.
+
+    A livecheck which does not finish within `timeout` seconds is killed and tried again up to
+    `retries` times. The results are written back `batch_size` ports at a time, in the order the
+    livechecks finish. Ports are started in the given order, and when `window` is given, those not
+    started within `window` seconds are skipped. A livecheck which fails unexpectedly is written with the
+    exception as its error. Returns the number of ports whose LiveCheck has been written.
+    """
+    workers = workers or config.LIVECHECK_WORKERS
+    timeout = timeout or config.LIVECHECK_TIMEOUT
+    retries = config.LIVECHECK_RETRIES if retries is None else retries
+    batch_size = batch_size or config.LIVECHECK_BATCH_SIZE
+    deadline = None if window is None else time.monotonic() + window
+
+    def run(name):
+        if deadline is not None and time.monotonic() > deadline:
+            return None
+        return run_livecheck_port(name, timeout, retries)
+
+    written = 0
+    results = {}
+    ports = iter(ports)
+    running = {}
+    # the workers only wait for their subprocess, threads are enough to keep them busy
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            # only a few ports per worker are queued, the others are not started once the window is over
+            while len(running) < 2 * workers and (deadline is None or time.monotonic() <= deadline):
+                port = next(ports, None)
+                if port is None:
+                    break
+                running[executor.submit(run, port.name)] = port.id
+            if not running:
+                break
+
+            for future in wait(running, return_when=FIRST_COMPLETED).done:
+                port_id = running.pop(future)
+                try:
+                    livecheck = future.result()
+                except Exception as e:
+                    livecheck = {
+                        'result': None,
+                        'error': "Error: livecheck failed: {}\n".format(e),
+                        'has_updates': False,
+                    }
+                if livecheck is None:
+                    continue
+                results[port_id] = livecheck
+                if len(results) >= batch_size:
+                    written += write_livechecks(results)
+                    results = {}
+    written += write_livechecks(results)
+    return written
+
 
+def run_livecheck_port(name, timeout=None, retries=0):
+    # returns the fields of the LiveCheck of the port, or None if the port command could not be run
+    timeout = timeout or config.LIVECHECK_TIMEOUT
+    for attempt in range(retries + 1):
+        try:
+            output = run_port_command(['livecheck', name], timeout)
+        except subprocess.TimeoutExpired:
+            continue
+        except OSError:
+            return None
+        return parse_livecheck_output(name, *output)
 
-def run_livecheck_all():
-    for port in Port.objects.all().only('id', 'name'):
-        run_livecheck_port(port)
-    return
+    return {
+        'result': None,
+        'error': "Error: livecheck timed out after {} seconds\n".format(timeout),
+        'has_updates': False,
+    }
 
 
-def run_livecheck_port(port):
+def run_port_command(arguments, timeout):
+    # The command runs in a session of its own, so that the processes it has started (e.g. curl)
+    # are killed along with it on a timeout and cannot hold its output open.
+    process = subprocess.Popen([config.PORT_COMMAND, *arguments], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               start_new_session=True)
     try:
-        output = subprocess.run(["port", "livecheck", port.name], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        result = output.stdout.decode('utf-8')
-        error = output.stderr.decode('utf-8')
-    except OSError:
-        return
-    result_lines = io.StringIO(result)
-    error_lines = io.StringIO(error)
-
-    # Get or create the Livecheck object and initialise values
-    obj, created = LiveCheck.objects.get_or_create(port_id=port.id)
-    obj.result = None
-    obj.error = None
-    obj.has_updates = False
-
-    for line in result_lines:
-        if line.startswith(port.name + " seems to"):
-            obj.result = line
-            obj.has_updates = True
-
-    for line in error_lines:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.communicate()
+        raise
+    return stdout.decode('utf-8'), stderr.decode('utf-8')
+
+
+def parse_livecheck_output(name, result, error):
+    livecheck = {
+        'result': None,
+        'error': None,
+        'has_updates': False,
+    }
+
+    for line in io.StringIO(result):
+        if line.startswith(name + " seems to"):
+            livecheck['result'] = line
+            livecheck['has_updates'] = True
+
+    for line in io.StringIO(error):
         if line.startswith("Error:"):
-            obj.error = line
-    obj.save()
-    return
+            livecheck['error'] = line
+
+    return livecheck
+
+
+def write_livechecks(results):
+    # results maps the ids of ports to the fields of their LiveCheck, the existing rows
+    # are updated and the missing ones created, with one query each
+    if not results:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        # ports deleted while their livecheck was running are skipped
+        port_ids = set(Port.objects.filter(id__in=results.keys()).values_list('id', flat=True))
+        existing = dict(LiveCheck.objects.filter(port_id__in=port_ids).values_list('port_id', 'id'))
+
+        updated = []
+        created = []
+        for port_id in port_ids:
+            livecheck = LiveCheck(id=existing.get(port_id), port_id=port_id, updated_at=now, **results[port_id])
+            if livecheck.id is None:
+                created.append(livecheck)
+            else:
+                updated.append(livecheck)
+
+        LiveCheck.objects.bulk_update(updated, LIVECHECK_FIELDS)
+        LiveCheck.objects.bulk_create(created)
+
+    return len(port_ids)
@@ -0,0 +1,123 @@
+import json
+import random
+
+CATEGORIES = [
+    'aqua', 'archivers', 'audio', 'databases', 'devel', 'editors', 'emulators', 'games', 'gnome',
+    'graphics', 'java', 'lang', 'law', 'mail', 'math', 'multimedia', 'net', 'office', 'perl',
+    'php', 'python', 'ruby', 'science', 'security', 'shells', 'sysutils', 'tex', 'textproc',
+    'www', 'x11',
+]
+
+VARIANTS = ['universal', 'debug', 'docs', 'tests', 'x11', 'quartz', 'python38', 'python39', 'openssl', 'gcc10']
+
+LICENSES = ['MIT', 'BSD', 'GPL-2+', 'GPL-3+', 'LGPL-2.1+', 'Apache-2', 'PSF', 'ZPL', 'Permissive']
+
+# types of dependencies with their relative frequency
+DEPENDENCY_TYPES = [('lib', 6), ('build', 3), ('run', 2), ('fetch', 1), ('extract', 1), ('test', 1)]
+
+# share of the portdirs which also contain subports
+SUBPORT_RATE = 0.1
+
+
+def generate_ports(count, seed=0, revision=0, change_rate=0.01, delete_rate=0.001):
+    """
+    Generates `count` JSON objects of ports in the format of portindex2json.
+
+    The ports are deterministic for a seed. A port depends on ports generated before it, a few
+    of which are picked much more often than the rest, like the common libraries of the real tree.
+    Every revision after 0 bumps the version of `change_rate` of the ports and removes
+    `delete_rate` of them, to simulate the ports tree moving on between two updates.
+    """
+    rng = random.Random(seed)
+    maintainers = [generate_maintainer(i) for i in range(max(1, count // 8))]
+
+    names = []
+    ports = []
+    while len(ports) < count:
+        index = len(names)
+        category = CATEGORIES[rng.randrange(len(CATEGORIES))]
+        name = 'port{}'.format(index)
+        portdir = '{}/{}'.format(category, name)
+        subports = [name]
+        if rng.random() < SUBPORT_RATE:
+            subports += ['{}-{}'.format(name, variant) for variant in ('py38', 'py39')]
+
+        for port_name in subports[:count - len(ports)]:
+            names.append(port_name)
+            ports.append(generate_port(rng, port_name, portdir, category, maintainers, names))
+
+    for revisions in range(1, revision + 1):
+        rng = random.Random('{}-{}'.format(seed, revisions))
+        for port in ports:
+            if rng.random() < change_rate:
+                port['version'] = bump_version(port['version'])
+        ports = [port for port in ports if rng.random() >= delete_rate]
+
+    return ports
+
+
+def generate_maintainer(index):
+    return {
+        'email': {
+            'domain': 'example.org',
+            'name': 'maintainer{}'.format(index)
+        },
+        'github': 'maintainer{}'.format(index)
+    }
+
+
+def generate_port(rng, name, portdir, category, maintainers, names):
+    port = {
+        'name': name,
+        'portdir': portdir,
+        'version': '{}.{}.{}'.format(rng.randrange(10), rng.randrange(20), rng.randrange(10)),
+        'revision': str(rng.choice([0, 0, 0, 1, 2])),
+        'epoch': '0',
+        'platforms': 'darwin',
+        'description': 'Synthetic port {} in {}'.format(name, category),
+        'long_description': 'Synthetic port {} generated for benchmarking the ingestion of the PortIndex.'.format(name),
+        'homepage': 'https://example.org/{}'.format(name),
+        'license': rng.sample(LICENSES, rng.choice([1, 1, 1, 2])),
+        'categories': [category] + rng.sample(CATEGORIES, rng.choice([0, 0, 1, 2])),
+    }
+
+    # about a fifth of the ports have no maintainer
+    maintainers_count = min(len(maintainers), rng.choice([0, 1, 1, 1, 2]))
+    if maintainers_count:
+        port['maintainers'] = rng.sample(maintainers, maintainers_count)
+
+    variants = rng.sample(VARIANTS, rng.choice([0, 1, 1, 2, 3, 4]))
+    if variants:
+        port['variants'] = variants
+        port['vinfo'] = [{'variant': variant, 'description': 'Enable {}'.format(variant)} for variant in variants]
+        if rng.random() < 0.2:
+            port['vinfo'][0]['is_default'] = True
+
+    # dependencies on the ports generated so far, squaring the random number favours the
+    # earliest ports, which end up with a large number of dependents
+    if len(names) > 1:
+        for dependency_type, weight in DEPENDENCY_TYPES:
+            dependencies_count = min(len(names) - 1, int(rng.expovariate(1) * weight / 2))
+            if dependencies_count == 0:
+                continue
+            dependencies = set(names[int(rng.random() ** 2 * (len(names) - 1))] for _ in range(dependencies_count))
+            port['depends_' + dependency_type] = ['port:{}'.format(dependency) for dependency in sorted(dependencies)]
+
+    return port
+
+
+def bump_version(version):
+    parts = version.split('.')
+    parts[-1] = str(int(parts[-1]) + 1)
+    return '.'.join(parts)
+
+
+def write_portindex_json(path, ports, commit):
+    # ports are written one by one, the same way portindex2json streams them
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('{"ports": [\n')
+        for index, port in enumerate(ports):
+            if index > 0:
+                file.write(',\n')
+            file.write(json.dumps(port))
+        file.write('\n], "info": {}}}\n'.format(json.dumps({'commit': commit})))
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from port.models import Port, Dependency
+from port.models import Port, Dependency, PortIndexUpdateReport
 
 
 @admin.register(Port)
@@ -11,3 +11,8 @@ class Port(admin.ModelAdmin):
 @admin.register(Dependency)
 class Dependency(admin.ModelAdmin):
     list_display = ("port_name", "type")
+
+
+@admin.register(PortIndexUpdateReport)
+class PortIndexUpdateReport(admin.ModelAdmin):
+    list_display = ("started_at", "created_at", "type", "git_commit_hash", "duration", "ports_updated", "ports_deleted")
@@ -0,0 +1,184 @@
+from category.models import Category
+from maintainer.models import Maintainer
+from variant.models import Variant
+from port.models import Port, Dependency, DEPENDENCY_TYPES
+from port.ingestion import VARIANT_UPDATE_FIELDS, is_valid_port, get_portindex_hash, get_port_fields, \
+    get_variant_fields, get_maintainer_key
+
+
+# fields of the Port model which are set from the JSON object of a port
+COMPARED_FIELDS = ['portdir', 'version', 'description', 'homepage', 'epoch', 'platforms', 'long_description',
+                   'revision', 'closedmaintainer', 'license', 'replaced_by', 'notes']
+
+
+def get_maintainer_label(maintainer_key):
+    name, domain, github = maintainer_key
+    return github if github else "{}@{}".format(name, domain)
+
+
+def get_delta(stored, desired):
+    delta = {}
+    added = sorted(desired - stored)
+    removed = sorted(stored - desired)
+    if added:
+        delta['added'] = added
+    if removed:
+        delta['removed'] = removed
+    return delta
+
+
+class Snapshot:
+    """
+    Everything stored about the ports which an ingestion could change, read with one query per table.
+
+    When port_names is given, the categories, maintainers, variants and dependencies are read
+    only for those ports. Names are lower-cased, the same way the loader matches them.
+    """
+
+    def __init__(self, port_names=None):
+        self.ports = {}
+        self.names = {}
+        for port in Port.objects.values('id', 'name', 'active', 'portindex_hash', *COMPARED_FIELDS):
+            self.ports.setdefault(port['name'].lower(), port)
+            self.names[port['id']] = port['name'].lower()
+
+        port_ids = None
+        if port_names is not None:
+            port_ids = [self.ports[name]['id'] for name in port_names if name in self.ports]
+
+        def relation(queryset):
+            if port_ids is None:
+                return queryset
+            return queryset.filter(port_id__in=port_ids)
+
+        self.categories = {}
+        for port_id, category in relation(Category.ports.through.objects).values_list('port_id', 'category_id'):
+            self.categories.setdefault(port_id, set()).add(category.lower())
+
+        self.maintainers = {}
+        for port_id, name, domain, github in relation(Maintainer.ports.through.objects).values_list(
+                'port_id', 'maintainer__name', 'maintainer__domain', 'maintainer__github'):
+            self.maintainers.setdefault(port_id, set()).add((name.lower(), domain.lower(), github.lower()))
+
+        self.variants = {}
+        for variant in relation(Variant.objects).values('port_id', *VARIANT_UPDATE_FIELDS):
+            self.variants.setdefault(variant['port_id'], {}).setdefault(variant['variant'].lower(), variant)
+
+        self.dependencies = {}
+        dependencies = Dependency.dependencies.through.objects
+        if port_ids is not None:
+            dependencies = dependencies.filter(dependency__port_name_id__in=port_ids)
+        for port_id, dependency_type, dependency_port_id in dependencies.values_list('dependency__port_name_id', 'dependency__type', 'port_id'):
+            self.dependencies.setdefault(port_id, {}).setdefault(dependency_type, set()).add(self.names[dependency_port_id])
+
+
+def compute_changeset(ports, dict_of_portdirs_with_ports=None, skip_unchanged=True):
+    """
+    Computes the changes an ingestion of the given JSON objects of ports would make, without writing anything.
+
+    ports are all the ports of the PortIndex for a full run, or the ports of the updated portdirs
+    together with dict_of_portdirs_with_ports for an incremental run, as passed to Port.mark_deleted.
+    The ports are compared with a snapshot of the database, with skip_unchanged active ports whose
+    JSON hashes to their stored portindex_hash are not compared any further.
+    Returns a dict which can be serialized as JSON.
+    """
+    ports = [port for port in ports if is_valid_port(port)]
+    port_names = set(port['name'].lower() for port in ports)
+
+    # the relations of all the ports are compared in a full run
+    snapshot = Snapshot(None if dict_of_portdirs_with_ports is None else port_names)
+
+    # names of the ports which exist once the ports have been loaded, used to resolve dependencies
+    resolvable_names = set(snapshot.ports) | port_names
+
+    changeset = {
+        'new_ports': [],
+        'changed_ports': {},
+        'deactivated_ports': [],
+        'unchanged_ports': 0,
+    }
+    for port in ports:
+        key = port['name'].lower()
+        stored = snapshot.ports.get(key)
+        if stored is None:
+            changeset['new_ports'].append(port['name'])
+            continue
+        if skip_unchanged and stored['active'] and stored['portindex_hash'] == get_portindex_hash(port):
+            changeset['unchanged_ports'] += 1
+            continue
+
+        changes = get_port_changes(port, stored, snapshot, resolvable_names)
+        if changes:
+            changeset['changed_ports'][port['name']] = changes
+        else:
+            changeset['unchanged_ports'] += 1
+
+    # the same ports Port.mark_deleted_full_run or Port.mark_deleted would mark inactive
+    for key, stored in snapshot.ports.items():
+        if not stored['active'] or key in port_names:
+            continue
+        if dict_of_portdirs_with_ports is None:
+            changeset['deactivated_ports'].append(stored['name'])
+            continue
+        portdir = stored['portdir'].lower()
+        if portdir in dict_of_portdirs_with_ports and key not in dict_of_portdirs_with_ports[portdir]:
+            changeset['deactivated_ports'].append(stored['name'])
+
+    changeset['new_ports'].sort()
+    changeset['deactivated_ports'].sort()
+    return changeset
+
+
+def get_port_changes(port, stored, snapshot, resolvable_names):
+    changes = {}
+    port_id = stored['id']
+
+    fields = {}
+    for field, value in get_port_fields(port).items():
+        # values from JSON are converted to the type of the field, e.g. the epoch is a string in JSON
+        value = Port._meta.get_field(field).to_python(value)
+        if stored[field] != value:
+            fields[field] = [stored[field], value]
+    if not stored['active']:
+        fields['active'] = [False, True]
+    if fields:
+        changes['fields'] = fields
+
+    categories = get_delta(snapshot.categories.get(port_id, set()), set(c.lower() for c in port.get('categories', [])))
+    if categories:
+        changes['categories'] = categories
+
+    maintainers = get_delta(
+        set(get_maintainer_label(m) for m in snapshot.maintainers.get(port_id, set())),
+        set(get_maintainer_label(get_maintainer_key(m)) for m in port.get('maintainers', []))
+    )
+    if maintainers:
+        changes['maintainers'] = maintainers
+
+    stored_variants = snapshot.variants.get(port_id, {})
+    desired_variants = get_variant_fields(port)
+    variants = get_delta(set(stored_variants), set(desired_variants))
+    changed_variants = sorted(
+        variant for variant, fields in desired_variants.items()
+        if variant in stored_variants and any(stored_variants[variant][f] != v for f, v in fields.items())
+    )
+    if changed_variants:
+        variants['changed'] = changed_variants
+    if variants:
+        changes['variants'] = variants
+
+    dependencies = {}
+    stored_dependencies = snapshot.dependencies.get(port_id, {})
+    for dependency_type in DEPENDENCY_TYPES:
+        desired = set()
+        for dependency in port.get("depends_" + dependency_type, []):
+            dependency_name = dependency.rsplit(':', 1)[-1].lower()
+            if dependency_name in resolvable_names:
+                desired.add(dependency_name)
+        delta = get_delta(stored_dependencies.get(dependency_type, set()), desired)
+        if delta:
+            dependencies[dependency_type] = delta
+    if dependencies:
+        changes['dependencies'] = dependencies
+
+    return changes
@@ -1,6 +1,12 @@
-from django.db.models import Func
+from django.db.models import Func, IntegerField
 
 
 class StringToArray(Func):
     template = "%(function)s(regexp_replace(%(expressions)s, '[^0-9.]', '','g'), '.')::int[]"
     function = 'string_to_array'
+
+
+class Cardinality(Func):
+    # number of elements of an array
+    function = 'cardinality'
+    output_field = IntegerField()
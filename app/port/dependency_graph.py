@@ -0,0 +1,117 @@
+import threading
+from collections import deque
+
+from django.db.models import Max, Min
+
+from port.models import Port, Dependency, DependencyGraphChange
+
+DEPENDENCIES = 'dependencies'
+DEPENDENTS = 'dependents'
+
+
+class DependencyGraph:
+    """
+    The dependencies between ports held in memory, as adjacency lists in both directions.
+
+    edges[DEPENDENCIES][port id][type] is the set of ids of the ports it depends on and
+    edges[DEPENDENTS][port id][type] the set of ids of the ports depending on it, so both the
+    recursive dependencies and the recursive dependents are found in O(size of the result).
+
+    The graph is loaded once and then refreshed from the DependencyGraphChange rows written by
+    load_dependencies, only the edges of the ports which have changed are read again.
+    """
+
+    def __init__(self):
+        self.edges = {DEPENDENCIES: {}, DEPENDENTS: {}}
+        self.last_change_id = None
+
+    def refresh(self):
+        changes = DependencyGraphChange.objects.aggregate(first=Min('id'), last=Max('id'))
+        if self.last_change_id is None or (changes['first'] or 0) > self.last_change_id + 1 or (changes['last'] or 0) < self.last_change_id:
+            # loaded for the first time, the changes since the last refresh have been pruned or the table has been emptied
+            self.edges = {DEPENDENCIES: {}, DEPENDENTS: {}}
+            self.add_edges(Dependency.dependencies.through.objects.all())
+        elif changes['last'] is not None and changes['last'] > self.last_change_id:
+            port_ids = set(DependencyGraphChange.objects.filter(
+                id__gt=self.last_change_id, id__lte=changes['last']
+            ).values_list('port_id', flat=True))
+            for port_id in port_ids:
+                self.remove_edges(port_id)
+            self.add_edges(Dependency.dependencies.through.objects.filter(dependency__port_name_id__in=port_ids))
+        self.last_change_id = changes['last'] or 0
+
+    def add_edges(self, queryset):
+        for port_id, dependency_type, dependency_port_id in queryset.values_list('dependency__port_name_id', 'dependency__type', 'port_id'):
+            self.edges[DEPENDENCIES].setdefault(port_id, {}).setdefault(dependency_type, set()).add(dependency_port_id)
+            self.edges[DEPENDENTS].setdefault(dependency_port_id, {}).setdefault(dependency_type, set()).add(port_id)
+
+    def remove_edges(self, port_id):
+        for dependency_type, dependency_port_ids in self.edges[DEPENDENCIES].pop(port_id, {}).items():
+            for dependency_port_id in dependency_port_ids:
+                dependents = self.edges[DEPENDENTS][dependency_port_id]
+                dependents[dependency_type].discard(port_id)
+                if not dependents[dependency_type]:
+                    del dependents[dependency_type]
+
+    def get_direct(self, port_id, direction):
+        return self.edges[direction].get(port_id, {})
+
+    def get_recursive(self, port_id, direction, types=None):
+        # breadth-first search returning the ids of all the reachable ports with their distance,
+        # only edges of the given types are followed
+        depths = {port_id: 0}
+        queue = deque([port_id])
+        while queue:
+            current = queue.popleft()
+            for dependency_type, port_ids in self.edges[direction].get(current, {}).items():
+                if types is not None and dependency_type not in types:
+                    continue
+                for next_port_id in port_ids:
+                    if next_port_id not in depths:
+                        depths[next_port_id] = depths[current] + 1
+                        queue.append(next_port_id)
+        del depths[port_id]
+        return depths
+
+
+_graph = DependencyGraph()
+_graph_lock = threading.Lock()
+
+
+def reset_dependency_graph():
+    # the graph is loaded again from the database when it is used next
+    with _graph_lock:
+        _graph.last_change_id = None
+
+
+def get_recursive_ports(port_id, direction, types=None):
+    # the graph of the process is brought up to date with the latest changes first,
+    # it is not read while another thread refreshes it
+    with _graph_lock:
+        _graph.refresh()
+        return _graph.get_recursive(port_id, direction, types)
+
+
+def get_recursive_ports_with_counts(port_id, direction, types, all_types):
+    # the recursive ports following the given types, and the number of recursive ports following each single type
+    with _graph_lock:
+        _graph.refresh()
+        counts = {dependency_type: len(_graph.get_recursive(port_id, direction, {dependency_type})) for dependency_type in all_types}
+        return _graph.get_recursive(port_id, direction, types), counts
+
+
+def get_direct_ports(port_id, direction):
+    with _graph_lock:
+        _graph.refresh()
+        return {dependency_type: set(port_ids) for dependency_type, port_ids in _graph.get_direct(port_id, direction).items()}
+
+
+def get_port_names(port_ids):
+    return dict(Port.objects.filter(id__in=port_ids).values_list('id', 'name'))
+
+
+def get_direct_ports_by_type(port_id, direction):
+    # same format as the ArrayAgg of the dependencies grouped by their type: [{'type': ..., 'ports': [names]}]
+    edges = get_direct_ports(port_id, direction)
+    names = get_port_names(set(port_id for port_ids in edges.values() for port_id in port_ids))
+    return [{'type': dependency_type, 'ports': sorted(names[i] for i in port_ids)} for dependency_type, port_ids in sorted(edges.items())]
@@ -2,9 +2,10 @@ from django import forms
 from django.utils.translation import gettext as _
 from haystack.forms import FacetedSearchForm
 from haystack.query import SearchQuerySet, SQ
-from haystack.inputs import Exact
 
 from port.models import Port
+from buildhistory.file_index import get_port_ids, EXACT, PREFIX, BASENAME
+import config
 
 
 class AdvancedSearchForm(FacetedSearchForm):
@@ -68,6 +69,14 @@ class AdvancedSearchForm(FacetedSearchForm):
             "placeholder": "Enter full/ partial path"
         })
     )
+    installed_file_match = forms.ChoiceField(
+        required=False,
+        choices=[(EXACT, "Full path"), (PREFIX, "Path starting with"), (BASENAME, "File name")],
+        widget=forms.Select(attrs={
+            "form": "super-form",
+            "class": "form-control form-control-sm mt-2",
+        })
+    )
 
     show_deleted_ports = forms.BooleanField(
         required=False,
@@ -78,6 +87,19 @@ class AdvancedSearchForm(FacetedSearchForm):
         })
     )
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('installed_file'):
+            # the ports are found in the file index, as many as Solr accepts in a single query
+            match = cleaned_data.get('installed_file_match') or EXACT
+            port_ids = list(get_port_ids(cleaned_data['installed_file'], match)[:config.FILE_SEARCH_MAX_PORTS + 1])
+            if len(port_ids) > config.FILE_SEARCH_MAX_PORTS:
+                self.add_error('installed_file', _("More than %(count)d ports install a matching file, enter a longer path.") % {
+                    'count': config.FILE_SEARCH_MAX_PORTS
+                })
+            cleaned_data['installed_file_port_ids'] = port_ids
+        return cleaned_data
+
     def no_query_found(self):
         return SearchQuerySet().models(Port).order_by("name_lower").filter(active=True)
 
@@ -129,7 +151,8 @@ class AdvancedSearchForm(FacetedSearchForm):
             f = f & SQ(nomaintainer=True)
 
         if self.cleaned_data['installed_file']:
-            f = f & SQ(files=Exact(self.cleaned_data['installed_file']))
+            # 0 matches no port when none installs the file
+            f = f & SQ(django_id__in=self.cleaned_data['installed_file_port_ids'] or [0])
 
         if f != SQ():
             sqs = sqs.filter(f)
@@ -0,0 +1,727 @@
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import transaction, connection, connections
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from category.models import Category
+from maintainer.models import Maintainer
+from variant.models import Variant
+from port.models import Port, Dependency, DependencyGraphChange, DEPENDENCY_TYPES
+from port.notif import generate_notifications_verb, NotificationChangeset
+from port.instrumentation import RunReport
+from parsing_scripts.portindex_json import PortIndexReader
+import config
+
+
+# Fields of the Port model which are written by the bulk loader
+PORT_UPDATE_FIELDS = [
+    'portdir',
+    'version',
+    'description',
+    'homepage',
+    'epoch',
+    'platforms',
+    'long_description',
+    'revision',
+    'closedmaintainer',
+    'license',
+    'replaced_by',
+    'notes',
+    'active',
+    'version_updated_at',
+    'updated_at',
+    'portindex_hash',
+]
+
+VARIANT_UPDATE_FIELDS = ['variant', 'description', 'requires', 'conflicts', 'is_default']
+
+
+def parse_license(license_object):
+    if isinstance(license_object, str):
+        return license_object
+
+    # format of license : license_object = ["MIT",["PSF","ZPL"],["Apache-2","BSD"]]
+    # required output: MIT and (PSF or ZPL) and (Apache-2 or BSD)
+    # We loop over each list element and join parent elements with "and".
+    # If child elements is a list, we join its internal elements using "or"
+
+    license_string = " and ".join(
+        ["({})".format(" or ".join(x)) if isinstance(x, list) else x for x in license_object])
+    return license_string
+
+
+def get_portindex_hash(port):
+    # keys are sorted to make the hash independent of the order in which portindex2json writes them
+    serialized = json.dumps(port, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def get_dependency_names(port):
+    names = set()
+    for dependency_type in DEPENDENCY_TYPES:
+        for dependency in port.get("depends_" + dependency_type, []):
+            names.add(dependency.rsplit(':', 1)[-1].lower())
+    return names
+
+
+def get_dependency_object(port):
+    # only the keys needed by the dependencies table are kept from the JSON object
+    dependency_object = {'name': port['name']}
+    for dependency_type in DEPENDENCY_TYPES:
+        key = "depends_" + dependency_type
+        if key in port:
+            dependency_object[key] = port[key]
+    return dependency_object
+
+
+def is_valid_port(port):
+    return 'name' in port and 'portdir' in port and 'version' in port
+
+
+def get_port_fields(port):
+    # values of the fields of the Port model, as read from the JSON object of a port
+    fields = {
+        'portdir': port['portdir'],
+        'version': port['version'],
+        'description': port.get('description', ''),
+        'homepage': port.get('homepage', ''),
+        'epoch': port.get('epoch', 0),
+        'platforms': port.get('platforms'),
+        'long_description': port.get('long_description', ''),
+        'revision': port.get('revision', 0),
+        'closedmaintainer': port.get('closedmaintainer', False),
+        'license': parse_license(port.get('license', '')),
+        'replaced_by': port.get('replaced_by'),
+    }
+    # notes are fetched separately with `port notes`, they are only overwritten if present
+    if port.get('notes'):
+        fields['notes'] = port.get('notes')
+    return fields
+
+
+def get_variant_fields(port):
+    # lower-cased name of the variant -> values of the fields of the Variant model
+    variants = {}
+    for v in port.get('vinfo', []):
+        try:
+            variant = v['variant']
+        except KeyError:
+            continue
+        except TypeError:
+            break
+
+        # variants are unique per port irrespective of their case, the first spelling is kept
+        variants.setdefault(variant.lower(), {'variant': variant}).update({
+            'description': v.get('description'),
+            'requires': v.get('requires'),
+            'conflicts': v.get('conflicts'),
+            'is_default': True if v.get('is_default') is True else False
+        })
+    return variants
+
+
+def get_maintainer_key(maintainer):
+    # maintainers are matched case-insensitively on all three fields
+    return (
+        maintainer.get('email', {}).get('name', '').lower(),
+        maintainer.get('email', {}).get('domain', '').lower(),
+        maintainer.get('github', '').lower()
+    )
+
+
+def batches(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class PortLoader:
+    """
+    Loads JSON objects of ports into the database using a fixed number of queries per batch.
+
+    All the existing ports, categories and maintainers are read once when the loader is
+    created and are kept in dictionaries keyed by their lower-cased natural keys. This replaces
+    the case-insensitive get_or_create() lookups which were made for every single port.
+
+    Categories, maintainers and variants are compared with the rows stored for the batch,
+    and only the rows which differ are inserted, updated or deleted.
+
+    With skip_unchanged, active ports whose JSON object hashes to the stored portindex_hash
+    are left untouched, including their updated_at timestamp.
+    """
+
+    def __init__(self, batch_size=config.PORT_INGESTION_BATCH_SIZE, skip_unchanged=False, dependency_spool=None):
+        self.batch_size = batch_size
+        self.skip_unchanged = skip_unchanged
+        self.created_port_objects = []
+        self.notifications = NotificationChangeset()
+        # JSON objects whose dependencies should be loaded are written to the spool file batch by batch,
+        # as JSON lines, instead of being kept until all the ports are loaded
+        self.dependency_spool = dependency_spool or tempfile.TemporaryFile('w+', encoding='utf-8')
+        # lower-cased names of the ports in the spool
+        self.dependency_names = set()
+        # skipped ports which depend on ports that did not exist when they were skipped
+        self.unresolved_dependency_objects = []
+
+        self.ports = {}
+        for port in Port.objects.all().iterator():
+            self.ports.setdefault(port.name.lower(), port)
+
+        self.categories = {}
+        for category in Category.objects.all():
+            self.categories.setdefault(category.name.lower(), category)
+
+        self.maintainers = {}
+        for maintainer in Maintainer.objects.all():
+            key = (maintainer.name.lower(), maintainer.domain.lower(), maintainer.github.lower())
+            self.maintainers.setdefault(key, maintainer)
+
+    @transaction.atomic
+    def load(self, ports):
+        updated_port_objects = []
+        for batch in batches(ports, self.batch_size):
+            updated_port_objects.extend(self.load_batch(batch))
+
+        return updated_port_objects
+
+    @transaction.atomic
+    def load_identities(self, ports):
+        # Create all the missing categories and maintainers referred by the ports in advance.
+        # Workers of a sharded run then find them in their caches, instead of racing to create them.
+        new_categories = {}
+        new_maintainers = {}
+        for port in ports:
+            for category in port.get('categories', []):
+                self.get_category(category, new_categories)
+            for maintainer in port.get('maintainers', []):
+                self.get_maintainer(maintainer, new_maintainers)
+
+        Category.objects.bulk_create(new_categories.values(), batch_size=self.batch_size)
+        Maintainer.objects.bulk_create(new_maintainers.values(), batch_size=self.batch_size)
+
+    def get_category(self, category, new_categories):
+        category_key = category.lower()
+        category_object = self.categories.get(category_key)
+        if category_object is None:
+            category_object = Category(name=category)
+            self.categories[category_key] = category_object
+            new_categories[category_key] = category_object
+        return category_object
+
+    def get_maintainer(self, maintainer, new_maintainers):
+        maintainer_key = get_maintainer_key(maintainer)
+        maintainer_object = self.maintainers.get(maintainer_key)
+        if maintainer_object is None:
+            maintainer_object = Maintainer(
+                name=maintainer.get('email', {}).get('name', ''),
+                domain=maintainer.get('email', {}).get('domain', ''),
+                github=maintainer.get('github', '')
+            )
+            self.maintainers[maintainer_key] = maintainer_object
+            new_maintainers[maintainer_key] = maintainer_object
+        return maintainer_object
+
+    def load_batch(self, ports):
+        now = timezone.now()
+        new_ports = {}
+        existing_ports = {}
+        # lower-cased port name -> JSON object, the last object wins for duplicate names
+        ports_json = {}
+
+        for port in ports:
+            # any json object missing name, portdir, version will be ignored
+            if not is_valid_port(port):
+                continue
+            name = port['name']
+
+            key = name.lower()
+            portindex_hash = get_portindex_hash(port)
+            port_object = self.ports.get(key)
+            if self.skip_unchanged and port_object is not None and port_object.active and port_object.portindex_hash == portindex_hash:
+                unresolved = set(n for n in get_dependency_names(port) if n not in self.ports)
+                if unresolved:
+                    self.unresolved_dependency_objects.append((get_dependency_object(port), unresolved))
+                continue
+
+            if port_object is None:
+                port_object = Port(name=name)
+                self.ports[key] = port_object
+
+            if port_object.pk is None:
+                new_ports[key] = port_object
+            else:
+                existing_ports[key] = port_object
+            ports_json[key] = port
+
+            # cache the original object for comparison
+            old_object = {
+                'version': port_object.version,
+                'replaced_by': port_object.replaced_by,
+                'license': port_object.license
+            }
+
+            # add or update rest of the fields
+            for field, value in get_port_fields(port).items():
+                setattr(port_object, field, value)
+            port_object.active = True
+            port_object.updated_at = now
+            port_object.portindex_hash = portindex_hash
+
+            # This function also updates the version_update_at field if the the version
+            # has changed.
+            notification_verb = generate_notifications_verb(old_object, port_object)
+            if not notification_verb == "" and key in existing_ports:
+                self.notifications.add(port_object.id, notification_verb, portdir=port_object.portdir, version=port_object.version)
+
+        Port.objects.bulk_create(new_ports.values(), batch_size=self.batch_size)
+        self.created_port_objects.extend(new_ports.values())
+        Port.objects.bulk_update(existing_ports.values(), PORT_UPDATE_FIELDS, batch_size=self.batch_size)
+
+        port_objects = {key: self.ports[key] for key in ports_json}
+        for port in ports_json.values():
+            self.dependency_spool.write(json.dumps(get_dependency_object(port)) + '\n')
+        self.dependency_names.update(ports_json)
+        self.load_categories(port_objects, ports_json)
+        self.load_maintainers(port_objects, ports_json)
+        self.load_variants(port_objects, ports_json)
+
+        return list(port_objects.values())
+
+    def get_dependency_objects(self):
+        # yields the JSON objects of the spool, then those of the skipped ports which have to be loaded again
+        yield from read_dependency_spool(self.dependency_spool)
+        yield from resolve_dependency_objects(self.dependency_names, self.unresolved_dependency_objects, self.ports)
+
+    def load_categories(self, port_objects, ports_json):
+        through = Port.categories.through
+        new_categories = {}
+        rows = set()
+        for key, port in ports_json.items():
+            for category in port.get('categories', []):
+                category_object = self.get_category(category, new_categories)
+                rows.add((port_objects[key].id, category_object.name))
+
+        Category.objects.bulk_create(new_categories.values(), batch_size=self.batch_size)
+        self.sync_relations(through, 'category_id', port_objects, rows)
+
+    def load_maintainers(self, port_objects, ports_json):
+        through = Maintainer.ports.through
+        new_maintainers = {}
+        relations = set()
+        for key, port in ports_json.items():
+            for maintainer in port.get('maintainers', []):
+                self.get_maintainer(maintainer, new_maintainers)
+                relations.add((key, get_maintainer_key(maintainer)))
+
+        Maintainer.objects.bulk_create(new_maintainers.values(), batch_size=self.batch_size)
+        rows = {(port_objects[key].id, self.maintainers[maintainer_key].id) for key, maintainer_key in relations}
+        self.sync_relations(through, 'maintainer_id', port_objects, rows)
+
+    def load_variants(self, port_objects, ports_json):
+        port_ids = [p.id for p in port_objects.values()]
+        stored_variants = {}
+        for v_obj in Variant.objects.filter(port_id__in=port_ids):
+            stored_variants.setdefault((v_obj.port_id, v_obj.variant.lower()), v_obj)
+
+        desired_variants = {}
+        for key, port in ports_json.items():
+            port_id = port_objects[key].id
+            for variant_key, fields in get_variant_fields(port).items():
+                desired_variants[(port_id, variant_key)] = fields
+
+        new_variants = []
+        changed_variants = []
+        for variant_key, fields in desired_variants.items():
+            v_obj = stored_variants.get(variant_key)
+            if v_obj is None:
+                new_variants.append(Variant(port_id=variant_key[0], **fields))
+                continue
+
+            if any(getattr(v_obj, field) != value for field, value in fields.items()):
+                for field, value in fields.items():
+                    setattr(v_obj, field, value)
+                changed_variants.append(v_obj)
+
+        stale_variants = [v_obj.id for variant_key, v_obj in stored_variants.items() if variant_key not in desired_variants]
+        if stale_variants:
+            Variant.objects.filter(id__in=stale_variants).delete()
+        Variant.objects.bulk_create(new_variants, batch_size=self.batch_size)
+        Variant.objects.bulk_update(changed_variants, VARIANT_UPDATE_FIELDS, batch_size=self.batch_size)
+
+    def sync_relations(self, through, target_field, port_objects, rows):
+        # Compare the rows of a many-to-many table with the rows generated from JSON,
+        # only the missing rows are inserted and only the stale rows are deleted.
+        stored_rows = {}
+        port_ids = [p.id for p in port_objects.values()]
+        for row_id, port_id, target_id in through.objects.filter(port_id__in=port_ids).values_list('id', 'port_id', target_field):
+            stored_rows[(port_id, target_id)] = row_id
+
+        stale_rows = [row_id for row, row_id in stored_rows.items() if row not in rows]
+        if stale_rows:
+            through.objects.filter(id__in=stale_rows).delete()
+
+        through.objects.bulk_create(
+            [through(**{'port_id': port_id, target_field: target_id}) for port_id, target_id in rows if (port_id, target_id) not in stored_rows],
+            batch_size=self.batch_size
+        )
+
+
+def read_dependency_spool(spool):
+    spool.flush()
+    spool.seek(0)
+    for line in spool:
+        yield json.loads(line)
+
+
+def resolve_dependency_objects(dependency_names, unresolved_dependency_objects, port_names):
+    # Dependencies of the skipped ports are refreshed only if they refer to a port created
+    # during this run, which could not be resolved when they were loaded previously.
+    for dependency_object, unresolved in unresolved_dependency_objects:
+        if dependency_object['name'].lower() not in dependency_names and any(n in port_names for n in unresolved):
+            yield dependency_object
+
+
+@transaction.atomic
+def load_dependencies(ports, batch_size=config.PORT_INGESTION_BATCH_SIZE):
+    """
+    Loads the dependencies of the given JSON objects of ports.
+
+    The desired rows of the dependency_dependencies table are computed in memory for a batch of
+    ports and compared with the stored rows, only the differences are written. Dependency rows
+    of types which are no longer present in the JSON object of a port are removed.
+    Returns the number of JSON objects loaded.
+    """
+    port_id_map = get_port_id_map()
+    count = 0
+    for batch in batches(ports, batch_size):
+        load_dependencies_batch(batch, port_id_map, batch_size)
+        count += len(batch)
+    prune_dependency_graph_changes()
+    return count
+
+
+def prune_dependency_graph_changes():
+    # keeps the latest DEPENDENCY_GRAPH_CHANGES_KEPT changes, nothing is deleted until the log has grown past them
+    changes = DependencyGraphChange.objects.aggregate(first=Min('id'), last=Max('id'))
+    if changes['last'] is not None and changes['first'] <= changes['last'] - config.DEPENDENCY_GRAPH_CHANGES_KEPT:
+        DependencyGraphChange.objects.filter(id__lte=changes['last'] - config.DEPENDENCY_GRAPH_CHANGES_KEPT).delete()
+
+
+def get_port_id_map():
+    # To prevent repetitive queries for adding a relation between port and its dependency
+    # we prepare a map of port names and their primary keys in advance
+    port_id_map = {}
+    for port_id, port_name in Port.objects.values_list('id', 'name'):
+        port_id_map.setdefault(port_name.lower(), port_id)
+    return port_id_map
+
+
+def load_dependencies_batch(ports, port_id_map, batch_size):
+    through = Dependency.dependencies.through
+
+    # (port id, type of dependency) -> set of ids of the ports it depends on
+    desired = {}
+    loaded_port_ids = set()
+    for port in ports:
+        try:
+            port_id = port_id_map[port['name'].lower()]
+        except KeyError:
+            continue
+        loaded_port_ids.add(port_id)
+
+        for dependency_type in DEPENDENCY_TYPES:
+            key = "depends_" + dependency_type
+            if key not in port:
+                continue
+            dependencies = set()
+            for i in port[key]:
+                dependency_name = i.rsplit(':', 1)[-1]
+                if dependency_name.lower() in port_id_map:
+                    dependencies.add(port_id_map[dependency_name.lower()])
+            desired[(port_id, dependency_type)] = dependencies
+
+    stored = {}
+    stale_dependency_ids = []
+    stale_dependency_ports = set()
+    for dependency_id, port_id, dependency_type in Dependency.objects.filter(port_name_id__in=loaded_port_ids).values_list('id', 'port_name_id', 'type'):
+        if (port_id, dependency_type) in desired:
+            stored[(port_id, dependency_type)] = dependency_id
+        else:
+            stale_dependency_ids.append(dependency_id)
+            stale_dependency_ports.add(port_id)
+
+    if stale_dependency_ids:
+        Dependency.objects.filter(id__in=stale_dependency_ids).delete()
+
+    new_dependencies = [Dependency(port_name_id=port_id, type=dependency_type) for port_id, dependency_type in desired if (port_id, dependency_type) not in stored]
+    Dependency.objects.bulk_create(new_dependencies, batch_size=batch_size)
+    for d_object in new_dependencies:
+        stored[(d_object.port_name_id, d_object.type)] = d_object.id
+
+    rows = set()
+    for dependency_key, dependencies in desired.items():
+        for dependency_port_id in dependencies:
+            rows.add((stored[dependency_key], dependency_port_id))
+
+    stored_rows = {}
+    for row_id, dependency_id, port_id in through.objects.filter(dependency_id__in=stored.values()).values_list('id', 'dependency_id', 'port_id'):
+        stored_rows[(dependency_id, port_id)] = row_id
+
+    stale_rows = [row_id for row, row_id in stored_rows.items() if row not in rows]
+    if stale_rows:
+        through.objects.filter(id__in=stale_rows).delete()
+
+    new_rows = [(dependency_id, port_id) for dependency_id, port_id in rows if (dependency_id, port_id) not in stored_rows]
+    through.objects.bulk_create(
+        [through(dependency_id=dependency_id, port_id=port_id) for dependency_id, port_id in new_rows],
+        batch_size=batch_size
+    )
+
+    # record the ports whose edges in the dependency graph have changed
+    dependency_ports = {dependency_id: port_id for (port_id, dependency_type), dependency_id in stored.items()}
+    changed_port_ids = set(stale_dependency_ports)
+    changed_port_ids.update(dependency_ports[dependency_id] for dependency_id, port_id in new_rows)
+    changed_port_ids.update(dependency_ports[row[0]] for row in stored_rows if row not in rows)
+    DependencyGraphChange.objects.bulk_create(
+        [DependencyGraphChange(port_id=port_id) for port_id in sorted(changed_port_ids)],
+        batch_size=batch_size
+    )
+
+
+def load_checkpointed(progress, get_ports, finish, skip_unchanged=False, defer_notifications=False, report=None, dependency_objects=None):
+    """
+    Loads ports in batches which are committed together with a checkpoint in the given PortIndexUpdateProgress.
+
+    get_ports() must return the same ports in the same order on every call, e.g. a PortIndexReader of
+    the file generated for the commit of the progress. The ports are loaded first, then their dependencies,
+    and a run interrupted in either stage resumes after the last committed batch. finish() is called in
+    the transaction which completes the run and deletes the progress.
+
+    The dependencies of the ports loaded by an interrupted run are not known when it is resumed,
+    hence the dependencies of all the ports are loaded then. dependency_objects are the dependencies
+    of the ports loaded by the caller when it has run the ports stage itself.
+    """
+    report = report or RunReport()
+
+    if progress.stage == progress.STAGE_PORTS:
+        resumed = progress.resumed
+        loader = PortLoader(skip_unchanged=skip_unchanged)
+        with report.phase('load_ports') as phase:
+            phase['rows'] = 0
+            for shard, batch in enumerate(batches(get_ports(), loader.batch_size)):
+                if shard <= progress.last_shard:
+                    continue
+                with transaction.atomic():
+                    phase['rows'] += len(loader.load_batch(batch))
+                    loader.notifications.deliver(defer=defer_notifications)
+                    progress.checkpoint(shard)
+
+        progress.checkpoint(-1, stage=progress.STAGE_DEPENDENCIES, full_dependency_pass=resumed)
+        if not resumed:
+            dependency_objects = loader.get_dependency_objects()
+    elif dependency_objects is None and not progress.full_dependency_pass:
+        # the ports whose dependencies were being loaded are not known anymore
+        progress.checkpoint(-1, full_dependency_pass=True)
+
+    if dependency_objects is None:
+        dependency_objects = (get_dependency_object(port) for port in get_ports() if is_valid_port(port))
+
+    with report.phase('load_dependencies') as phase:
+        phase['rows'] = 0
+        port_id_map = get_port_id_map()
+        for shard, batch in enumerate(batches(dependency_objects, config.PORT_INGESTION_BATCH_SIZE)):
+            if shard <= progress.last_shard:
+                continue
+            with transaction.atomic():
+                load_dependencies_batch(batch, port_id_map, config.PORT_INGESTION_BATCH_SIZE)
+                progress.checkpoint(shard)
+            phase['rows'] += len(batch)
+        prune_dependency_graph_changes()
+
+    with transaction.atomic():
+        finish()
+        progress.delete()
+
+
+def copy_rows(cursor, table, rows, columns=None):
+    # the rows are written in the text format of COPY, in which backslashes, tabs and
+    # newlines have to be escaped and \N stands for NULL
+    def escape(value):
+        if value is None:
+            return '\\N'
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(escape(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_from(buffer, table, columns=columns)
+
+
+@transaction.atomic
+def mark_deleted_full_run(port_names):
+    """
+    Marks the active ports which are not present in the given iterable of port names as inactive.
+
+    The names are copied into a temporary table and the stale ports are updated with a single
+    statement inside the database. Returns the ids of the ports which have been marked inactive.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TEMPORARY TABLE current_ports (name text) ON COMMIT DROP")
+        copy_rows(cursor, 'current_ports', ((name.lower(),) for name in port_names))
+        cursor.execute("ANALYZE current_ports")
+        cursor.execute(
+            "UPDATE port SET active = false, updated_at = %s "
+            "WHERE port.active AND NOT EXISTS "
+            "(SELECT 1 FROM current_ports WHERE current_ports.name = lower(port.name)) "
+            "RETURNING port.id",
+            [timezone.now()]
+        )
+        port_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("DROP TABLE current_ports")
+
+    return port_ids
+
+
+@transaction.atomic
+def mark_deleted(dict_of_portdirs_with_ports):
+    """
+    Marks the active ports of the given portdirs which are not present in the set of port names
+    of their portdir as inactive. Portdirs and port names are compared case-insensitively.
+
+    Returns the ids of the ports which have been marked inactive.
+    """
+    with connection.cursor() as cursor:
+        # every portdir gets a row without a name, so that portdirs with no ports are included
+        cursor.execute("CREATE TEMPORARY TABLE current_portdirs (portdir text, name text) ON COMMIT DROP")
+        copy_rows(cursor, 'current_portdirs', (
+            (portdir.lower(), name.lower() if name is not None else None)
+            for portdir, port_names in dict_of_portdirs_with_ports.items()
+            for name in [None, *port_names]
+        ))
+        cursor.execute(
+            "UPDATE port SET active = false, updated_at = %s "
+            "WHERE port.active "
+            "AND lower(port.portdir) IN (SELECT portdir FROM current_portdirs) "
+            "AND NOT EXISTS (SELECT 1 FROM current_portdirs "
+            "WHERE current_portdirs.portdir = lower(port.portdir) AND current_portdirs.name = lower(port.name)) "
+            "RETURNING port.id",
+            [timezone.now()]
+        )
+        port_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("DROP TABLE current_portdirs")
+
+    return port_ids
+
+
+def get_shard(port, shard_count):
+    # all the ports of a portdir belong to the same shard
+    return zlib.crc32(port.get('portdir', '').lower().encode('utf-8')) % shard_count
+
+
+def load_shard(shard_path, shard, progress_id, last_batch, skip_unchanged, defer_notifications, spool_path):
+    # Runs inside a worker process, which opens its own database connection. The worker reads
+    # the ports of its shard from the JSON lines file at shard_path and commits every batch with
+    # its checkpoint, the batches up to last_batch have been committed by an interrupted run.
+    # The dependencies of its ports are left in the spool file at spool_path.
+    from port.models import PortIndexUpdateProgress
+
+    updated_ports = []
+    with open(shard_path, 'r', encoding='utf-8') as ports, open(spool_path, 'w', encoding='utf-8') as spool:
+        loader = PortLoader(skip_unchanged=skip_unchanged, dependency_spool=spool)
+        for batch_index, batch in enumerate(batches((json.loads(line) for line in ports), loader.batch_size)):
+            if batch_index <= last_batch:
+                continue
+            with transaction.atomic():
+                updated_ports.extend(p.name for p in loader.load_batch(batch))
+                loader.notifications.deliver(defer=defer_notifications)
+                PortIndexUpdateProgress.checkpoint_batch(progress_id, shard, batch_index)
+    connections.close_all()
+
+    return updated_ports, loader.dependency_names, loader.unresolved_dependency_objects
+
+
+def load_sharded(progress, get_ports, finish, skip_unchanged=False, defer_notifications=False, report=None):
+    """
+    Loads ports using as many processes as the workers of the given PortIndexUpdateProgress.
+
+    The ports of get_ports() are split into shards by their portdir once, and every shard is loaded
+    by a separate worker process in batches which are committed together with a checkpoint of the
+    shard. Dependencies refer to ports across shards, hence they are loaded by load_checkpointed
+    once all the workers have finished, which calls finish() in its final transaction.
+    Returns the names of the ports updated by the workers.
+    """
+    report = report or RunReport()
+    updated_ports = []
+
+    with tempfile.TemporaryDirectory() as directory, contextlib.ExitStack() as stack:
+        dependency_objects = None
+        if progress.stage == progress.STAGE_PORTS:
+            resumed = progress.resumed
+            workers = progress.workers
+            shard_paths = [os.path.join(directory, 'ports-{}.json'.format(shard)) for shard in range(workers)]
+            spool_paths = [os.path.join(directory, 'dependencies-{}.json'.format(shard)) for shard in range(workers)]
+
+            # the PortIndex is parsed once, the ports are written to the files of their shards
+            # while the categories and maintainers they refer to are collected
+            with report.phase('load_identities'):
+                with contextlib.ExitStack() as shard_files:
+                    files = [shard_files.enter_context(open(path, 'w', encoding='utf-8')) for path in shard_paths]
+
+                    def split_ports():
+                        for port in get_ports():
+                            files[get_shard(port, workers)].write(json.dumps(port) + '\n')
+                            yield port
+
+                    PortLoader().load_identities(split_ports())
+
+            # connections must not be shared with the forked workers
+            connections.close_all()
+
+            dependency_names = set()
+            unresolved_dependency_objects = []
+            with report.phase('load_ports') as phase:
+                with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+                    futures = [
+                        executor.submit(
+                            load_shard, shard_paths[shard], shard, progress.id, progress.last_batches.get(str(shard), -1),
+                            skip_unchanged, defer_notifications, spool_paths[shard]
+                        )
+                        for shard in range(workers)
+                    ]
+                    for future in futures:
+                        shard_updated_ports, shard_dependency_names, shard_unresolved_dependency_objects = future.result()
+                        updated_ports.extend(shard_updated_ports)
+                        dependency_names.update(shard_dependency_names)
+                        unresolved_dependency_objects.extend(shard_unresolved_dependency_objects)
+                phase['rows'] = len(updated_ports)
+
+            progress.refresh_from_db()
+            progress.checkpoint(-1, stage=progress.STAGE_DEPENDENCIES, full_dependency_pass=resumed)
+            if not resumed:
+                port_names = set(name.lower() for name in Port.objects.values_list('name', flat=True))
+                spools = [stack.enter_context(open(path, 'r', encoding='utf-8')) for path in spool_paths]
+                dependency_objects = itertools.chain(
+                    *(read_dependency_spool(spool) for spool in spools),
+                    resolve_dependency_objects(dependency_names, unresolved_dependency_objects, port_names)
+                )
+
+        load_checkpointed(progress, get_ports, finish, report=report, dependency_objects=dependency_objects)
+
+    return updated_ports
@@ -0,0 +1,97 @@
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+def get_peak_memory():
+    # high-water mark of the resident memory of this process and of its finished children
+    # (e.g. the workers of a sharded run), ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    ) * unit
+
+
+@contextmanager
+def count_queries(measurements):
+    # adds the number and the total time of the SQL queries run on the default connection in the
+    # block to measurements['queries'] and measurements['query_time'], whatever their number
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            measurements['queries'] += 1
+            measurements['query_time'] += time.perf_counter() - start
+
+    with connection.execute_wrapper(wrapper):
+        yield measurements
+
+
+class RunReport:
+    """
+    Collects the measurements of the phases of a run of update-portinfo.
+
+    For every phase the duration, the number of rows touched, the number and total time of
+    the SQL queries run on the default connection and the growth of the peak memory during it are
+    recorded. The peak memory never decreases, a phase which only reuses memory freed by the phases
+    before it has no growth. The peak memory of the whole process is recorded once for the run.
+    Queries of worker processes use their own connections and are not counted.
+    """
+
+    def __init__(self, type_of_run=None):
+        self.type_of_run = type_of_run
+        self.started_at = time.time()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        # the yielded dict can be used to record the number of rows touched by the phase
+        measurements = {'name': name, 'rows': None, 'queries': 0, 'query_time': 0.0}
+        start = time.perf_counter()
+        start_memory = get_peak_memory()
+        try:
+            with count_queries(measurements):
+                yield measurements
+        finally:
+            measurements['duration'] = round(time.perf_counter() - start, 3)
+            measurements['query_time'] = round(measurements['query_time'], 3)
+            measurements['peak_memory_growth'] = get_peak_memory() - start_memory
+            self.phases.append(measurements)
+
+    def timed(self, name, iterable):
+        # Records the time spent producing the items of a stream, e.g. parsing the ports out of
+        # portindex.json, as a phase of its own. The time is also part of the phase consuming it.
+        measurements = {'name': name, 'rows': 0, 'queries': 0, 'query_time': 0.0, 'duration': 0.0}
+        self.phases.append(measurements)
+        start_memory = get_peak_memory()
+
+        # the time of an item is a few microseconds, the duration is rounded once the report is built
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    measurements['duration'] += time.perf_counter() - start
+                measurements['rows'] += 1
+                yield item
+        finally:
+            measurements['peak_memory_growth'] = get_peak_memory() - start_memory
+
+    def as_dict(self):
+        return {
+            'type': self.type_of_run,
+            'started_at': self.started_at,
+            'duration': round(time.time() - self.started_at, 3),
+            'queries': sum(phase['queries'] for phase in self.phases),
+            'process_peak_memory': get_peak_memory(),
+            'phases': [dict(phase, duration=round(phase['duration'], 3)) for phase in self.phases],
+        }
@@ -0,0 +1,55 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from parsing_scripts.benchmark_ingestion import run_benchmark, compare_reports
+
+
+class Command(BaseCommand):
+
+    help = "Benchmarks full and incremental ingestion of synthetic ports in a separate test database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ports',
+                            type=int,
+                            nargs='+',
+                            default=[1000, 10000],
+                            help="Numbers of ports to benchmark, e.g. --ports 1000 10000 50000")
+        parser.add_argument('--seed',
+                            type=int,
+                            default=0,
+                            help="Seed of the generator of the synthetic ports.")
+        parser.add_argument('--output',
+                            type=str,
+                            help="Path of the JSON report, printed if not given.")
+        parser.add_argument('--compare',
+                            type=str,
+                            help="Path of a previous JSON report to compare the results with.")
+        parser.add_argument('--noinput', '--no-input',
+                            action='store_false',
+                            dest='interactive',
+                            help="Do not prompt before destroying an existing test database.")
+
+    def handle(self, *args, **options):
+        # the benchmark empties the ports table, it never runs against the configured database
+        old_database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=not options['interactive'])
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                report = run_benchmark(options['ports'], options['seed'], directory)
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        if options['compare']:
+            with open(options['compare'], 'r') as file:
+                old_report = json.load(file)
+            for ports, phase, key, old_value, value, change in compare_reports(old_report, report):
+                self.stdout.write("{} ports, {}, {}: {} -> {} ({:+.1%})".format(ports, phase, key, old_value, value, change))
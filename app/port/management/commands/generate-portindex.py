@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from parsing_scripts.synthetic_portindex import generate_ports, write_portindex_json
+
+
+class Command(BaseCommand):
+
+    help = "Generates a synthetic portindex.json with the given number of ports for benchmarking."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output',
+                            type=str,
+                            help="Path of the generated JSON file.")
+        parser.add_argument('--ports',
+                            type=int,
+                            default=1000,
+                            help="Number of ports to generate.")
+        parser.add_argument('--seed',
+                            type=int,
+                            default=0,
+                            help="Seed of the generator, the same seed always generates the same ports.")
+        parser.add_argument('--revision',
+                            type=int,
+                            default=0,
+                            help="Number of simulated updates of the ports tree, each changing and removing a few ports.")
+
+    def handle(self, *args, **options):
+        ports = generate_ports(options['ports'], seed=options['seed'], revision=options['revision'])
+        write_portindex_json(options['output'], ports, 'synthetic-{}'.format(options['revision']))
+        self.stdout.write("Generated {} ports".format(len(ports)))
@@ -1,11 +1,21 @@
 from django.core.management.base import BaseCommand
 
 from parsing_scripts import get_notes
+from port.models import PortIndexUpdateReport
 
 
 class Command(BaseCommand):
 
     help = "Fetches notes using the 'port notes' command and saves in database"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--all',
+                            action='store_true',
+                            help="Fetch the notes of all the ports instead of those updated by the last update-portinfo run.")
+
     def handle(self, *args, **options):
-        get_notes.get_notes_all_ports()
+        if options['all']:
+            count = get_notes.get_notes_all_ports()
+        else:
+            count = get_notes.get_notes_ports(PortIndexUpdateReport.get_updated_ports())
+        self.stdout.write("Notes changed for {} ports".format(count))
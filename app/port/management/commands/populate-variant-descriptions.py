@@ -1,11 +1,21 @@
 from django.core.management.base import BaseCommand
 
 from parsing_scripts import populate_variant_descriptions
+from port.models import PortIndexUpdateReport
 
 
 class Command(BaseCommand):
 
     help = "Populate variant descriptions for the ports"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--all',
+                            action='store_true',
+                            help="Populate the variants of all the ports instead of those updated by the last update-portinfo run.")
+
     def handle(self, *args, **options):
-        populate_variant_descriptions.populate_variant_descriptions_all_ports()
+        if options['all']:
+            count = populate_variant_descriptions.populate_variant_descriptions_all_ports()
+        else:
+            count = populate_variant_descriptions.populate_variant_descriptions_ports(PortIndexUpdateReport.get_updated_ports())
+        self.stdout.write("Descriptions changed for {} variants".format(count))
@@ -1,11 +1,27 @@
 from django.core.management.base import BaseCommand
 
 from parsing_scripts import run_livecheck
+import config
 
 
 class Command(BaseCommand):
 
     help = "Runs livecheck command over all the ports"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers',
+                            type=int,
+                            default=config.LIVECHECK_WORKERS,
+                            help="Number of livechecks run at the same time.")
+        parser.add_argument('--timeout',
+                            type=int,
+                            default=config.LIVECHECK_TIMEOUT,
+                            help="Seconds after which the livecheck of a port is killed.")
+        parser.add_argument('--retries',
+                            type=int,
+                            default=config.LIVECHECK_RETRIES,
+                            help="Number of times a livecheck which timed out is tried again.")
+
     def handle(self, *args, **options):
-        run_livecheck.run_livecheck_all()
+        count = run_livecheck.run_livecheck_all(options['workers'], options['timeout'], options['retries'])
+        self.stdout.write("Livecheck written for {} ports".format(count))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from parsing_scripts import run_livecheck
+from parsing_scripts.livecheck_schedule import get_scheduled_ports
+import config
+
+
+class Command(BaseCommand):
+
+    help = "Runs livecheck for the ports whose livecheck is the most due, e.g. popular or recently updated ports"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget',
+                            type=int,
+                            required=True,
+                            help="Number of ports checked in this run.")
+        parser.add_argument('--window',
+                            type=int,
+                            help="Seconds after which no more livechecks are started.")
+        parser.add_argument('--workers',
+                            type=int,
+                            default=config.LIVECHECK_WORKERS,
+                            help="Number of livechecks run at the same time.")
+        parser.add_argument('--timeout',
+                            type=int,
+                            default=config.LIVECHECK_TIMEOUT,
+                            help="Seconds after which the livecheck of a port is killed.")
+        parser.add_argument('--retries',
+                            type=int,
+                            default=config.LIVECHECK_RETRIES,
+                            help="Number of times a livecheck which timed out is tried again.")
+
+    def handle(self, *args, **options):
+        ports = get_scheduled_ports(options['budget'])
+        count = run_livecheck.run_livecheck_ports(
+            ports,
+            workers=options['workers'],
+            timeout=options['timeout'],
+            retries=options['retries'],
+            window=options['window']
+        )
+        self.stdout.write("Livecheck written for {} of {} scheduled ports".format(count, len(ports)))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from port.models import PendingNotification
+
+
+class Command(BaseCommand):
+
+    help = "Sends the notifications queued by update-portinfo --defer-notifications to the subscribers of the ports"
+
+    def handle(self, *args, **options):
+        sent = PendingNotification.drain()
+        self.stdout.write("Sent notifications for {} port updates".format(sent))
@@ -1,7 +1,12 @@
+import json
+
 from django.core.management.base import BaseCommand, CommandError
 
 from parsing_scripts import git_update, populate_variant_descriptions
-from port.models import Port, LastPortIndexUpdate
+from port.models import Port, LastPortIndexUpdate, PortIndexUpdateReport, PortIndexUpdateProgress
+from port.ingestion import load_checkpointed, load_sharded
+from port.instrumentation import RunReport
+from port.changeset import compute_changeset
 
 
 class Command(BaseCommand):
@@ -12,19 +17,80 @@ class Command(BaseCommand):
                             type=str,
                             default="update",
                             help="Specify the type of operation, update or full.")
+        parser.add_argument('--force',
+                            action='store_true',
+                            help="Rewrite all the ports, even those whose JSON has not changed since the last run.")
+        parser.add_argument('--workers',
+                            type=int,
+                            default=1,
+                            help="Number of processes loading the ports in parallel during a full run.")
+        parser.add_argument('--defer-notifications',
+                            action='store_true',
+                            help="Queue the notifications for the send-notifications command instead of sending them.")
+        parser.add_argument('--dry-run',
+                            action='store_true',
+                            help="Print the changes the update would make to the ports as JSON, without writing them.")
+        parser.add_argument('--report',
+                            type=str,
+                            help="Write the JSON report of the run to this file instead of printing it.")
 
     def handle(self, *args, **options):
         type_of_run = options['type']
+        report = RunReport(type_of_run)
+        commit = self.run(type_of_run, report, options)
+        if options['dry_run']:
+            return
+
+        # the report is kept next to the commit the database has been updated to
+        PortIndexUpdateReport.create_from_report(commit, report)
+        if options['report']:
+            with open(options['report'], 'w') as file:
+                json.dump(report.as_dict(), file, indent=2)
+        else:
+            self.stdout.write(json.dumps(report.as_dict()))
+
+    def run(self, type_of_run, report, options):
+        skip_unchanged = not options['force']
+        defer_notifications = options['defer_notifications']
 
         if type_of_run == 'full':
-            git_update.refresh_portindex_json()
+            # an interrupted full run is resumed with the portindex.json it was loading
+            commit = None if options['dry_run'] else self.get_resumable_commit()
+            if commit is None:
+                commit = git_update.refresh_portindex_json(report)
             data = git_update.get_portindex_json()
             if data is None:
                 raise CommandError("Failed to parse portindex.json")
-            Port.add_or_update(data['ports'])
-            Port.mark_deleted_full_run(data['ports'])
-            LastPortIndexUpdate.update_or_create_first_object(data['info']['commit'])
-            return
+            if options['dry_run']:
+                self.write_changeset(data, options)
+                return commit
+
+            def finish():
+                with report.phase('mark_deleted') as phase:
+                    phase['rows'] = len(Port.mark_deleted_full_run(git_update.get_portindex_json()))
+                LastPortIndexUpdate.update_or_create_first_object(commit)
+
+            progress = PortIndexUpdateProgress.get_resumable(commit, 'full')
+            if progress is None or not progress.resumed:
+                progress = PortIndexUpdateProgress.start(commit, 'full', workers=options['workers'])
+            elif progress.stage == progress.STAGE_PORTS and progress.workers != options['workers']:
+                # the shards of the ports depend on the number of workers
+                raise CommandError("The interrupted full run was loading the ports with {0} workers, resume it using --workers {0}.".format(progress.workers))
+
+            try:
+                # the file is streamed again for every pass instead of keeping all the ports in memory
+                load = load_sharded if progress.workers > 1 else load_checkpointed
+                load(
+                    progress,
+                    lambda: report.timed('json_parse', git_update.get_portindex_json()),
+                    finish,
+                    skip_unchanged=skip_unchanged,
+                    defer_notifications=defer_notifications,
+                    report=report
+                )
+            except json.decoder.JSONDecodeError:
+                raise CommandError("Failed to parse portindex.json")
+            return commit
 
         # It is an incremental update
         # An incremental update is only possible when the database has a
@@ -32,11 +98,14 @@ class Command(BaseCommand):
         old_commit_object = LastPortIndexUpdate.objects.all().first()
         if old_commit_object is None:
             raise CommandError("Failed to run incremental update. No old commit found, cannot generate range of commits.")
+        interrupted_full_run = PortIndexUpdateProgress.objects.filter(type='full').first()
+        if interrupted_full_run is not None and not options['dry_run']:
+            raise CommandError("A full run for commit {} has been interrupted, resume it using --type full.".format(interrupted_full_run.git_commit_hash))
 
-        updated_portdirs = git_update.get_updated_portdirs()
+        updated_portdirs = git_update.get_updated_portdirs(report)
 
-        # fetch the latest version of PortIndex.json and open the file
-        data = git_update.get_portindex_json()
+        # open the JSON of the ports regenerated for the updated portdirs
+        data = git_update.get_updated_portindex_json()
         if data is None:
             raise CommandError("Failed to parse portindex.json")
 
@@ -49,18 +118,56 @@ class Command(BaseCommand):
         # Using the received set of updated portdirs, find corresponding JSON objects for all ports under
         # that portdir.
         ports_to_be_updated_json = []
-        for port in data['ports']:
-            portdir = port['portdir'].lower()
-            portname = port['name'].lower()
-            if portdir in updated_portdirs:
-                ports_to_be_updated_json.append(port)
-                dict_of_portdirs_with_ports[portdir].add(portname)
+        try:
+            for port in report.timed('json_parse', data):
+                portdir = port['portdir'].lower()
+                portname = port['name'].lower()
+                if portdir in updated_portdirs:
+                    ports_to_be_updated_json.append(port)
+                    dict_of_portdirs_with_ports[portdir].add(portname)
+        except json.decoder.JSONDecodeError:
+            raise CommandError("Failed to parse portindex.json")
+
+        if options['dry_run']:
+            self.write_changeset(ports_to_be_updated_json, options, dict_of_portdirs_with_ports)
+            return data.info['commit']
+
+        commit = data.info['commit']
 
-        # Mark deleted ports
-        Port.mark_deleted(dict_of_portdirs_with_ports)
+        def finish():
+            # Mark deleted ports
+            with report.phase('mark_deleted') as phase:
+                phase['rows'] = len(Port.mark_deleted(dict_of_portdirs_with_ports, defer_notifications=defer_notifications))
 
-        # Run updates
-        Port.add_or_update(ports_to_be_updated_json)
+            # Write the commit hash into database
+            LastPortIndexUpdate.update_or_create_first_object(commit)
 
-        # Write the commit hash into database
-        LastPortIndexUpdate.update_or_create_first_object(data['info']['commit'])
+        # Run updates, a run interrupted before it finished is resumed if no new commits have been pulled since
+        progress = PortIndexUpdateProgress.get_resumable(commit, 'update') or PortIndexUpdateProgress.start(commit, 'update')
+        load_checkpointed(
+            progress,
+            lambda: ports_to_be_updated_json,
+            finish,
+            skip_unchanged=skip_unchanged,
+            defer_notifications=defer_notifications,
+            report=report
+        )
+        return commit
+
+    def get_resumable_commit(self):
+        progress = PortIndexUpdateProgress.objects.filter(type='full').first()
+        data = git_update.get_portindex_json()
+        if progress is None or data is None:
+            return None
+        try:
+            commit = data.read_info().get('commit')
+        except json.decoder.JSONDecodeError:
+            return None
+        return commit if commit == progress.git_commit_hash else None
+
+    def write_changeset(self, ports, options, dict_of_portdirs_with_ports=None):
+        try:
+            changeset = compute_changeset(ports, dict_of_portdirs_with_ports, skip_unchanged=not options['force'])
+        except json.decoder.JSONDecodeError:
+            raise CommandError("Failed to parse portindex.json")
+        self.stdout.write(json.dumps(changeset, indent=2))
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.9 on 2026-10-18 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('port', '0008_port_notes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='port',
+            name='portindex_hash',
+            field=models.CharField(max_length=64, null=True, verbose_name='Hash of the JSON object of the port in PortIndex'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.0.9 on 2026-10-18 10:12
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('port', '0009_port_portindex_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('verb', models.CharField(max_length=255)),
+                ('data', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('port', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_notifications', to='port.Port')),
+            ],
+            options={
+                'verbose_name': 'Pending Notification',
+                'verbose_name_plural': 'Pending Notifications',
+                'db_table': 'pending_notification',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.0.9 on 2026-10-18 10:21
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('port', '0010_pendingnotification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortIndexUpdateReport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('git_commit_hash', models.CharField(max_length=50, null=True, verbose_name='Commit hash till which update was done')),
+                ('type', models.CharField(max_length=20, verbose_name='Type of the run, full or update')),
+                ('duration', models.FloatField(verbose_name='Duration of the run in seconds')),
+                ('ports_updated', models.IntegerField(default=0, verbose_name='Number of ports added or updated')),
+                ('ports_deleted', models.IntegerField(default=0, verbose_name='Number of ports marked as deleted')),
+                ('report', django.contrib.postgres.fields.jsonb.JSONField(default=dict, verbose_name='Measurements of the phases of the run')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'PortIndex Update Report',
+                'verbose_name_plural': 'PortIndex Update Reports',
+                'db_table': 'portindex_update_report',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.0.9 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('port', '0011_portindexupdatereport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortIndexUpdateProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('git_commit_hash', models.CharField(max_length=50, verbose_name='Commit hash of the PortIndex being loaded')),
+                ('type', models.CharField(max_length=20, verbose_name='Type of the run, full or update')),
+                ('stage', models.CharField(default='ports', max_length=20, verbose_name='Stage of the run, ports or dependencies')),
+                ('last_shard', models.IntegerField(default=-1, verbose_name='Index of the last batch committed in the current stage')),
+                ('full_dependency_pass', models.BooleanField(default=False, verbose_name='True if the dependencies of all the ports are loaded')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'PortIndex Update Progress',
+                'verbose_name_plural': 'PortIndex Update Progress',
+                'db_table': 'portindex_update_progress',
+            },
+        ),
+    ]
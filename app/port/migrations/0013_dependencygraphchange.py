@@ -0,0 +1,26 @@
+# Generated by Django 3.0.9 on 2026-10-18 10:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('port', '0012_portindexupdateprogress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DependencyGraphChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('port', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='port.Port')),
+            ],
+            options={
+                'verbose_name': 'Dependency Graph Change',
+                'verbose_name_plural': 'Dependency Graph Changes',
+                'db_table': 'dependency_graph_change',
+            },
+        ),
+    ]
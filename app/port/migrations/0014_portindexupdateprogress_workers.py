@@ -0,0 +1,24 @@
+# Generated by Django 3.0.9 on 2026-10-18 11:54
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('port', '0013_dependencygraphchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portindexupdateprogress',
+            name='last_batches',
+            field=django.contrib.postgres.fields.jsonb.JSONField(default=dict, verbose_name='Index of the last batch of ports committed by the worker of each shard'),
+        ),
+        migrations.AddField(
+            model_name='portindexupdateprogress',
+            name='workers',
+            field=models.IntegerField(default=1, verbose_name='Number of processes loading the ports'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.0.9 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('port', '0014_portindexupdateprogress_workers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portindexupdatereport',
+            name='started_at',
+            field=models.DateTimeField(null=True, verbose_name='Time at which the run started'),
+        ),
+        # the reports written before were created at the end of their run
+        migrations.RunSQL(
+            sql="UPDATE portindex_update_report SET started_at = created_at - duration * interval '1 second'",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='portindexupdatereport',
+            name='started_at',
+            field=models.DateTimeField(verbose_name='Time at which the run started'),
+        ),
+    ]
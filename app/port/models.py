@@ -1,18 +1,20 @@
-import json
+import datetime
 import subprocess
 
-from django.db import models, transaction
+from django.db import models, transaction, connection
+from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth.models import User
-from notifications.signals import notify
+from django.contrib.postgres.fields import JSONField
 
-from category.models import Category
-from maintainer.models import Maintainer
-from variant.models import Variant
-from port.notif import generate_notifications_verb
+from parsing_scripts.portindex_json import PortIndexReader
+from port.instrumentation import RunReport
 import config
 
 
+# port.ingestion and port.notif import this module, the methods using them import them in turn
+
+
 class PortManager(models.Manager):
     def get_by_natural_key(self, name):
         return self.get(name=name)
@@ -42,6 +44,7 @@ class Port(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     version_updated_at = models.DateTimeField(null=True)
+    portindex_hash = models.CharField(max_length=64, null=True, verbose_name="Hash of the JSON object of the port in PortIndex")
     subscribers = models.ManyToManyField(User, related_name='ports', verbose_name="Subscribers of the port")
 
     objects = PortManager()
@@ -89,198 +92,55 @@ class Port(models.Model):
         return subports
 
     @classmethod
-    def add_or_update(cls, data):
-        def parse_license(license_object):
-            if isinstance(license_object, str):
-                return license_object
-
-            # format of license : license_object = ["MIT",["PSF","ZPL"],["Apache-2","BSD"]]
-            # required output: MIT and (PSF or ZPL) and (Apache-2 or BSD)
-            # We loop over each list element and join parent elements with "and".
-            # If child elements is a list, we join its internal elements using "or"
-
-            license_string = " and ".join(
-                ["({})".format(" or ".join(x)) if isinstance(x, list) else x for x in license_object])
-            return license_string
-
-        @transaction.atomic
-        def load_ports_table(ports):
-            updated_port_objects = []
-            for port in ports:
-                # any json object missing name, portdir, version will be ignored
-                try:
-                    name = port['name']
-                    portdir = port['portdir']
-                    version = port['version']
-                except KeyError:
-                    continue
-
-                # get or create an object for this port
-                port_object, port_created = Port.objects.get_or_create(name__iexact=name, defaults={'name': name})
-                updated_port_objects.append(port_object)
-                # cache the original object for comparison
-                old_object = {
-                    'version': port_object.version,
-                    'replaced_by': port_object.replaced_by,
-                    'license': port_object.license
-                }
-
-                # add or update rest of the fields
-                port_object.portdir = portdir
-                port_object.version = version
-                port_object.description = port.get('description', '')
-                port_object.homepage = port.get('homepage', '')
-                port_object.epoch = port.get('epoch', 0)
-                port_object.platforms = port.get('platforms')
-                port_object.long_description = port.get('long_description', '')
-                port_object.revision = port.get('revision', 0)
-                port_object.closedmaintainer = port.get('closedmaintainer', False)
-                port_object.license = parse_license(port.get('license', ''))
-                port_object.replaced_by = port.get('replaced_by')
-                port_object.active = True
-                port_object.save()
-
-                # This function also updates the version_update_at field if the the version
-                # has changed.
-                notification_verb = generate_notifications_verb(old_object, port_object)
-                if not notification_verb == "":
-                    notify.send(
-                        port_object,
-                        recipient=port_object.subscribers.all(),
-                        verb=notification_verb,
-                        portdir=port_object.portdir,
-                        version=port_object.version
-                    )
-
-                # first remove any related category and then add
-                port_object.categories.clear()  # remove any related objects
-                categories = set()
-                for category in port.get('categories', []):
-                    category_object, created = Category.objects.get_or_create(name__iexact=category, defaults={'name': category})
-                    categories.add(category_object)
-                port_object.categories.add(*categories)
-
-                # remove any related maintainers and then add all
-                port_object.maintainers.clear()
-                for maintainer in port.get('maintainers', []):
-                    maintainer_name = maintainer.get('email', {}).get('name', '')
-                    maintainer_domain = maintainer.get('email', {}).get('domain', '')
-                    maintainer_github = maintainer.get('github', '')
-
-                    maintainer_object, created = Maintainer.objects.get_or_create(
-                        name__iexact=maintainer_name,
-                        domain__iexact=maintainer_domain,
-                        github__iexact=maintainer_github,
-                        defaults={
-                            'name': maintainer_name,
-                            'domain': maintainer_domain,
-                            'github': maintainer_github
-                        }
-                    )
-                    maintainer_object.ports.add(port_object)
-
-                # delete all related variants and then add all
-                port_object.variants.all().delete()
-                for v in port.get('vinfo', []):
-                    try:
-                        variant = v['variant']
-                    except KeyError:
-                        continue
-                    except TypeError:
-                        break
-
-                    v_obj, created = Variant.objects.get_or_create(port_id=port_object.id, variant__iexact=variant, defaults={'variant': variant})
-                    v_obj.description = v.get('description')
-                    v_obj.requires = v.get('requires')
-                    v_obj.conflicts = v.get('conflicts')
-                    v_obj.is_default = True if v.get('is_default') is True else False
-                    v_obj.save()
-
-                if port.get('notes'):
-                    port_object.notes = port.get('notes')
-                    port_object.save()
-
-                print("Updated port: ", port_object.name)
-
-            return updated_port_objects
-
-        @transaction.atomic
-        def load_dependencies_table(ports):
-            # To prevent repetitive queries for adding a relation between port and its dependency
-            # we prepare a map of port names and their primary keys in advance
-            port_id_map = {}
-            for port_object in Port.objects.all():
-                port_id_map[port_object.name.lower()] = port_object.id
-
-            def load_depends(port_id, type_of_dependency, list_of_dependencies):
-                d_object, created = Dependency.objects.get_or_create(type=type_of_dependency, port_name_id=port_id)
-                d_object.dependencies.clear()
-                dependencies = set()
-                for i in list_of_dependencies:
-                    try:
-                        dependency_name = i.rsplit(':', 1)[-1]
-                        dependencies.add(port_id_map[dependency_name.lower()])
-                    except KeyError:
-                        pass
-                d_object.dependencies.add(*dependencies)
-
-            for port in ports:
-                try:
-                    name = port['name']
-                except KeyError:
-                    continue
-                try:
-                    port_object = Port.objects.get(name=name)
-                except Port.DoesNotExist:
-                    continue
-
-                for dependency_type in ["lib", "extract", "run", "patch", "build", "test", "fetch"]:
-                    key = "depends_" + dependency_type
-                    if key in port:
-                        load_depends(port_object.id, dependency_type, port[key])
-
-                print("Updated port dependencies: ", port['name'])
-
-        def run(ports):
-            updated_port_objects = load_ports_table(ports)
-            load_dependencies_table(ports)
-
-            return updated_port_objects
-
-        return run(data)
+    def add_or_update(cls, data, skip_unchanged=False, defer_notifications=False, report=None):
+        from port.ingestion import PortLoader, load_dependencies
+
+        report = report or RunReport()
+        loader = PortLoader(skip_unchanged=skip_unchanged)
+
+        # data can be a generator, it is consumed only once by the loader which
+        # spools the dependencies of the loaded ports for the second pass
+        with report.phase('load_ports') as phase:
+            updated_port_objects = loader.load(data)
+            phase['rows'] = len(updated_port_objects)
+        with report.phase('load_dependencies') as phase:
+            phase['rows'] = load_dependencies(loader.get_dependency_objects())
+        with report.phase('notifications') as phase:
+            phase['rows'] = len(loader.notifications.notifications)
+            loader.notifications.deliver(defer=defer_notifications)
+
+        return updated_port_objects
 
     @classmethod
-    def mark_deleted(cls, dict_of_portdirs_with_ports):
-        for portdir in dict_of_portdirs_with_ports:
-            for port in Port.objects.filter(portdir__iexact=portdir).only('portdir', 'name', 'active', 'updated_at'):
-                if port.name.lower() not in dict_of_portdirs_with_ports[portdir]:
-                    port.active = False
-                    port.save()
-                    notify.send(port, recipient=port.subscribers.all(), verb="Port has been deleted.")
+    def mark_deleted(cls, dict_of_portdirs_with_ports, defer_notifications=False):
+        from port.ingestion import mark_deleted
+        from port.notif import NotificationChangeset
+
+        port_ids = mark_deleted(dict_of_portdirs_with_ports)
+
+        notifications = NotificationChangeset()
+        for port_id in port_ids:
+            notifications.add(port_id, "Port has been deleted.")
+        notifications.deliver(defer=defer_notifications)
+        return port_ids
 
     @classmethod
     def mark_deleted_full_run(cls, ports_json):
-        # generate set of port names
-        port_names = set()
-        for port in ports_json:
-            port_name = port['name'].lower()
-            port_names.add(port_name)
-
-        # loop over all ports in database, then search in set
-        for port in Port.objects.all().only('name', 'active', 'updated_at'):
-            if port.name.lower() not in port_names:
-                port.active = False
-                port.save()
+        from port.ingestion import mark_deleted_full_run
+
+        return mark_deleted_full_run(port['name'] for port in ports_json)
 
     class PortIndexUpdateHandler:
         @staticmethod
         def sync_and_open_file():
             return_code = subprocess.call([config.RSYNC, config.PORTINDEX_SOURCE, config.PORTINDEX_JSON])
             if return_code != 0:
-                return {}
-            with open(config.PORTINDEX_JSON, "r", encoding='utf-8') as file:
-                data = json.load(file)
-            return data
+                return None
+            return PortIndexReader(config.PORTINDEX_JSON)
+
+
+# types of dependencies, as the keys depends_<type> of the JSON object of a port
+DEPENDENCY_TYPES = ["lib", "extract", "run", "patch", "build", "test", "fetch"]
 
 
 class Dependency(models.Model):
@@ -298,6 +158,17 @@ class Dependency(models.Model):
         ]
 
 
+class DependencyGraphChange(models.Model):
+    # ports whose dependencies have changed, processes keeping the dependency graph in memory
+    # read the rows after the last one they have seen and reload only the dependencies of those ports
+    port = models.ForeignKey(Port, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        db_table = "dependency_graph_change"
+        verbose_name = "Dependency Graph Change"
+        verbose_name_plural = "Dependency Graph Changes"
+
+
 class LiveCheck(models.Model):
     port = models.OneToOneField(Port, on_delete=models.CASCADE, related_name='livecheck')
     result = models.TextField(null=True, verbose_name="Result of the last livecheck for the port. Only stored if new version is available")
@@ -315,6 +186,33 @@ class LiveCheck(models.Model):
         ]
 
 
+class PendingNotification(models.Model):
+    port = models.ForeignKey(Port, on_delete=models.CASCADE, related_name='pending_notifications')
+    verb = models.CharField(max_length=255)
+    data = JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "pending_notification"
+        verbose_name = "Pending Notification"
+        verbose_name_plural = "Pending Notifications"
+
+    @classmethod
+    def drain(cls, batch_size=config.PORT_INGESTION_BATCH_SIZE):
+        from port.notif import send_notifications
+
+        sent = 0
+        while True:
+            with transaction.atomic():
+                # concurrent drains skip the rows locked by each other
+                pending = list(PendingNotification.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+                if not pending:
+                    return sent
+                send_notifications([(p.port_id, p.verb, p.data) for p in pending], batch_size=batch_size)
+                PendingNotification.objects.filter(id__in=[p.id for p in pending]).delete()
+                sent += len(pending)
+
+
 class LastPortIndexUpdate(models.Model):
     git_commit_hash = models.CharField(max_length=50, verbose_name="Commit hash till which update was done")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Timestamp when update completed")
@@ -332,3 +230,96 @@ class LastPortIndexUpdate(models.Model):
         else:
             first_object.git_commit_hash = commit_hash
             first_object.save()
+
+
+class PortIndexUpdateProgress(models.Model):
+    STAGE_PORTS = 'ports'
+    STAGE_DEPENDENCIES = 'dependencies'
+
+    git_commit_hash = models.CharField(max_length=50, verbose_name="Commit hash of the PortIndex being loaded")
+    type = models.CharField(max_length=20, verbose_name="Type of the run, full or update")
+    stage = models.CharField(max_length=20, default=STAGE_PORTS, verbose_name="Stage of the run, ports or dependencies")
+    last_shard = models.IntegerField(default=-1, verbose_name="Index of the last batch committed in the current stage")
+    full_dependency_pass = models.BooleanField(default=False, verbose_name="True if the dependencies of all the ports are loaded")
+    workers = models.IntegerField(default=1, verbose_name="Number of processes loading the ports")
+    last_batches = JSONField(default=dict, verbose_name="Index of the last batch of ports committed by the worker of each shard")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "portindex_update_progress"
+        verbose_name = "PortIndex Update Progress"
+        verbose_name_plural = "PortIndex Update Progress"
+
+    @classmethod
+    def start(cls, commit_hash, type_of_run, workers=1):
+        # only one run can be in progress, an interrupted run which cannot be resumed is dropped
+        cls.objects.all().delete()
+        return cls.objects.create(git_commit_hash=commit_hash, type=type_of_run, workers=workers)
+
+    @classmethod
+    def get_resumable(cls, commit_hash, type_of_run):
+        return cls.objects.filter(git_commit_hash=commit_hash, type=type_of_run).first()
+
+    @property
+    def resumed(self):
+        return self.stage != self.STAGE_PORTS or self.last_shard >= 0 or bool(self.last_batches)
+
+    def checkpoint(self, shard, stage=None, full_dependency_pass=None):
+        self.last_shard = shard
+        if stage is not None:
+            self.stage = stage
+        if full_dependency_pass is not None:
+            self.full_dependency_pass = full_dependency_pass
+        self.save()
+
+    @classmethod
+    def checkpoint_batch(cls, progress_id, shard, batch):
+        # the workers of a sharded run share the row, each one sets only the key of its shard
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE portindex_update_progress SET last_batches = jsonb_set(last_batches, %s, to_jsonb(%s)), "
+                "updated_at = %s WHERE id = %s",
+                [[str(shard)], batch, timezone.now(), progress_id]
+            )
+
+
+class PortIndexUpdateReport(models.Model):
+    git_commit_hash = models.CharField(max_length=50, null=True, verbose_name="Commit hash till which update was done")
+    type = models.CharField(max_length=20, verbose_name="Type of the run, full or update")
+    duration = models.FloatField(verbose_name="Duration of the run in seconds")
+    ports_updated = models.IntegerField(default=0, verbose_name="Number of ports added or updated")
+    ports_deleted = models.IntegerField(default=0, verbose_name="Number of ports marked as deleted")
+    report = JSONField(default=dict, verbose_name="Measurements of the phases of the run")
+    started_at = models.DateTimeField(verbose_name="Time at which the run started")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = "portindex_update_report"
+        verbose_name = "PortIndex Update Report"
+        verbose_name_plural = "PortIndex Update Reports"
+
+    @classmethod
+    def create_from_report(cls, commit_hash, report):
+        report = report.as_dict()
+        rows = {}
+        for phase in report['phases']:
+            rows[phase['name']] = rows.get(phase['name'], 0) + (phase['rows'] or 0)
+
+        return cls.objects.create(
+            git_commit_hash=commit_hash,
+            type=report['type'],
+            duration=report['duration'],
+            started_at=datetime.datetime.fromtimestamp(report['started_at'], tz=datetime.timezone.utc),
+            ports_updated=rows.get('load_ports', 0),
+            ports_deleted=rows.get('mark_deleted', 0),
+            report=report
+        )
+
+    @classmethod
+    def get_updated_ports(cls):
+        # Active ports added or updated by the last recorded run. The ports it skipped as unchanged
+        # keep an older updated_at. All the ports are returned if no run has been recorded.
+        last_run = cls.objects.order_by('-created_at').first()
+        if last_run is None:
+            return Port.objects.filter(active=True)
+        return Port.objects.filter(active=True, updated_at__gte=last_run.started_at)
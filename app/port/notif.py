@@ -1,5 +1,13 @@
+from collections import defaultdict
 from datetime import datetime, timezone
 
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from notifications.models import Notification
+
+from port.models import Port, PendingNotification
+import config
+
 
 def generate_notifications_verb(old, new):
     expr = ""
@@ -7,9 +15,8 @@ def generate_notifications_verb(old, new):
     if old['version'] != new.version:
         expr += "Version updated from '{}' to '{}'".format(old['version'], new.version)
 
-        # update the version_updated_at field
+        # update the version_updated_at field, the caller is responsible for saving the object
         new.version_updated_at = datetime.now(timezone.utc)
-        new.save()
 
     if old['license'] != new.license:
         expr += " License changed from {} to {}.".format(old['license'], new.license)
@@ -18,3 +25,63 @@ def generate_notifications_verb(old, new):
         expr += " Port became obsolete."
 
     return expr
+
+
+class NotificationChangeset:
+    """
+    Collects the notifications generated for ports while they are being updated.
+
+    Nothing is written while the ports are loaded. send() fans the notifications out to the
+    subscribers of the ports with bulk inserts, queue() instead stores one PendingNotification
+    per port, which is sent later by the send-notifications command.
+    """
+
+    def __init__(self):
+        self.notifications = []
+
+    def add(self, port_id, verb, **data):
+        self.notifications.append((port_id, verb, data))
+
+    def deliver(self, defer=False):
+        # the notifications are written only once the changes to the ports have been committed
+        transaction.on_commit(self.queue if defer else self.send)
+
+    def send(self):
+        send_notifications(self.notifications)
+        self.notifications = []
+
+    def queue(self):
+        PendingNotification.objects.bulk_create(
+            [PendingNotification(port_id=port_id, verb=verb, data=data) for port_id, verb, data in self.notifications],
+            batch_size=config.PORT_INGESTION_BATCH_SIZE
+        )
+        self.notifications = []
+
+
+def send_notifications(notifications, batch_size=config.PORT_INGESTION_BATCH_SIZE):
+    # notifications is a list of (port id, verb, extra data) tuples, one Notification is
+    # created for each subscriber of the port, in the same way as notify.send() would
+    content_type = ContentType.objects.get_for_model(Port)
+    now = datetime.now(timezone.utc)
+    through = Port.subscribers.through
+
+    for i in range(0, len(notifications), batch_size):
+        batch = notifications[i:i + batch_size]
+
+        subscribers = defaultdict(list)
+        for port_id, user_id in through.objects.filter(port_id__in=set(n[0] for n in batch)).values_list('port_id', 'user_id'):
+            subscribers[port_id].append(user_id)
+
+        Notification.objects.bulk_create([
+            Notification(
+                recipient_id=user_id,
+                actor_content_type=content_type,
+                actor_object_id=port_id,
+                verb=verb,
+                public=True,
+                timestamp=now,
+                level=Notification.LEVELS.info,
+                data=data if data else None
+            )
+            for port_id, verb, data in batch for user_id in subscribers[port_id]
+        ], batch_size=batch_size)
@@ -3,7 +3,8 @@ from rest_framework import serializers
 from django.contrib.postgres.aggregates import ArrayAgg
 
 from maintainer.serializers import MaintainerListSerializer
-from port.models import Port, Dependency
+from port.models import Port
+from port.dependency_graph import DEPENDENTS, get_direct_ports_by_type
 from port.search_indexes import PortIndex
 from maintainer.search_indexes import MaintainerIndex
 
@@ -47,7 +48,7 @@ class PortSerializer(serializers.ModelSerializer):
         return obj.dependent_port.all().values('type').annotate(ports=ArrayAgg('dependencies__name'))
 
     def get_depends_on(self, obj):
-        return Dependency.objects.filter(dependencies__id=obj.id).values('type').annotate(ports=ArrayAgg('port_name__name'))
+        return get_direct_ports_by_type(obj.id, DEPENDENTS)
 
 
 class SearchSerializer(HaystackSerializer):
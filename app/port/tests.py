@@ -1,9 +1,26 @@
+import io
+import json
+from unittest import mock
+
 from django.test import TransactionTestCase, Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from notifications.models import Notification
 from django.urls import reverse
 
-from port.models import Port, Dependency
+from port.models import Port, Dependency, PendingNotification, PortIndexUpdateProgress
+from port.ingestion import PortLoader, get_shard, load_dependencies, load_checkpointed, load_sharded
+from port.changeset import compute_changeset
+from port.dependency_graph import DEPENDENCIES, reset_dependency_graph, get_recursive_ports
 from port.views import port_landing
+from maintainer.models import Maintainer
+from category.models import Category
+from variant.models import Variant
 from tests import setup
+from parsing_scripts.portindex_json import PortIndexReader
+import config
 
 
 class TestURLsPortDetail(TransactionTestCase):
@@ -105,6 +122,46 @@ class TestDependencies(TransactionTestCase):
         self.assertEquals(dependencies.get(type='run').dependencies.all().first().name, 'port-A1')
         self.assertEquals(dependencies.count(), 2)
 
+    def test_unchanged_dependencies_not_rewritten(self):
+        with open(config.TEST_PORTINDEX_JSON, 'r') as file:
+            ports = json.load(file)['ports']
+
+        with CaptureQueriesContext(connection) as context:
+            load_dependencies(ports)
+        statements = [query['sql'].split(' ', 1)[0] for query in context.captured_queries]
+
+        self.assertNotIn('INSERT', statements)
+        self.assertNotIn('DELETE', statements)
+        self.assertEquals(Dependency.objects.all().count(), 6)
+
+    def test_removed_dependency_type(self):
+        Port.add_or_update([{
+            "name": "port-A1",
+            "version": "1.0.0",
+            "portdir": "categoryA/port-A1",
+            "depends_lib": ["port:port-A2"],
+        }])
+
+        dependencies = Dependency.objects.filter(port_name__name='port-A1')
+        self.assertEquals(dependencies.count(), 1)
+        self.assertEquals(list(dependencies.get(type='lib').dependencies.values_list('name', flat=True)), ['port-A2'])
+
+    def test_queries_do_not_depend_on_port_count(self):
+        Port.add_or_update(generate_ports(30))
+        ports = generate_ports(30)
+        for i, port in enumerate(ports):
+            port['depends_lib'] = ['port:generated-{}'.format((i + 1) % 30), 'port:port-A1']
+            port['depends_build'] = ['bin:port-A2:port-A2']
+
+        with CaptureQueriesContext(connection) as context:
+            load_dependencies(ports[:5], batch_size=100)
+        few_ports = len(context.captured_queries)
+        with CaptureQueriesContext(connection) as context:
+            load_dependencies(ports, batch_size=100)
+
+        self.assertEquals(len(context.captured_queries), few_ports)
+        self.assertEquals(Dependency.objects.get(port_name__name='generated-29', type='lib').dependencies.count(), 2)
+
 
 class TestPortsQueryAndUpdate(TransactionTestCase):
     reset_sequences = True
@@ -296,3 +353,507 @@ class TestPortsQueryAndUpdate(TransactionTestCase):
 
         self.assertEquals(Port.objects.filter(active=True).count(), 6)
 
+    def test_full_deleted_run_returns_changed_ports(self):
+        names = ['port-A1', 'port-A2', 'port-A1-subport', 'PORT-C1', 'PORT-B1']
+        port_ids = Port.mark_deleted_full_run([{'name': name} for name in names])
+
+        self.assertEquals(sorted(port_ids), sorted(Port.objects.filter(active=False).values_list('id', flat=True)))
+        # ports which are already inactive are not changed again
+        self.assertEquals(Port.mark_deleted_full_run([{'name': name} for name in names]), [])
+
+    def test_full_deleted_run_queries(self):
+        # names with characters which have to be escaped in the COPY
+        names = [{'name': 'generated\\{}\t'.format(i)} for i in range(1000)]
+        with CaptureQueriesContext(connection) as context:
+            Port.mark_deleted_full_run([{'name': 'port-A1'}])
+        with CaptureQueriesContext(connection) as context_with_names:
+            Port.mark_deleted_full_run(names)
+
+        self.assertEquals(len(context.captured_queries), len(context_with_names.captured_queries))
+        self.assertEquals(Port.objects.filter(active=True).count(), 0)
+
+    def test_deleted_returns_changed_ports(self):
+        port_ids = Port.mark_deleted({
+            'categorya/port-a1': {'port-a1'},
+            'categorya/port-a2': set(),
+        })
+
+        self.assertEquals(sorted(port_ids), sorted(Port.objects.filter(
+            name__in=['port-A1-subport', 'port-A2']
+        ).values_list('id', flat=True)))
+        self.assertEquals(Port.objects.filter(active=False).count(), 2)
+
+
+
+def generate_ports(count, version="1.0"):
+    return [{
+        "name": "generated-{}".format(i),
+        "portdir": "categoryG/generated-{}".format(i),
+        "version": version,
+        "license": ["MIT", ["PSF", "ZPL"]],
+        "categories": ["categoryG", "categoryA"],
+        "maintainers": [{"github": "user{}".format(i % 3)}],
+        "vinfo": [{"variant": "universal"}, {"variant": "debug", "is_default": True}]
+    } for i in range(count)]
+
+
+class TestBulkPortLoader(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        setup.setup_test_data()
+
+    def count_queries(self, ports, batch_size):
+        loader = PortLoader(batch_size=batch_size)
+        with CaptureQueriesContext(connection) as context:
+            loader.load(ports)
+        return len(context.captured_queries)
+
+    def test_queries_do_not_depend_on_port_count(self):
+        first_run = self.count_queries(generate_ports(10), batch_size=100)
+        second_run = self.count_queries(generate_ports(90)[10:], batch_size=100)
+
+        self.assertEquals(first_run, second_run)
+        self.assertEquals(Port.objects.filter(name__startswith='generated-').count(), 90)
+
+    def test_fields_loaded_in_batches(self):
+        PortLoader(batch_size=7).load(generate_ports(20))
+
+        port = Port.objects.get(name='generated-13')
+        self.assertEquals(port.license, "MIT and (PSF or ZPL)")
+        self.assertEquals(port.categories.all().count(), 2)
+        self.assertEquals(port.maintainers.all().first().github, "user1")
+        self.assertEquals(port.variants.get(variant='debug').is_default, True)
+        self.assertIsNotNone(port.version_updated_at)
+
+        version_updated_at = port.version_updated_at
+        PortLoader(batch_size=7).load(generate_ports(20))
+        self.assertEquals(Port.objects.get(name='generated-13').version_updated_at, version_updated_at)
+
+        PortLoader(batch_size=7).load(generate_ports(20, version="2.0"))
+        port = Port.objects.get(name='generated-13')
+        self.assertEquals(port.version, "2.0")
+        self.assertGreater(port.version_updated_at, version_updated_at)
+        self.assertEquals(Port.objects.filter(name__startswith='generated-').count(), 20)
+
+    def test_dependencies_spooled(self):
+        ports = generate_ports(20)
+        for i, port in enumerate(ports):
+            # the dependency of the first ports is loaded by a later batch
+            port['depends_lib'] = ['port:generated-{}'.format((i + 10) % 20)]
+        loader = PortLoader(batch_size=7)
+        loader.load(ports)
+
+        self.assertEquals(len(loader.dependency_names), 20)
+        self.assertEquals(load_dependencies(loader.get_dependency_objects()), 20)
+        self.assertEquals(
+            list(Port.objects.get(name='generated-3').dependent_port.get(type='lib').dependencies.values_list('name', flat=True)),
+            ['generated-13']
+        )
+
+    def test_unchanged_relations_are_not_rewritten(self):
+        PortLoader().load(generate_ports(10))
+        variant_ids = set(Variant.objects.values_list('id', flat=True))
+
+        loader = PortLoader()
+        with CaptureQueriesContext(connection) as context:
+            loader.load(generate_ports(10))
+        statements = [query['sql'].split(' ', 1)[0] for query in context.captured_queries]
+
+        self.assertNotIn('INSERT', statements)
+        self.assertNotIn('DELETE', statements)
+        self.assertEquals(set(Variant.objects.values_list('id', flat=True)), variant_ids)
+
+    def test_relations_diffed(self):
+        ports = generate_ports(3)
+        PortLoader().load(ports)
+        kept_variant = Variant.objects.get(port__name='generated-1', variant='universal')
+
+        ports[1]['categories'] = ['categoryA', 'categoryNew']
+        ports[1]['maintainers'] = [{"github": "user0"}, {"github": "USER2"}]
+        ports[1]['vinfo'] = [{"variant": "universal", "description": "Build for multiple architectures"}]
+        PortLoader().load(ports)
+
+        port = Port.objects.get(name='generated-1')
+        self.assertEquals(set(port.categories.values_list('name', flat=True)), {'categoryA', 'categoryNew'})
+        self.assertEquals(set(port.maintainers.values_list('github', flat=True)), {'user0', 'user2'})
+        self.assertEquals(Maintainer.objects.filter(github__iexact='user2', name='', domain='').count(), 1)
+        self.assertEquals(port.variants.count(), 1)
+        self.assertEquals(port.variants.first().id, kept_variant.id)
+        self.assertEquals(port.variants.first().description, "Build for multiple architectures")
+        self.assertEquals(Port.objects.get(name='generated-2').variants.count(), 2)
+
+    def test_ports_from_stream(self):
+        Port.objects.all().delete()
+        Port.add_or_update(PortIndexReader(config.TEST_PORTINDEX_JSON))
+
+        self.assertEquals(Port.objects.all().count(), 8)
+        self.assertEquals(Dependency.objects.all().count(), 6)
+
+
+class TestUnchangedPortsSkipped(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        setup.setup_test_data()
+
+    def test_hash_stored(self):
+        self.assertEquals(Port.objects.filter(portindex_hash__isnull=True).count(), 0)
+
+    def test_unchanged_ports_skipped(self):
+        ports = generate_ports(5)
+        Port.add_or_update(ports, skip_unchanged=True)
+        updated_at = dict(Port.objects.values_list('name', 'updated_at'))
+
+        ports[2]['version'] = "1.1"
+        updated_port_objects = Port.add_or_update(ports, skip_unchanged=True)
+
+        self.assertEquals([p.name for p in updated_port_objects], ['generated-2'])
+        for name, timestamp in Port.objects.values_list('name', 'updated_at'):
+            if name == 'generated-2':
+                self.assertGreater(timestamp, updated_at[name])
+            else:
+                self.assertEquals(timestamp, updated_at[name])
+
+    def test_inactive_port_not_skipped(self):
+        with open(config.TEST_PORTINDEX_JSON, 'r') as file:
+            data = json.load(file)
+        Port.mark_deleted_full_run([{'name': 'port-A1'}])
+        Port.add_or_update(data['ports'], skip_unchanged=True)
+
+        self.assertEquals(Port.objects.filter(active=False).count(), 0)
+
+    def test_dependency_on_new_port_resolved(self):
+        ports = generate_ports(2)
+        ports[0]['depends_lib'] = ['port:generated-new']
+        Port.add_or_update(ports, skip_unchanged=True)
+        self.assertEquals(Dependency.objects.get(port_name__name='generated-0', type='lib').dependencies.count(), 0)
+
+        ports.append({"name": "generated-new", "portdir": "categoryG/generated-new", "version": "1.0"})
+        Port.add_or_update(ports, skip_unchanged=True)
+        self.assertEquals(Dependency.objects.get(port_name__name='generated-0', type='lib').dependencies.first().name, 'generated-new')
+
+
+class TestShardedLoading(TransactionTestCase):
+    reset_sequences = True
+
+    def test_shards(self):
+        ports = generate_ports(40)
+        shards = set(get_shard(port, 4) for port in ports)
+
+        self.assertEquals(shards, {0, 1, 2, 3})
+        self.assertEquals(get_shard({'portdir': 'categoryA/Port-A1'}, 4), get_shard({'portdir': 'categorya/port-a1'}, 4))
+
+    def load(self, progress):
+        return load_sharded(progress, lambda: PortIndexReader(config.TEST_PORTINDEX_JSON), lambda: self.finished.append(True))
+
+    def test_parallel_load(self):
+        self.finished = []
+        self.load(PortIndexUpdateProgress.start('abc', 'full', workers=3))
+
+        self.assertEquals(Port.objects.all().count(), 8)
+        self.assertEquals(Dependency.objects.all().count(), 6)
+        self.assertEquals(Category.objects.all().count(), 3)
+        self.assertEquals(Maintainer.objects.all().count(), 6)
+        self.assertEquals(Dependency.objects.get(port_name__name='port-A1', type='lib').dependencies.count(), 2)
+        self.assertEquals(self.finished, [True])
+        self.assertEquals(PortIndexUpdateProgress.objects.count(), 0)
+
+        updated_ports = load_sharded(
+            PortIndexUpdateProgress.start('abc', 'full', workers=3),
+            lambda: PortIndexReader(config.TEST_PORTINDEX_JSON),
+            lambda: None,
+            skip_unchanged=True
+        )
+        self.assertEquals(updated_ports, [])
+
+    def test_resume(self):
+        self.finished = []
+        ports = list(PortIndexReader(config.TEST_PORTINDEX_JSON))
+        progress = PortIndexUpdateProgress.start('abc', 'full', workers=3)
+        # the worker of the first shard has committed its only batch before the run was interrupted
+        PortIndexUpdateProgress.checkpoint_batch(progress.id, 0, 0)
+        progress.refresh_from_db()
+        self.assertTrue(progress.resumed)
+
+        updated_ports = self.load(progress)
+        self.assertEquals(
+            sorted(updated_ports),
+            sorted(port['name'] for port in ports if get_shard(port, 3) != 0)
+        )
+        self.assertEquals(self.finished, [True])
+        self.assertEquals(PortIndexUpdateProgress.objects.count(), 0)
+        # the dependencies of all the loaded ports are loaded by a resumed run
+        self.assertEquals(
+            set(Dependency.objects.values_list('port_name__name', 'type')),
+            {('port-A4', 'fetch'), ('port-A5', 'run')}
+        )
+
+
+class TestNotifications(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        setup.setup_test_data()
+        self.port = Port.objects.get(name='port-A1')
+        for i in range(5):
+            self.port.subscribers.add(User.objects.create_user(username='user{}'.format(i)))
+
+    def update_version(self, version, **kwargs):
+        Port.add_or_update([{
+            "name": "port-A1",
+            "portdir": "categoryA/port-A1",
+            "version": version,
+            "license": ["MIT"]
+        }], **kwargs)
+
+    def test_version_update(self):
+        self.update_version("2.0")
+
+        self.assertEquals(Notification.objects.all().count(), 5)
+        notification = Notification.objects.first()
+        self.assertEquals(notification.actor, self.port)
+        self.assertEquals(notification.verb, "Version updated from '1.0.0' to '2.0'")
+        self.assertEquals(notification.data, {'portdir': 'categoryA/port-A1', 'version': '2.0'})
+
+    def test_queries_do_not_depend_on_subscribers(self):
+        self.update_version("2.0")
+        with CaptureQueriesContext(connection) as context:
+            self.update_version("3.0")
+        five_subscribers = len(context.captured_queries)
+
+        for i in range(5, 50):
+            self.port.subscribers.add(User.objects.create_user(username='user{}'.format(i)))
+        with CaptureQueriesContext(connection) as context:
+            self.update_version("4.0")
+
+        self.assertEquals(len(context.captured_queries), five_subscribers)
+        self.assertEquals(Notification.objects.filter(verb__contains="'4.0'").count(), 50)
+
+    def test_deferred(self):
+        self.update_version("2.0", defer_notifications=True)
+        Port.mark_deleted({'categorya/port-a1': {}}, defer_notifications=True)
+
+        self.assertEquals(Notification.objects.all().count(), 0)
+        # port-A1-subport is deleted as well, but has no subscribers
+        self.assertEquals(PendingNotification.objects.all().count(), 3)
+
+        stdout = io.StringIO()
+        call_command('send-notifications', stdout=stdout)
+
+        self.assertEquals(stdout.getvalue(), "Sent notifications for 3 port updates\n")
+        self.assertEquals(Notification.objects.all().count(), 10)
+        self.assertEquals(Notification.objects.filter(verb="Port has been deleted.").count(), 5)
+        self.assertEquals(PendingNotification.objects.all().count(), 0)
+
+
+class TestChangeset(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        setup.setup_test_data()
+        with open(config.TEST_PORTINDEX_JSON, 'r') as file:
+            self.ports = json.load(file)['ports']
+
+    def get_port(self, name):
+        return next(port for port in self.ports if port['name'] == name)
+
+    def test_no_changes(self):
+        # all the ports are compared field by field, without the shortcut of the hashes
+        changeset = compute_changeset(self.ports, skip_unchanged=False)
+
+        self.assertEquals(changeset, {
+            'new_ports': [],
+            'changed_ports': {},
+            'deactivated_ports': [],
+            'unchanged_ports': len(self.ports),
+        })
+
+    def test_changes(self):
+        port = self.get_port('port-A1')
+        port['version'] = '2.0.0'
+        port['categories'] = ['categoryA', 'categoryC']
+        port['maintainers'] = []
+        port['vinfo'] = [{'variant': 'universal', 'description': 'Build for multiple architectures'}, {'variant': 'docs'}]
+        port['depends_lib'] = ['port:port-A3-diff', 'port:new-port']
+        del port['depends_fetch']
+        self.ports.append({'name': 'new-port', 'portdir': 'categoryA/new-port', 'version': '1.0'})
+        self.ports.remove(self.get_port('port-A2'))
+
+        with CaptureQueriesContext(connection) as context:
+            changeset = compute_changeset(self.ports)
+
+        self.assertTrue(all(query['sql'].startswith('SELECT') for query in context.captured_queries))
+        self.assertEquals(changeset['new_ports'], ['new-port'])
+        self.assertEquals(changeset['deactivated_ports'], ['port-A2'])
+        self.assertEquals(changeset['unchanged_ports'], len(self.ports) - 2)
+        self.assertEquals(changeset['changed_ports'], {
+            'port-A1': {
+                'fields': {'version': ['1.0.0', '2.0.0']},
+                'categories': {'added': ['categoryc']},
+                'maintainers': {'removed': ['user']},
+                'variants': {'added': ['docs'], 'changed': ['universal']},
+                'dependencies': {
+                    'lib': {'added': ['new-port'], 'removed': ['port-a2']},
+                    'fetch': {'removed': ['port-a4']},
+                },
+            }
+        })
+
+        # the changeset describes what the ingestion then does
+        Port.add_or_update(self.ports)
+        Port.mark_deleted_full_run(self.ports)
+        self.assertEquals(compute_changeset(self.ports, skip_unchanged=False)['changed_ports'], {})
+
+    def test_incremental(self):
+        port = self.get_port('port-A1')
+        port['version'] = '2.0.0'
+
+        changeset = compute_changeset([port], {'categorya/port-a1': {'port-a1'}})
+
+        self.assertEquals(changeset['deactivated_ports'], ['port-A1-subport'])
+        self.assertEquals(changeset['changed_ports'], {'port-A1': {'fields': {'version': ['1.0.0', '2.0.0']}}})
+
+
+class TestCheckpointedLoading(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        self.ports = generate_ports(1200)
+        # every port depends on the next one, which is loaded in a later batch for the last port of a batch
+        for i, port in enumerate(self.ports[:-1]):
+            port['depends_lib'] = ['port:generated-{}'.format(i + 1)]
+        self.finished = []
+
+    def interrupted_ports(self, count):
+        def get_ports():
+            yield from self.ports[:count]
+            raise RuntimeError("interrupted")
+        return get_ports
+
+    def load(self, progress, get_ports):
+        load_checkpointed(progress, get_ports, lambda: self.finished.append(True))
+
+    def get_dependency_rows(self):
+        return set(Dependency.dependencies.through.objects.values_list('dependency__port_name__name', 'port__name'))
+
+    def assertLoaded(self):
+        self.assertEquals(Port.objects.count(), 1200)
+        self.assertEquals(self.finished, [True])
+        self.assertEquals(PortIndexUpdateProgress.objects.count(), 0)
+        self.assertEquals(self.get_dependency_rows(), set(
+            ('generated-{}'.format(i), 'generated-{}'.format(i + 1)) for i in range(1199)
+        ))
+
+    def test_resume_ports(self):
+        progress = PortIndexUpdateProgress.start('abc', 'full')
+        with self.assertRaises(RuntimeError):
+            self.load(progress, self.interrupted_ports(800))
+
+        # the first batch has been committed, the second one has been rolled back
+        progress = PortIndexUpdateProgress.get_resumable('abc', 'full')
+        self.assertEquals((progress.stage, progress.last_shard), ('ports', 0))
+        self.assertEquals(Port.objects.count(), 500)
+        self.assertEquals(self.finished, [])
+
+        with CaptureQueriesContext(connection) as context:
+            self.load(progress, lambda: iter(self.ports))
+        inserts = [q['sql'] for q in context.captured_queries if q['sql'].startswith('INSERT INTO "port"')]
+        self.assertEquals(len(inserts), 2)
+        self.assertLoaded()
+
+    def test_resume_dependencies(self):
+        progress = PortIndexUpdateProgress.start('abc', 'full')
+        with mock.patch('port.ingestion.load_dependencies_batch', side_effect=[None, RuntimeError("interrupted")]):
+            with self.assertRaises(RuntimeError):
+                self.load(progress, lambda: iter(self.ports))
+
+        progress = PortIndexUpdateProgress.get_resumable('abc', 'full')
+        self.assertEquals((progress.stage, progress.last_shard), ('dependencies', 0))
+        # the batches of dependencies came from the loader, they are all loaded again
+        self.assertFalse(progress.full_dependency_pass)
+        self.assertEquals(Port.objects.count(), 1200)
+
+        self.load(progress, lambda: iter(self.ports))
+        self.assertLoaded()
+
+    def test_other_commit_not_resumed(self):
+        PortIndexUpdateProgress.start('abc', 'full').checkpoint(1)
+
+        self.assertIsNone(PortIndexUpdateProgress.get_resumable('def', 'full'))
+        self.assertIsNone(PortIndexUpdateProgress.get_resumable('abc', 'update'))
+        progress = PortIndexUpdateProgress.start('def', 'full')
+        self.assertEquals(list(PortIndexUpdateProgress.objects.all()), [progress])
+        self.assertEquals(progress.last_shard, -1)
+
+
+class TestDependencyGraph(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        reset_dependency_graph()
+        self.ports = generate_ports(5)
+        for i in range(3):
+            self.ports[i]['depends_lib'] = ['port:generated-{}'.format(i + 1)]
+        self.ports[3]['depends_build'] = ['bin:generated-4:generated-4']
+        Port.add_or_update(self.ports)
+        self.client = Client()
+
+    def get_recursive(self, name, direction, query=''):
+        response = self.client.get('/api/v1/ports/{}/recursive_{}/{}'.format(name, direction, query))
+        self.assertEquals(response.status_code, 200)
+        return response.json()
+
+    def test_recursive_dependencies(self):
+        response = self.get_recursive('generated-0', 'dependencies')
+
+        self.assertEquals(response['count'], 4)
+        self.assertEquals(response['ports'], [
+            {'name': 'generated-1', 'depth': 1},
+            {'name': 'generated-2', 'depth': 2},
+            {'name': 'generated-3', 'depth': 3},
+            {'name': 'generated-4', 'depth': 4},
+        ])
+        self.assertEquals(response['counts_by_type']['lib'], 3)
+        self.assertEquals(response['counts_by_type']['build'], 0)
+        self.assertEquals(self.get_recursive('generated-0', 'dependencies', '?type=lib')['count'], 3)
+
+    def test_recursive_dependents(self):
+        response = self.get_recursive('GENERATED-4', 'dependents')
+
+        self.assertEquals(response['name'], 'generated-4')
+        self.assertEquals([p['name'] for p in response['ports']], ['generated-3', 'generated-2', 'generated-1', 'generated-0'])
+        self.assertEquals(response['counts_by_type']['build'], 1)
+        self.assertEquals(self.get_recursive('generated-4', 'dependents', '?type=build&type=lib')['count'], 4)
+
+    def test_unknown_type(self):
+        response = self.client.get('/api/v1/ports/generated-0/recursive_dependencies/?type=unknown')
+
+        self.assertEquals(response.status_code, 400)
+
+    def test_refreshed_after_changes(self):
+        self.assertEquals(self.get_recursive('generated-0', 'dependencies')['count'], 4)
+
+        # generated-1 no longer depends on generated-2, only its edges are read again
+        del self.ports[1]['depends_lib']
+        Port.add_or_update(self.ports[1:2])
+        queries = []
+
+        def capture(execute, sql, params, many, context):
+            queries.append(sql % tuple(params or ()))
+            return execute(sql, params, many, context)
+
+        port_id = Port.objects.get(name='generated-0').id
+        with connection.execute_wrapper(capture):
+            dependencies = get_recursive_ports(port_id, DEPENDENCIES)
+
+        self.assertEquals(dependencies, {Port.objects.get(name='generated-1').id: 1})
+        self.assertEquals(self.get_recursive('generated-4', 'dependents')['count'], 2)
+        edge_queries = [sql for sql in queries if 'dependency_dependencies' in sql]
+        self.assertEquals(len(edge_queries), 1)
+        self.assertIn('IN (2)', edge_queries[0])
+
+    def test_depends_on(self):
+        response = self.client.get('/api/v1/ports/generated-4/')
+
+        self.assertEquals(response.json()['depends_on'], [{'type': 'build', 'ports': ['generated-3']}])
@@ -5,8 +5,10 @@ from bs4 import BeautifulSoup
 from django.shortcuts import render, reverse
 from django.http import HttpResponse, HttpResponseRedirect
 from django.db.models import Subquery, Count, Prefetch, Q
-from django.contrib.postgres.aggregates import ArrayAgg
 from rest_framework import mixins, viewsets, filters
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_haystack.viewsets import HaystackViewSet
 from django.views.decorators.cache import cache_page
@@ -15,7 +17,9 @@ from django.contrib.auth.decorators import login_required
 from utilities import paginate
 from port.forms import AdvancedSearchForm
 from port.serializers import PortHaystackSerializer, PortSerializer
-from port.models import Port, Dependency
+from port.models import Port, DEPENDENCY_TYPES
+from port.database import Cardinality
+from port.dependency_graph import DEPENDENCIES, DEPENDENTS, get_recursive_ports_with_counts, get_direct_ports_by_type, get_port_names
 from buildhistory.models import BuildHistory, Builder
 from buildhistory.forms import BuildHistoryForm
 from stats.models import Submission, PortInstallation
@@ -51,9 +55,9 @@ def port_details(request, name):
     except Port.DoesNotExist:
         return render(request, 'port/exceptions/port_not_found.html', {'name': name})
 
-    this_builds = BuildHistory.objects.filter(port_name__iexact=name).annotate(files_count=Count('files')).order_by('-time_start')
+    this_builds = BuildHistory.objects.filter(port_name__iexact=name).annotate(files_count=Cardinality('file_ids')).order_by('-time_start')
     builders = Builder.objects.all().prefetch_related(Prefetch('builds', queryset=this_builds, to_attr='latest_builds'))
-    dependents = Dependency.objects.filter(dependencies__id=port.id).values('type').annotate(ports=ArrayAgg('port_name__name'))
+    dependents = get_direct_ports_by_type(port.id, DEPENDENTS)
 
     count = get_install_count(port.name, 30)
     return render(request, 'port/port_details.html', {
@@ -229,6 +233,30 @@ class PortAPIView(viewsets.ReadOnlyModelViewSet):
     search_fields = ['name', 'maintainers__github', 'variants__variant', 'categories__name']
     filterset_fields = ['name', 'categories', 'maintainers__github', 'variants__variant']
 
+    @action(detail=True)
+    def recursive_dependencies(self, request, **kwargs):
+        return self.get_recursive_ports_response(DEPENDENCIES)
+
+    @action(detail=True)
+    def recursive_dependents(self, request, **kwargs):
+        return self.get_recursive_ports_response(DEPENDENTS)
+
+    def get_recursive_ports_response(self, direction):
+        # ?type=lib&type=run follows only the dependencies of the given types
+        port = self.get_object()
+        types = self.request.query_params.getlist('type') or None
+        if types is not None and not set(types).issubset(DEPENDENCY_TYPES):
+            raise ValidationError({'type': "Expected one or more of: {}".format(", ".join(DEPENDENCY_TYPES))})
+
+        depths, counts_by_type = get_recursive_ports_with_counts(port.id, direction, types, DEPENDENCY_TYPES)
+        names = get_port_names(depths.keys())
+        return Response({
+            'name': port.name,
+            'count': len(depths),
+            'counts_by_type': counts_by_type,
+            'ports': sorted(({'name': names[i], 'depth': depth} for i, depth in depths.items()), key=lambda p: (p['depth'], p['name'].lower()))
+        })
+
 
 class SearchAPIView(HaystackViewSet):
     index_models = [Port]
@@ -0,0 +1,45 @@
+import datetime
+
+from django.test import TransactionTestCase
+
+from buildhistory.models import Builder, BuildHistory
+from parsing_scripts.benchmark_build_history import run_benchmark, compare_configurations, generate_build_objects, \
+    get_index_definitions, get_read_paths, is_unindexed
+
+
+class TestBenchmarkBuildHistory(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        Builder.objects.clear_ids_cache()
+
+    def test_deterministic(self):
+        now = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        self.assertEquals(generate_build_objects(100, 10, seed=1, now=now), generate_build_objects(100, 10, seed=1, now=now))
+        self.assertNotEqual(generate_build_objects(100, 10, seed=1, now=now), generate_build_objects(100, 10, seed=2, now=now))
+
+    def test_report(self):
+        indexes = get_index_definitions()
+        report = run_benchmark(1000, 50, repeat=1)
+
+        self.assertEquals(set(report['configurations']), {'previous', 'current'})
+        read_paths = [name for name, url, params in get_read_paths(['port0'])]
+        for configuration in report['configurations'].values():
+            self.assertEquals(set(configuration['write']), {'wall_time', 'queries', 'query_time', 'peak_memory', 'builds_per_second'})
+            self.assertEquals(list(configuration['reads']), read_paths)
+        self.assertEquals(BuildHistory.objects.count(), 1000)
+        # the current indexes are restored and serve every read path
+        self.assertEquals(get_index_definitions(), indexes)
+        self.assertEquals([queries for queries in report['configurations']['current']['unindexed_queries'].values() if queries], [])
+
+        changes = list(compare_configurations(report))
+        self.assertEquals(len(changes), len(read_paths) + 1)
+
+    def test_is_unindexed(self):
+        scan = {'Node Type': 'Seq Scan', 'Relation Name': 'builds_y2026m01', 'Filter': "(status = 'failed')"}
+        index_scan = {'Node Type': 'Index Scan', 'Relation Name': 'builds_y2026m01', 'Index Cond': "(status = 'failed')"}
+
+        self.assertTrue(is_unindexed({'Node Type': 'Append', 'Plans': [index_scan, scan]}, set()))
+        self.assertFalse(is_unindexed({'Node Type': 'Append', 'Plans': [index_scan]}, set()))
+        self.assertFalse(is_unindexed({'Node Type': 'Limit', 'Plans': [scan]}, set()))
+        self.assertFalse(is_unindexed(scan, {'builds_y2026m01'}))
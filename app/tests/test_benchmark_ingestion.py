@@ -0,0 +1,68 @@
+import tempfile
+
+from django.db import connection
+from django.test import TransactionTestCase
+
+from port.models import Port
+from parsing_scripts.benchmark_ingestion import run_benchmark, compare_reports, get_updated_portdirs, measure
+from parsing_scripts.synthetic_portindex import generate_ports, DEPENDENCY_TYPES
+
+
+class TestSyntheticPortIndex(TransactionTestCase):
+    reset_sequences = True
+
+    def test_deterministic(self):
+        self.assertEquals(generate_ports(200, seed=1), generate_ports(200, seed=1))
+        self.assertNotEqual(generate_ports(200, seed=1), generate_ports(200, seed=2))
+
+    def test_dependencies_exist(self):
+        ports = generate_ports(500)
+        names = set(port['name'] for port in ports)
+
+        self.assertEquals(len(ports), 500)
+        self.assertEquals(len(names), 500)
+        for port in ports:
+            for dependency_type, weight in DEPENDENCY_TYPES:
+                for dependency in port.get('depends_' + dependency_type, []):
+                    self.assertIn(dependency.split(':')[-1], names)
+
+    def test_revision(self):
+        ports = generate_ports(2000)
+        updated_ports = generate_ports(2000, revision=1)
+        dict_of_portdirs_with_ports = get_updated_portdirs(ports, updated_ports)
+
+        self.assertLess(len(updated_ports), len(ports))
+        self.assertGreater(len(dict_of_portdirs_with_ports), 0)
+        self.assertLess(len(dict_of_portdirs_with_ports), len(ports) / 10)
+
+
+class TestBenchmarkIngestion(TransactionTestCase):
+    reset_sequences = True
+
+    def test_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            report = run_benchmark([100], 0, directory)
+
+        self.assertEquals(report['runs'][0]['ports'], 100)
+        self.assertEquals(list(report['runs'][0]['phases']), [
+            'full_ingestion',
+            'full_mark_deleted',
+            'full_ingestion_unchanged',
+            'incremental_mark_deleted',
+            'incremental_ingestion',
+        ])
+        for measurements in report['runs'][0]['phases'].values():
+            self.assertEquals(set(measurements), {'wall_time', 'queries', 'query_time', 'peak_memory'})
+        self.assertEquals(Port.objects.filter(active=True).count(), len(generate_ports(100, revision=1)))
+
+        changes = list(compare_reports(report, report))
+        self.assertTrue(all(change == 0 for ports, phase, key, old_value, value, change in changes))
+
+    def test_measure_counts_every_query(self):
+        # more queries than the query log of the connection keeps
+        phases = {}
+        with measure(phases, 'queries'), connection.cursor() as cursor:
+            for i in range(connection.queries_limit + 100):
+                cursor.execute("SELECT 1")
+
+        self.assertEquals(phases['queries']['queries'], connection.queries_limit + 100)
@@ -1,8 +1,21 @@
+import io
+import json
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
 
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TransactionTestCase
 
 from parsing_scripts import git_update
+from parsing_scripts.portindex_json import PortIndexReader
+from port.instrumentation import RunReport
+from port.models import Port, PortIndexUpdateReport, PortIndexUpdateProgress
 import config
 
 
@@ -16,3 +29,214 @@ class TestGitUpdates(TransactionTestCase):
 
         self.assertTrue(os.path.isdir(config.MACPORTS_PORTS_DIR))
         self.assertTrue(os.path.isdir(config.MACPORTS_CONTRIB_DIR))
+
+
+# Stand-in for portindex, indexes the Portfiles of the ports tree in the current directory,
+# every line of the PortIndex is "portdir version"
+PORTINDEX_STUB = """
+import os
+
+with open('PortIndex', 'w') as index:
+    for category in sorted(os.listdir('.')):
+        if not os.path.isdir(category) or category.startswith(('_', '.')):
+            continue
+        for port in sorted(os.listdir(category)):
+            with open(os.path.join(category, port, 'Portfile')) as portfile:
+                index.write('{}/{} {}\\n'.format(category, port, portfile.read().strip()))
+"""
+
+# Stand-in for portindex2json.tcl, run as: interpreter script PortIndex --info commit=<commit>
+PORTINDEX2JSON_STUB = """
+import json
+import sys
+
+ports = []
+with open(sys.argv[1]) as index:
+    for line in index:
+        portdir, version = line.split()
+        ports.append({'name': portdir.split('/')[1], 'portdir': portdir, 'version': version})
+print(json.dumps({'info': {'commit': sys.argv[3].split('=', 1)[1]}, 'ports': ports}))
+"""
+
+
+class TestIncrementalPortIndex(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        data_dir = self.directory.name
+        ports_dir = os.path.join(data_dir, 'ports')
+        contrib_dir = os.path.join(data_dir, 'contrib')
+        os.mkdir(contrib_dir)
+
+        portindex = os.path.join(data_dir, 'portindex')
+        with open(portindex, 'w') as file:
+            file.write('#!{}\n{}'.format(sys.executable, PORTINDEX_STUB))
+        os.chmod(portindex, 0o755)
+        portindex2json = os.path.join(contrib_dir, 'portindex2json.py')
+        with open(portindex2json, 'w') as file:
+            file.write(PORTINDEX2JSON_STUB)
+
+        patcher = mock.patch.multiple(
+            config,
+            DATA_DIR=data_dir,
+            MACPORTS_PORTS_DIR=ports_dir,
+            MACPORTS_CONTRIB_DIR=contrib_dir,
+            LOCAL_PORTINDEX_JSON=os.path.join(ports_dir, 'portindex.json'),
+            LOCAL_PORTINDEX_CHANGES_JSON=os.path.join(ports_dir, 'portindex-changes.json'),
+            PORTINDEX=portindex,
+            TCLSH=sys.executable,
+            PORTINDEX2JSON=portindex2json,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        os.mkdir(ports_dir)
+        self.git('init', '--quiet')
+        self.write_file('README', 'ports')
+        self.commit()
+        self.write_file('categoryA/port-A1/Portfile', '1.0')
+        self.write_file('categoryB/port-B1/Portfile', '1.0')
+        self.write_file('_resources/port1.0/group/test-1.0.tcl', '')
+        self.first_commit = self.commit()
+        git_update.refresh_portindex_json()
+
+    def git(self, *args):
+        return subprocess.run(
+            [config.GIT, '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args],
+            cwd=config.MACPORTS_PORTS_DIR, stdout=subprocess.PIPE, check=True
+        ).stdout.decode('utf-8').strip()
+
+    def write_file(self, path, content):
+        path = os.path.join(config.MACPORTS_PORTS_DIR, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(content)
+
+    def commit(self):
+        self.git('add', '-A')
+        self.git('commit', '--quiet', '-m', 'update')
+        return self.git('rev-parse', 'HEAD')
+
+    def read_ports(self, path):
+        return {port['portdir']: port['version'] for port in PortIndexReader(path)}
+
+    def test_changed_portdirs_merged(self):
+        self.write_file('README', 'updated')
+        old_commit = self.commit()
+        self.write_file('categoryA/port-A1/Portfile', '2.0')
+        self.write_file('categoryC/port-C1/Portfile', '1.0')
+        shutil.rmtree(os.path.join(config.MACPORTS_PORTS_DIR, 'categoryB'))
+        new_commit = self.commit()
+
+        commit, portdirs = git_update.refresh_portindex_json_incremental(old_commit)
+
+        self.assertEquals(commit, new_commit)
+        self.assertEquals(portdirs, {'categoryA/port-A1', 'categoryB/port-B1', 'categoryC/port-C1'})
+        # only the changed portdirs have been regenerated
+        self.assertEquals(self.read_ports(config.LOCAL_PORTINDEX_CHANGES_JSON), {
+            'categoryA/port-A1': '2.0',
+            'categoryC/port-C1': '1.0'
+        })
+        self.assertEquals(self.read_ports(config.LOCAL_PORTINDEX_JSON), {
+            'categoryA/port-A1': '2.0',
+            'categoryC/port-C1': '1.0'
+        })
+        self.assertEquals(git_update.get_portindex_json().read_info(), {'commit': new_commit})
+
+    def test_unchanged_ports_kept(self):
+        self.write_file('README', 'updated')
+        old_commit = self.commit()
+        self.write_file('categoryB/port-B1/Portfile', '2.0')
+        self.commit()
+
+        git_update.refresh_portindex_json_incremental(old_commit)
+
+        self.assertEquals(self.read_ports(config.LOCAL_PORTINDEX_CHANGES_JSON), {'categoryB/port-B1': '2.0'})
+        self.assertEquals(self.read_ports(config.LOCAL_PORTINDEX_JSON), {
+            'categoryA/port-A1': '1.0',
+            'categoryB/port-B1': '2.0'
+        })
+
+    def test_resources_changed(self):
+        self.write_file('README', 'updated')
+        old_commit = self.commit()
+        self.write_file('_resources/port1.0/group/test-1.0.tcl', 'changed')
+        self.write_file('categoryA/port-A1/Portfile', '2.0')
+        self.commit()
+
+        git_update.refresh_portindex_json_incremental(old_commit)
+
+        # a PortGroup can affect any port, the whole tree is indexed again
+        self.assertFalse(os.path.isfile(config.LOCAL_PORTINDEX_CHANGES_JSON))
+        self.assertEquals(git_update.get_updated_portindex_json().source, config.LOCAL_PORTINDEX_JSON)
+        self.assertEquals(self.read_ports(config.LOCAL_PORTINDEX_JSON), {
+            'categoryA/port-A1': '2.0',
+            'categoryB/port-B1': '1.0'
+        })
+
+    def test_update_portinfo_report(self):
+        report_path = os.path.join(self.directory.name, 'report.json')
+        # the range of an incremental update includes the last processed commit
+        self.write_file('README', 'updated')
+        self.commit()
+        call_command('update-portinfo', type='full', report=report_path)
+        self.write_file('categoryB/port-B1/Portfile', '2.0')
+        commit = self.commit()
+        call_command('update-portinfo', stdout=io.StringIO())
+
+        with open(report_path, 'r') as file:
+            full_report = json.load(file)
+        self.assertEquals([phase['name'] for phase in full_report['phases']], [
+            'git_pull', 'portindex', 'json_parse', 'load_ports', 'load_dependencies', 'mark_deleted'
+        ])
+        self.assertEquals(PortIndexUpdateReport.objects.count(), 2)
+
+        update_report = PortIndexUpdateReport.objects.order_by('created_at').last()
+        phases = {phase['name']: phase for phase in update_report.report['phases']}
+        self.assertEquals(update_report.type, 'update')
+        self.assertEquals(update_report.git_commit_hash, commit)
+        self.assertLess(update_report.started_at, update_report.created_at)
+        self.assertEquals(update_report.ports_updated, 1)
+        self.assertEquals(phases['git_diff']['rows'], 1)
+        self.assertEquals(phases['json_parse']['rows'], 1)
+        self.assertGreater(phases['load_ports']['queries'], 0)
+        self.assertEquals(Port.objects.get(name='port-B1').version, '2.0')
+
+    def test_update_portinfo_dry_run(self):
+        output = io.StringIO()
+        call_command('update-portinfo', type='full', dry_run=True, stdout=output)
+
+        self.assertEquals(json.loads(output.getvalue())['new_ports'], ['port-A1', 'port-B1'])
+        self.assertEquals(Port.objects.count(), 0)
+        self.assertEquals(PortIndexUpdateReport.objects.count(), 0)
+
+    def test_update_portinfo_interrupted_full_run(self):
+        call_command('update-portinfo', type='full', stdout=io.StringIO())
+        PortIndexUpdateProgress.start(git_update.get_old_commit(), 'full').checkpoint(0)
+
+        with self.assertRaises(CommandError):
+            call_command('update-portinfo', stdout=io.StringIO())
+
+        # the full run is resumed with the cached portindex.json instead of pulling again
+        with mock.patch.object(git_update, 'refresh_portindex_json') as refresh_portindex_json:
+            call_command('update-portinfo', type='full', stdout=io.StringIO())
+        refresh_portindex_json.assert_not_called()
+        self.assertEquals(PortIndexUpdateProgress.objects.count(), 0)
+
+    def test_timed_phase(self):
+        def slow_items():
+            for item in range(50):
+                time.sleep(0.0004)
+                yield item
+
+        report = RunReport()
+        self.assertEquals(list(report.timed('json_parse', slow_items())), list(range(50)))
+
+        phase = report.as_dict()['phases'][0]
+        self.assertEquals(phase['rows'], 50)
+        # items each shorter than the rounding still add up
+        self.assertGreaterEqual(phase['duration'], 0.02)
+        self.assertGreaterEqual(phase['peak_memory_growth'], 0)
+        self.assertGreater(report.as_dict()['process_peak_memory'], 0)
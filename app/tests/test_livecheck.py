@@ -0,0 +1,164 @@
+import datetime
+import io
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from parsing_scripts import run_livecheck
+from parsing_scripts.livecheck_schedule import get_scheduled_ports
+from port.models import Port, LiveCheck
+from stats.models import Submission, PortInstallation
+import config
+
+
+# Stand-in for the port command, run as: port livecheck <name>
+# "slow" never finishes in time, "flaky" only on its first try, and its sleeping child must be killed with it
+PORT_STUB = """
+import os
+import subprocess
+import sys
+import time
+
+name = sys.argv[2]
+marker = os.path.join(os.path.dirname(sys.argv[0]), name + '.tried')
+if name == 'slow' or (name == 'flaky' and not os.path.exists(marker)):
+    open(marker, 'w').close()
+    subprocess.Popen(['sleep', '60'])
+    time.sleep(60)
+if name.startswith('updated'):
+    print('{} seems to have been updated (port version: 1.0, new version: 2.0)'.format(name))
+if name == 'broken':
+    print('Error: cannot check for updates of broken', file=sys.stderr)
+"""
+
+
+def patch_port_command(test_case):
+    test_case.directory = tempfile.TemporaryDirectory()
+    test_case.addCleanup(test_case.directory.cleanup)
+    port_command = os.path.join(test_case.directory.name, 'port')
+    with open(port_command, 'w') as file:
+        file.write('#!{}\n{}'.format(sys.executable, PORT_STUB))
+    os.chmod(port_command, 0o755)
+
+    patcher = mock.patch.multiple(config, PORT_COMMAND=port_command, LIVECHECK_BATCH_SIZE=2)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+
+
+class TestConcurrentLivecheck(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        patch_port_command(self)
+
+        Port.add_or_update([{
+            "name": name,
+            "portdir": "categoryA/{}".format(name),
+            "version": "1.0",
+        } for name in ['updated-1', 'updated-2', 'current', 'broken', 'slow', 'flaky']])
+
+    def get_livecheck(self, name):
+        return LiveCheck.objects.get(port__name=name)
+
+    def test_livecheck_all(self):
+        LiveCheck.objects.create(port=Port.objects.get(name='current'), has_updates=True, result='outdated')
+
+        start = time.perf_counter()
+        count = run_livecheck.run_livecheck_all(workers=4, timeout=2, retries=1)
+
+        # the slow livechecks are killed while the others go on
+        self.assertLess(time.perf_counter() - start, 20)
+        self.assertEquals(count, 6)
+        self.assertEquals(LiveCheck.objects.filter(has_updates=True).count(), 2)
+        self.assertEquals(
+            self.get_livecheck('updated-1').result,
+            'updated-1 seems to have been updated (port version: 1.0, new version: 2.0)\n'
+        )
+        self.assertFalse(self.get_livecheck('current').has_updates)
+        self.assertIsNone(self.get_livecheck('current').result)
+        self.assertEquals(self.get_livecheck('broken').error, 'Error: cannot check for updates of broken\n')
+        self.assertEquals(self.get_livecheck('slow').error, 'Error: livecheck timed out after 2 seconds\n')
+        self.assertIsNone(self.get_livecheck('flaky').error)
+
+    def test_missing_port_command(self):
+        with mock.patch.object(config, 'PORT_COMMAND', os.path.join(self.directory.name, 'missing')):
+            count = run_livecheck.run_livecheck_all(workers=2)
+
+        self.assertEquals(count, 0)
+        self.assertEquals(LiveCheck.objects.count(), 0)
+
+    def test_unexpected_error(self):
+        def run_livecheck_port(name, timeout, retries):
+            if name == 'broken':
+                raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+            return {'result': None, 'error': None, 'has_updates': False}
+
+        with mock.patch.object(run_livecheck, 'run_livecheck_port', side_effect=run_livecheck_port):
+            count = run_livecheck.run_livecheck_all(workers=2)
+
+        # the other ports are still written
+        self.assertEquals(count, 6)
+        self.assertTrue(self.get_livecheck('broken').error.startswith('Error: livecheck failed: '))
+        self.assertIsNone(self.get_livecheck('current').error)
+
+
+class TestLivecheckSchedule(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        patch_port_command(self)
+        names = ['never', 'bumped', 'popular', 'plain', 'outdated', 'failing', 'inactive']
+        Port.add_or_update([{
+            "name": name,
+            "portdir": "categoryA/{}".format(name),
+            "version": "1.0",
+        } for name in names])
+        Port.objects.filter(name='inactive').update(active=False)
+
+        # the versions were set long before the livechecks
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        Port.objects.update(version_updated_at=now - datetime.timedelta(days=60))
+        self.checked(now, 'bumped', days=1)
+        Port.objects.filter(name='bumped').update(version_updated_at=now)
+        self.checked(now, 'popular', days=3)
+        self.checked(now, 'plain', days=3)
+        self.checked(now, 'outdated', days=10, has_updates=True)
+        self.checked(now, 'failing', days=20, error='Error: no livecheck')
+
+        for i in range(3):
+            submission_id = Submission.populate({'id': 'user-{}'.format(i), 'os': {'osx_version': '10.14'}}, now)
+            PortInstallation.populate([{'name': 'popular', 'version': '1.0'}], submission_id)
+
+    def checked(self, now, name, days, **fields):
+        port = Port.objects.get(name=name)
+        LiveCheck.objects.create(port=port, **fields)
+        LiveCheck.objects.filter(port=port).update(updated_at=now - datetime.timedelta(days=days))
+
+    def test_scheduled_ports(self):
+        # popular ports are due sooner, outdated and failing ports later
+        self.assertEquals(
+            [port.name for port in get_scheduled_ports(10)],
+            ['never', 'bumped', 'popular', 'failing', 'plain', 'outdated']
+        )
+        self.assertEquals([port.name for port in get_scheduled_ports(2)], ['never', 'bumped'])
+
+    def test_run_livecheck_budget(self):
+        before = dict(LiveCheck.objects.values_list('port__name', 'updated_at'))
+        call_command('run-livecheck', budget=3, workers=1, stdout=io.StringIO())
+
+        checked = [name for name, updated_at in LiveCheck.objects.values_list('port__name', 'updated_at')
+                   if before.get(name) != updated_at]
+        self.assertEquals(sorted(checked), ['bumped', 'never', 'popular'])
+
+        # the scheduled ports are now the least due
+        self.assertEquals([port.name for port in get_scheduled_ports(3)], ['failing', 'plain', 'outdated'])
+
+    def test_window(self):
+        count = run_livecheck.run_livecheck_ports(get_scheduled_ports(10), workers=1, window=0)
+
+        self.assertEquals(count, 0)
@@ -0,0 +1,131 @@
+import datetime
+import io
+import os
+import sys
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from parsing_scripts import get_notes, populate_variant_descriptions
+from port.models import Port, PortIndexUpdateReport
+from variant.models import Variant
+import config
+
+
+# Stand-in for the port command, run as: port -p notes|variants <name> <name> ...
+# every invocation is logged next to the script, a port named old-* stops it as an unknown port
+PORT_STUB = """
+import os
+import sys
+
+assert sys.argv[1] == '-p'
+command, names = sys.argv[2], sys.argv[3:]
+with open(os.path.join(os.path.dirname(sys.argv[0]), 'invocations'), 'a') as log:
+    log.write(' '.join(sys.argv[2:]) + '\\n')
+
+for name in names:
+    if name.startswith('old-'):
+        sys.exit('Error: Port {} not found'.format(name))
+    if command == 'notes':
+        if name == 'port-1':
+            print('{} has no notes.'.format(name))
+        else:
+            print('{} has the following notes:'.format(name))
+            print('  Notes of {}'.format(name))
+            print('  port-1 has nothing to do with it')
+    else:
+        print('{} has the variants:'.format(name))
+        print('[+]universal: Build for multiple architectures')
+        print('   debug: Enable debugging of {}'.format(name))
+        print('     * requires universal')
+"""
+
+
+class TestBatchedPortCommand(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        port_command = os.path.join(self.directory.name, 'port')
+        with open(port_command, 'w') as file:
+            file.write('#!{}\n{}'.format(sys.executable, PORT_STUB))
+        os.chmod(port_command, 0o755)
+
+        patcher = mock.patch.multiple(config, PORT_COMMAND=port_command, PORT_COMMAND_BATCH_SIZE=2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        Port.add_or_update([{
+            "name": "port-{}".format(i),
+            "portdir": "categoryA/port-{}".format(i),
+            "version": "1.0",
+            "vinfo": [{"variant": "universal"}, {"variant": "debug"}],
+        } for i in range(5)])
+
+    def get_invocations(self):
+        with open(os.path.join(self.directory.name, 'invocations')) as log:
+            return log.read().splitlines()
+
+    def test_notes(self):
+        count = get_notes.get_notes_all_ports()
+
+        self.assertEquals(count, 5)
+        self.assertEquals(self.get_invocations(), ['notes port-0 port-1', 'notes port-2 port-3', 'notes port-4'])
+        self.assertEquals(
+            Port.objects.get(name='port-0').notes,
+            'port-0 has the following notes:\n<br>  Notes of port-0\n<br>  port-1 has nothing to do with it\n'
+        )
+        self.assertEquals(Port.objects.get(name='port-1').notes, 'port-1 has no notes.\n')
+
+        # unchanged notes are not written again
+        self.assertEquals(get_notes.get_notes_all_ports(), 0)
+
+    def test_variant_descriptions(self):
+        count = populate_variant_descriptions.populate_variant_descriptions_all_ports()
+
+        self.assertEquals(count, 10)
+        self.assertEquals(len(self.get_invocations()), 3)
+        variants = Variant.objects.filter(port__name='port-3')
+        self.assertEquals(variants.get(variant='universal').description, '[default] Build for multiple architectures')
+        self.assertEquals(variants.get(variant='debug').description, 'Enable debugging of port-3')
+        self.assertEquals(populate_variant_descriptions.populate_variant_descriptions_all_ports(), 0)
+
+    def test_ports_of_last_update(self):
+        # port-2 is the only port updated by the last run
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        Port.objects.update(updated_at=now - datetime.timedelta(days=1))
+        Port.objects.filter(name='port-2').update(updated_at=now)
+        PortIndexUpdateReport.objects.create(type='update', duration=60, started_at=now - datetime.timedelta(seconds=60))
+
+        call_command('get-notes', stdout=io.StringIO())
+        call_command('populate-variant-descriptions', stdout=io.StringIO())
+
+        self.assertEquals(self.get_invocations(), ['notes port-2', 'variants port-2'])
+        self.assertIsNotNone(Port.objects.get(name='port-2').notes)
+        self.assertEquals(Variant.objects.exclude(description=None).count(), 2)
+
+    def test_unknown_port(self):
+        # the port command stops at old-port, the ports after it in the batch are run one at a time
+        Port.objects.create(name='old-port', portdir='categoryA/old-port', version='1.0')
+        Port.objects.create(name='deleted-port', portdir='categoryA/deleted-port', version='1.0', active=False)
+
+        count = get_notes.get_notes_ports(Port.objects.order_by('name'), batch_size=10)
+
+        self.assertEquals(count, 5)
+        self.assertEquals(self.get_invocations(), [
+            'notes old-port port-0 port-1 port-2 port-3 port-4',
+            'notes old-port', 'notes port-0', 'notes port-1', 'notes port-2', 'notes port-3', 'notes port-4',
+        ])
+        self.assertEquals(Port.objects.exclude(notes=None).count(), 5)
+        self.assertIsNone(Port.objects.get(name='old-port').notes)
+
+    def test_list_of_ports(self):
+        Port.objects.filter(name='port-1').update(active=False)
+
+        count = get_notes.get_notes_ports(list(Port.objects.filter(name__in=['port-0', 'port-1'])))
+
+        self.assertEquals(count, 1)
+        self.assertEquals(self.get_invocations(), ['notes port-0'])
@@ -0,0 +1,35 @@
+import io
+import json
+
+from django.test import SimpleTestCase
+
+from parsing_scripts.portindex_json import PortIndexReader
+import config
+
+
+class TestPortIndexReader(SimpleTestCase):
+    def setUp(self):
+        with open(config.TEST_PORTINDEX_JSON, 'r') as file:
+            self.data = json.load(file)
+
+    def test_ports_from_file(self):
+        self.assertEquals(list(PortIndexReader(config.TEST_PORTINDEX_JSON)), self.data['ports'])
+
+    def test_small_chunks(self):
+        # chunks smaller than a single port make every value span multiple reads
+        stream = io.StringIO(json.dumps({'ports': self.data['ports'], 'info': {'commit': 'abc', 'count': 1234}}))
+        reader = PortIndexReader(stream, chunk_size=7)
+
+        self.assertEquals(list(reader), self.data['ports'])
+        self.assertEquals(reader.info, {'commit': 'abc', 'count': 1234})
+
+    def test_info_before_ports(self):
+        stream = io.StringIO(json.dumps({'info': {'commit': 'abc'}, 'ports': []}))
+
+        self.assertEquals(PortIndexReader(stream, chunk_size=3).read_info(), {'commit': 'abc'})
+
+    def test_truncated_document(self):
+        stream = io.StringIO(json.dumps(self.data)[:-100])
+
+        with self.assertRaises(json.decoder.JSONDecodeError):
+            list(PortIndexReader(stream, chunk_size=64))
@@ -4,7 +4,7 @@ from django.db.models import Subquery, OuterRef, Q
 from django.db.models.functions import Lower
 
 from port.models import Port
-from buildhistory.models import BuildHistory, Builder
+from buildhistory.models import Builder, LatestBuild
 from utilities import paginate
 
 
@@ -35,7 +35,8 @@ def get_followed_ports_context(request):
 
 
 def get_ports_context(request, req_ports, builder):
-    builds = BuildHistory.objects.filter(port_name=OuterRef('name'), builder_name__name=builder).order_by('time_start')
+    # status of the latest build of each port on the builder, one lookup of the unique (port_name, builder) index per port
+    builds = LatestBuild.objects.filter(port_name=OuterRef('name'), builder__name=builder)
     req_ports = req_ports.order_by(Lower('name')).select_related('livecheck').annotate(build=Subquery(builds.values_list('status')[:1]))
     req_ports = apply_filters(request, req_ports)
 